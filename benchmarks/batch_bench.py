@@ -0,0 +1,113 @@
+"""
+Measure what batching writes in Transport saves over one round of a game.
+
+Every peer plays through the broadcasts of a round, one FSM step at a time,
+the way Client sends them: UpdateMaster and ReadyToStart together, then
+AckStart, FrameSync, an Action, SatDown and finally Vote. This is run with
+batching off and with each of BATCH_WINDOWS, and reports the writes (send
+syscalls) per peer, the bytes written, an estimate of the bytes on the wire
+with a TCP/IP header per write, and how late packets arrive.
+
+Run from the repository root with:
+    python -m benchmarks.batch_bench [peers]
+"""
+import contextlib
+import io
+import logging
+import statistics
+import sys
+import time
+
+from benchmarks.transport_bench import listen, wait_until
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.thread_manager import ThreadManager
+from game.transport.packet import (AckStart, Action, FrameSync, ReadyToStart,
+                                   SatDown, UpdateMaster, Vote)
+from game.transport.transport import Transport
+
+PEERS = 4
+BASE_PORT = 32000
+ROUNDS = 10
+# batch windows to compare, in seconds
+BATCH_WINDOWS = [0, 0.0005, 0.002]
+# time between FSM steps, a frame at the game's frame rate
+STEP = 0.02
+# IPv4 and TCP headers without options
+HEADER_BYTES = 40
+SCENARIO = {"seed": 1, "default": {"latency": 0.001}}
+
+
+def round_steps(me: Player, round_number: int) -> list:
+    """The broadcasts of one round, grouped by the FSM step that sends them."""
+    return [
+        [UpdateMaster(me.get_name(), me), ReadyToStart(me)],
+        [AckStart(me)],
+        [FrameSync(round_number, me)],
+        [Action("Q", me)],
+        [SatDown("Q", me, round_number), FrameSync(round_number + 1, me)],
+        [Vote("nobody", me)],
+    ]
+
+
+def run(num_peers, batch_window, base_port):
+    logger = logging.getLogger("batch_bench")
+    names = [f"peer-{i}" for i in range(num_peers)]
+    tracker_list = {name: ("127.0.0.1", base_port + i)
+                    for i, name in enumerate(names)}
+    transports = [Transport(name, base_port + i, ThreadManager(), logger,
+                            Tracker(dict(tracker_list)),
+                            host_socket=listen(base_port + i),
+                            scenario=SCENARIO, batch_window=batch_window)
+                  for i, name in enumerate(names)]
+    if not wait_until(lambda: all(t.ready.is_set() for t in transports), 30):
+        raise RuntimeError("peers did not connect")
+
+    expected = 0
+    for round_number in range(ROUNDS):
+        steps = [round_steps(Player(t.myself), round_number) for t in transports]
+        for i in range(len(steps[0])):
+            for transport, transport_steps in zip(transports, steps):
+                for packet in transport_steps[i]:
+                    transport.sendall(packet, use_sync=False)
+                    expected += num_peers - 1
+            time.sleep(STEP)
+
+    latencies = []
+
+    def drain():
+        for transport in transports:
+            latencies.extend(packet.get_received_at() - packet.get_created_at()
+                             for packet in transport.receive_many())
+        return len(latencies) >= expected
+
+    wait_until(drain, 10)
+    stats = [session.stats() for t in transports
+             for session in list(t._sessions.values())]
+    for transport in transports:
+        transport.shutdown()
+    return stats, latencies
+
+
+def bench(num_peers=PEERS):
+    print(f"{num_peers} peers, {ROUNDS} rounds")
+    print(f"{'window us':>10}{'writes/round':>14}{'frames/write':>14}"
+          f"{'bytes/round':>13}{'wire/round':>12}{'p50 ms':>8}{'max ms':>8}")
+    base_port = BASE_PORT
+    for batch_window in BATCH_WINDOWS:
+        # the transports print their progress, which is just noise here
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats, latencies = run(num_peers, batch_window, base_port)
+        base_port += num_peers
+        writes = sum(s["writes"] for s in stats)
+        frames = sum(s["frames"] for s in stats)
+        size = sum(s["bytes"] for s in stats)
+        latencies = sorted(latency * 1000 for latency in latencies)
+        print(f"{batch_window * 1e6:>10.0f}{writes / ROUNDS / num_peers:>14.1f}"
+              f"{frames / writes:>14.2f}{size / ROUNDS / num_peers:>13.0f}"
+              f"{(size + writes * HEADER_BYTES) / ROUNDS / num_peers:>12.0f}"
+              f"{statistics.median(latencies):>8.2f}{latencies[-1]:>8.2f}")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else PEERS)
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of encode/decode throughput per packet type for every codec.
+
+Run from the repository root with:
+    python -m benchmarks.codec_bench
+"""
+import time
+import timeit
+
+from game.models.player import Player
+from game.transport.codec import CODECS, PlayerTable
+from game.transport.packet import (Ack, AcquireMaster, Action, ConnectionRequest, FrameSync, Nak,
+                                   SatDown, SyncAck, SyncReq, UpdateMaster, Vote)
+
+PLAYERS = ["tough-hyena", "vital-boar", "brave-otter", "quiet-lynx"]
+NUMBER = 20000
+
+
+def sample_packets():
+    me = Player(PLAYERS[0])
+    packets = [
+        Action("Q", me),
+        Ack(me),
+        Nak(me),
+        SatDown("W", me, 3),
+        FrameSync(1234, me),
+        SyncReq(3, me),
+        SyncAck({"sent": 1700000000.25, "received": 1700000000.29}, me, 3),
+        AcquireMaster(me, 3, 0.042),
+        UpdateMaster(PLAYERS[1], me, 3, 0.042),
+        Vote(PLAYERS[2], me),
+        ConnectionRequest(me, list(CODECS.keys())),
+    ]
+    # as the transport would
+    for packet in packets:
+        packet.createdAt = time.time()
+    return packets
+
+
+def bench(number=NUMBER):
+    players = PlayerTable(PLAYERS)
+    codecs = [codec_cls(players) for codec_cls in CODECS.values()]
+
+    header = f"{'packet type':<18}" + "".join(
+        f"{codec.name + ' enc/s':>14}{codec.name + ' dec/s':>14}{codec.name + ' B':>10}" for codec in codecs)
+    print(header)
+    print("-" * len(header))
+    for packet in sample_packets():
+        row = f"{packet.get_packet_type():<18}"
+        for codec in codecs:
+            data = codec.encode(packet, 1)
+            enc = timeit.timeit(lambda: codec.encode(packet, 1), number=number)
+            dec = timeit.timeit(lambda: codec.decode(data), number=number)
+            row += f"{number / enc:>14,.0f}{number / dec:>14,.0f}{len(data):>10}"
+        print(row)
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,114 @@
+"""
+Measure how long the frame master takes to fail over when it goes away.
+
+Idle bots, as in frame_sync_bench, tick frames over loopback in simulated
+time until KILL_AT, when the master leaves without a word. This reports
+how long it took for a player to notice, from the master's lease running
+out, how long the election then took until every remaining player agreed
+on the same new master, also in round trips of the slowest link, the term
+they agreed on, whether any two players ever took over in the same term
+and whether an UpdateMaster from the old term, arriving late, is ignored.
+
+Run from the repository root with:
+    python -m benchmarks.election_bench [player counts...]
+"""
+import contextlib
+import io
+import logging
+import random
+import sys
+
+from benchmarks.frame_sync_bench import PROFILES, IdleBot
+from game.clock.timebase import SimulatedClock
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.simulation import SimulatedGame
+from game.transport.loopback import LoopbackNetwork, LoopbackTransport
+from game.transport.packet import UpdateMaster
+
+PLAYER_COUNTS = [4, 8, 16]
+KILL_AT = 60
+TIMEOUT = 60
+# how often to check whether the players agree, in seconds
+SAMPLE = 0.005
+
+
+def run(num_players, profile):
+    logger = logging.getLogger("election_bench")
+    names = [f"p{i}" for i in range(num_players)]
+    tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(names)}
+    network = LoopbackNetwork(logger, SimulatedClock())
+    rng = random.Random(1)
+    scenario = {"seed": 1, "default": PROFILES[profile]}
+    clients = [IdleBot(name, Tracker(dict(tracker_list)), logger,
+                       transport=LoopbackTransport(name, network, logger,
+                                                   Tracker(dict(tracker_list)),
+                                                   scenario=scenario),
+                       rng=random.Random(rng.random()))
+               for name in names]
+    host = clients[0]._myself
+    clients[0]._frameSync.update_master(host, host)
+    game = SimulatedGame(clients, network)
+    game.run(KILL_AT)
+
+    dead = clients[0]
+    old_term = dead._frameSync.term
+    dead.game_over = True
+    dead._transportLayer.shutdown()
+    alive = clients[1:]
+    killed_at = network.clock.time()
+    result = {"detected": None, "agreed": None, "split": False}
+
+    def sample():
+        now = network.clock.time()
+        if result["detected"] is None and any(c._frameSync.elections for c in alive):
+            result["detected"] = now
+        # two of us master in the same term
+        masters = {}
+        for client in alive:
+            if client._frameSync.is_master_myself():
+                term = client._frameSync.term
+                result["split"] |= masters.setdefault(term, client) is not client
+        agreed = {(c._frameSync.get_master().get_name(), c._frameSync.term) for c in alive}
+        if len(agreed) == 1 and agreed.pop()[0] != dead._myself.get_name():
+            result["agreed"] = now
+            return
+        network.clock.call_later(SAMPLE, sample)
+
+    sample()
+    network.clock.run(until=killed_at + TIMEOUT, stop=lambda: result["agreed"] is not None)
+
+    # a late UpdateMaster from the old master, which everyone must ignore
+    master = alive[0]._frameSync.get_master().get_name()
+    for client in alive:
+        client._handle_packet(UpdateMaster(dead._myself.get_name(), Player(dead._myself.get_name()), old_term))
+    stale_ignored = all(c._frameSync.get_master().get_name() == master for c in alive)
+
+    slowest = max(rtt for c in alive for rtt in c._transportLayer.sync.rtt_row().values())
+    network.shutdown()
+    detected, agreed = result["detected"], result["agreed"]
+    return {"detect": detected - killed_at if detected else None,
+            "elect": agreed - detected if agreed and detected else None,
+            "rtts": (agreed - detected) / slowest if agreed and detected else None,
+            "term": alive[0]._frameSync.term, "split": result["split"],
+            "stale": stale_ignored}
+
+
+def bench(player_counts=PLAYER_COUNTS):
+    print("master killed after {}s, times in seconds".format(KILL_AT))
+    print(f"{'players':>8}{'profile':>9}{'detect':>8}{'elect ms':>10}{'rtts':>7}"
+          f"{'term':>6}{'split':>7}{'stale ignored':>15}")
+    for num_players in player_counts:
+        for profile in PROFILES:
+            # the clients print their progress, which is just noise here
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run(num_players, profile)
+            detect = f"{result['detect']:.2f}" if result["detect"] is not None else "never"
+            elect = f"{result['elect'] * 1000:.0f}" if result["elect"] is not None else "never"
+            rtts = f"{result['rtts']:.1f}" if result["rtts"] is not None else "-"
+            print(f"{num_players:>8}{profile:>9}{detect:>8}{elect:>10}{rtts:>7}"
+                  f"{result['term']:>6}{str(result['split']):>7}{str(result['stale']):>15}")
+
+
+if __name__ == "__main__":
+    bench([int(n) for n in sys.argv[1:]] or PLAYER_COUNTS)
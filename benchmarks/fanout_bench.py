@@ -0,0 +1,93 @@
+"""
+Compare broadcasting to every peer with broadcasting down a relay tree, for
+16-64 players over loopback in simulated time.
+
+One player broadcasts BROADCASTS packets, as the frame sync master does.
+For each fanout this reports how many packets and bytes the sender had to
+send per broadcast, the most any one player had to send, and how long the
+broadcasts took to reach everyone. Fanout 0 is the full mesh.
+
+Each player's delays are filled in as if the sync phase had measured them,
+so relays are picked by latency.
+
+Run from the repository root with:
+    python -m benchmarks.fanout_bench [player counts...]
+"""
+import contextlib
+import io
+import logging
+import statistics
+import sys
+
+from game.clock.timebase import SimulatedClock
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.transport.loopback import LoopbackNetwork, LoopbackTransport
+from game.transport.packet import FrameSync
+
+PLAYER_COUNTS = [16, 32, 64]
+FANOUTS = [0, 2, 4, 8]
+BROADCASTS = 20
+# every link gets its own latency, so the nearest players differ
+SCENARIO = {"seed": 1, "default": {"latency": 0.02, "jitter": 0.005}}
+
+
+def run(num_players, relay_fanout):
+    logger = logging.getLogger("fanout_bench")
+    names = [f"p{i}" for i in range(num_players)]
+    tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(names)}
+    network = LoopbackNetwork(logger, SimulatedClock())
+    transports = [LoopbackTransport(name, network, logger,
+                                    Tracker(dict(tracker_list)),
+                                    scenario=SCENARIO, relay_fanout=relay_fanout)
+                  for name in names]
+    network.clock.run(stop=lambda: all(t.all_connected() for t in transports))
+    for transport in transports:
+        for player_id in names:
+            if player_id != transport.myself:
+                transport.sync.set_delay(player_id, transport.netem.get_delay(player_id))
+
+    # count what the broadcasts send, not the handshakes
+    def sent():
+        return [(sum(link["sent"] for link in t.netem.stats().values()),
+                 sum(link["bytes"] for link in t.netem.stats().values()))
+                for t in transports]
+
+    before = sent()
+    sender = transports[0]
+    start = network.clock.time()
+    for frame in range(BROADCASTS):
+        sender.sendall(FrameSync(frame, Player(sender.myself)), use_sync=False)
+    network.clock.run()
+
+    arrivals = []
+    for transport in transports[1:]:
+        packets = transport.receive_many()
+        if len(packets) != BROADCASTS:
+            raise RuntimeError(f"{transport.myself} got {len(packets)} broadcasts")
+        arrivals.extend(packet.get_received_at() - start for packet in packets)
+    after = sent()
+    network.shutdown()
+    sender_sent = (after[0][0] - before[0][0]) / BROADCASTS
+    sender_bytes = (after[0][1] - before[0][1]) / BROADCASTS
+    max_sent = max(a[0] - b[0] for a, b in zip(after, before)) / BROADCASTS
+    return sender_sent, sender_bytes, max_sent, statistics.median(arrivals), max(arrivals)
+
+
+def bench(player_counts=PLAYER_COUNTS):
+    print(f"{BROADCASTS} broadcasts from one player, per broadcast:")
+    print(f"{'players':>8}{'fanout':>8}{'sender sent':>13}{'sender bytes':>14}"
+          f"{'max sent':>10}{'p50 ms':>9}{'max ms':>9}")
+    for num_players in player_counts:
+        for relay_fanout in FANOUTS:
+            # the transports print their progress, which is just noise here
+            with contextlib.redirect_stdout(io.StringIO()):
+                sender_sent, sender_bytes, max_sent, median, slowest = run(
+                    num_players, relay_fanout)
+            print(f"{num_players:>8}{relay_fanout:>8}{sender_sent:>13.0f}"
+                  f"{sender_bytes:>14.0f}{max_sent:>10.0f}"
+                  f"{median * 1000:>9.1f}{slowest * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    bench([int(n) for n in sys.argv[1:]] or PLAYER_COUNTS)
@@ -0,0 +1,119 @@
+"""
+Measure how fast the frame sync controller brings every player's frames in
+line, under a few emulated latency profiles.
+
+Bots play over loopback in simulated time, but never press a key, so the
+game idles in the first round while frames tick. Every player starts up to
+START_SPREAD frames apart with its clock skewed and drifting. The spread,
+the gap between the players furthest ahead and furthest behind in frames,
+is sampled every frame. This reports the spread at the start, how long it
+took to stay below CONVERGED_SPREAD for good, the median and largest spread
+after that, the mean time each player took to converge on the median (Clock
+stats), how many times mastership changed hands and how many FrameSyncs
+the whole cluster broadcast a minute over the second half of the run, by
+when players have settled on their rates. A master reporting
+every 2 frames, at the default 2 frames a second, broadcasts 60.
+
+Run from the repository root with:
+    python -m benchmarks.frame_sync_bench [player counts...]
+"""
+import contextlib
+import io
+import logging
+import random
+import statistics
+import sys
+
+from game.clock.timebase import SimulatedClock
+from game.lobby.tracker import Tracker
+from game.simulation import BotClient, SimulatedGame
+from game.transport.loopback import LoopbackNetwork, LoopbackTransport
+
+PLAYER_COUNTS = [4, 8, 16]
+PROFILES = {
+    "lan": {"latency": 0.002, "jitter": 0.001},
+    "wan": {"latency": 0.04, "jitter": 0.01, "distribution": "normal"},
+    "jittery": {"latency": 0.08, "jitter": 0.06, "distribution": "pareto"},
+}
+START_SPREAD = 6
+SKEW = 0.2
+DRIFT = 200e-6
+DURATION = 300
+CONVERGED_SPREAD = 1
+
+
+class IdleBot(BotClient):
+    """A bot that never picks a seat, so the round never ends."""
+
+    def _add_hotkeys(self):
+        pass
+
+
+def run(num_players, profile):
+    logger = logging.getLogger("frame_sync_bench")
+    names = [f"p{i}" for i in range(num_players)]
+    tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(names)}
+    network = LoopbackNetwork(logger, SimulatedClock())
+    rng = random.Random(1)
+    scenario = {"seed": 1, "default": PROFILES[profile], "clocks": {
+        name: {"offset": rng.uniform(-SKEW, SKEW), "drift": rng.uniform(-DRIFT, DRIFT)}
+        for name in names}}
+    clients = [IdleBot(name, Tracker(dict(tracker_list)), logger,
+                       transport=LoopbackTransport(name, network, logger,
+                                                   Tracker(dict(tracker_list)),
+                                                   scenario=scenario),
+                       rng=random.Random(rng.random()))
+               for name in names]
+    host = clients[0]._myself
+    clients[0]._frameSync.update_master(host, host)
+    for client in clients:
+        client.frame_count = rng.randrange(START_SPREAD + 1)
+        client._next_frame = client.clock.time() + rng.uniform(0, client.loop_interval)
+
+    spreads = []
+
+    def sample():
+        positions = [client.frame_position() for client in clients]
+        sent = sum(client._frameSync.frame_syncs_sent for client in clients)
+        spreads.append((network.clock.time(), max(positions) - min(positions), sent))
+        network.clock.call_later(clients[0].loop_interval, sample)
+
+    sample()
+    SimulatedGame(clients, network).run(DURATION)
+
+    start = spreads[0][0]
+    converged_at = start
+    for at, spread, _ in spreads:
+        if spread >= CONVERGED_SPREAD:
+            converged_at = at
+    after = [spread for at, spread, _ in spreads if at > converged_at] or [spreads[-1][1]]
+    middle, _, sent_by_middle = spreads[len(spreads) // 2]
+    end, _, sent_by_end = spreads[-1]
+    stats = [client._frameSync.stats() for client in clients]
+    player_times = [s["time_to_converge"] for s in stats if s["time_to_converge"] is not None]
+    network.shutdown()
+    return {"start": spreads[0][1],
+            "converged": converged_at - start if converged_at < spreads[-1][0] else None,
+            "p50": statistics.median(after), "max": max(after),
+            "player": statistics.mean(player_times) if player_times else None,
+            "handoffs": max(s["handoffs"] for s in stats),
+            "syncs": (sent_by_end - sent_by_middle) * 60 / (end - middle)}
+
+
+def bench(player_counts=PLAYER_COUNTS):
+    print(f"{DURATION}s per run, spreads in frames, times in seconds")
+    print(f"{'players':>8}{'profile':>9}{'start':>7}{'converged':>11}"
+          f"{'p50 after':>11}{'max after':>11}{'per player':>12}{'handoffs':>10}{'syncs/min':>11}")
+    for num_players in player_counts:
+        for profile in PROFILES:
+            # the clients print their progress, which is just noise here
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run(num_players, profile)
+            converged = f"{result['converged']:.1f}" if result["converged"] is not None else "never"
+            player = f"{result['player']:.1f}" if result["player"] is not None else "-"
+            print(f"{num_players:>8}{profile:>9}{result['start']:>7.2f}{converged:>11}"
+                  f"{result['p50']:>11.2f}{result['max']:>11.2f}{player:>12}{result['handoffs']:>10}{result['syncs']:>11.1f}")
+
+
+if __name__ == "__main__":
+    bench([int(n) for n in sys.argv[1:]] or PLAYER_COUNTS)
@@ -0,0 +1,105 @@
+"""
+Compare the TCP Transport with UdpTransport over an emulated lossy link.
+
+One peer sends the other a game-like stream for DURATION seconds: FrameSync
+20 times a second, an Action 4 times a second and a Vote every second. For
+every loss rate this reports, per packet type, how many packets arrived and
+their one way latency. Over TCP a lost packet holds up everything behind it
+until it is retransmitted; over UDP only the packets that have to wait for
+it do, and FrameSync is never retransmitted at all.
+
+Run from the repository root with:
+    python -m benchmarks.loss_bench [loss rates...]
+"""
+import contextlib
+import io
+import logging
+import statistics
+import sys
+import time
+
+from benchmarks.transport_bench import listen, wait_until
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.thread_manager import ThreadManager
+from game.transport.packet import Action, FrameSync, Vote
+from game.transport.transport import Transport
+from game.transport.udp_transport import UdpTransport
+
+BACKENDS = {"tcp": Transport, "udp": UdpTransport}
+BASE_PORT = 31000
+LOSS_RATES = [0, 0.01, 0.05]
+DURATION = 5
+LATENCY = 0.03
+JITTER = 0.005
+TICK = 0.05
+
+
+def run(transport_cls, loss, base_port):
+    logger = logging.getLogger("loss_bench")
+    names = ["sender", "receiver"]
+    tracker_list = {name: ("127.0.0.1", base_port + i)
+                    for i, name in enumerate(names)}
+    scenario = {"seed": 1, "default": {"latency": LATENCY, "jitter": JITTER,
+                                       "distribution": "normal", "loss": loss}}
+    sender, receiver = [
+        transport_cls(name, base_port + i, ThreadManager(), logger,
+                      Tracker(dict(tracker_list)),
+                      host_socket=listen(base_port + i), scenario=scenario)
+        for i, name in enumerate(names)]
+    if not wait_until(lambda: sender.all_connected() and receiver.all_connected(), 30):
+        raise RuntimeError(f"{transport_cls.__name__} peers did not connect")
+
+    me = Player("sender")
+    sent = {"frame_sync": 0, "action": 0, "vote": 0}
+    start = time.time()
+    tick = 0
+    while time.time() - start < DURATION:
+        sender.send(FrameSync(tick, me), "receiver")
+        sent["frame_sync"] += 1
+        if tick % 5 == 0:
+            sender.send(Action(str(tick), me), "receiver")
+            sent["action"] += 1
+        if tick % 20 == 0:
+            sender.send(Vote("nobody", me), "receiver")
+            sent["vote"] += 1
+        tick += 1
+        time.sleep(max(0, start + tick * TICK - time.time()))
+
+    latencies = {packet_type: [] for packet_type in sent}
+
+    def drain():
+        for packet in receiver.receive_many():
+            latencies[packet.get_packet_type()].append(
+                packet.get_received_at() - packet.get_created_at())
+        # frame syncs that were lost or overtaken are never coming
+        return all(len(latencies[t]) >= sent[t] for t in ("action", "vote"))
+
+    wait_until(drain, 10)
+    for transport in (sender, receiver):
+        transport.shutdown()
+    return sent, latencies
+
+
+def bench(loss_rates=LOSS_RATES):
+    print(f"{DURATION}s stream, {LATENCY * 1000:.0f}ms latency, "
+          f"{JITTER * 1000:.0f}ms jitter")
+    print(f"{'backend':<8}{'loss':>6}  {'type':<11}{'arrived':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    base_port = BASE_PORT
+    for loss in loss_rates:
+        for name, transport_cls in BACKENDS.items():
+            # the transports print their progress, which is just noise here
+            with contextlib.redirect_stdout(io.StringIO()):
+                sent, latencies = run(transport_cls, loss, base_port)
+            base_port += 2
+            for packet_type, values in latencies.items():
+                values = sorted(v * 1000 for v in values) or [float("nan")]
+                p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+                print(f"{name:<8}{loss:>6.2f}  {packet_type:<11}"
+                      f"{len(latencies[packet_type]):>4}/{sent[packet_type]:<4}"
+                      f"{statistics.median(values):>9.1f}{p95:>9.1f}{values[-1]:>9.1f}")
+
+
+if __name__ == "__main__":
+    bench([float(loss) for loss in sys.argv[1:]] or LOSS_RATES)
@@ -0,0 +1,47 @@
+"""
+Play many bot games in one process over the loopback transport, in
+simulated time, and report how many finish and how long they take.
+
+Run from the repository root with:
+    python -m benchmarks.simulate [players] [games] [scenario file]
+"""
+import contextlib
+import io
+import statistics
+import sys
+import time
+
+from game.clock.netem import load_scenario
+from game.simulation import run_game
+
+PLAYERS = 4
+GAMES = 100
+# give up on a game that has not finished after this many simulated seconds
+GAME_TIMEOUT = 600
+
+
+def bench(num_players=PLAYERS, num_games=GAMES, scenario=None):
+    start = time.time()
+    # the clients print their progress, which is just noise here
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [run_game(num_players, scenario=scenario, seed=seed,
+                            timeout=GAME_TIMEOUT)
+                   for seed in range(num_games)]
+    elapsed = time.time() - start
+
+    finished = [r for r in results if r["finished"]]
+    print(f"{num_players} players, {num_games} games in {elapsed:.1f}s "
+          f"({num_games / elapsed * 60:.0f} games per minute)")
+    print(f"finished: {len(finished)}/{num_games}")
+    if finished:
+        durations = [r["elapsed"] for r in finished]
+        print(f"game length s: median {statistics.median(durations):.2f} "
+              f"min {min(durations):.2f} max {max(durations):.2f}")
+        print(f"rounds: {statistics.mean(r['rounds'] for r in finished):.1f} on average")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    bench(int(args[0]) if len(args) > 0 else PLAYERS,
+          int(args[1]) if len(args) > 1 else GAMES,
+          load_scenario(args[2]) if len(args) > 2 else None)
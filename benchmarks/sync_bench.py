@@ -0,0 +1,106 @@
+"""
+Compare the two ways of measuring delays before a game: the leader
+rotation, where one player at a time probes everyone, and probing, where
+every player probes every other at once and they share an rtt matrix.
+
+Bots play over loopback in simulated time up to the end of the sync phase,
+with every player's clock up to SKEW seconds off. For every player count
+this reports how long the sync phase took once everyone was connected, how
+many packets it sent, how far the measured delays and clock offsets are
+from the emulated ones, and for probing how far the rtt matrix is from the
+emulated round trip times, with the min and the median filter. The
+emulated jitter is symmetric, so the min filter comes out low here, on a
+real network queueing only ever adds delay.
+
+Run from the repository root with:
+    python -m benchmarks.sync_bench [player counts...]
+"""
+import contextlib
+import io
+import logging
+import random
+import statistics
+import sys
+
+from game.clock.timebase import SimulatedClock
+from game.lobby.tracker import Tracker
+from game.simulation import BotClient, SimulatedGame
+from game.transport.loopback import LoopbackNetwork, LoopbackTransport
+
+PLAYER_COUNTS = [4, 8, 16, 32]
+MODES = ["leader", "probe"]
+SYNC_STATES = {"PEERING", "RESET_SYNC", "SYNCHRONIZE_CLOCK", "AWAIT_SYNC_END"}
+SCENARIO = {"seed": 1, "default": {"latency": 0.03, "jitter": 0.01, "distribution": "normal"}}
+# clocks are up to this many seconds off and drift up to DRIFT
+SKEW = 0.2
+DRIFT = 50e-6
+TIMEOUT = 600
+
+
+def run(num_players, sync_mode):
+    logger = logging.getLogger("sync_bench")
+    names = [f"p{i}" for i in range(num_players)]
+    tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(names)}
+    network = LoopbackNetwork(logger, SimulatedClock())
+    rng = random.Random(1)
+    scenario = dict(SCENARIO, clocks={
+        name: {"offset": rng.uniform(-SKEW, SKEW), "drift": rng.uniform(-DRIFT, DRIFT)}
+        for name in names})
+    clients = [BotClient(name, Tracker(dict(tracker_list)), logger,
+                         transport=LoopbackTransport(name, network, logger,
+                                                     Tracker(dict(tracker_list)),
+                                                     scenario=scenario),
+                         rng=random.Random(rng.random()), sync_mode=sync_mode)
+               for name in names]
+    game = SimulatedGame(clients, network)
+    for client in clients:
+        game.schedule(client._myself.get_name(), network.clock.time())
+
+    def sent():
+        return sum(link["sent"] for client in clients
+                   for link in client._transportLayer.netem.stats().values())
+
+    network.clock.run(until=TIMEOUT, stop=lambda: all(
+        client.is_peering_completed for client in clients))
+    start, before = network.clock.time(), sent()
+    network.clock.run(until=TIMEOUT, stop=lambda: all(
+        client._state not in SYNC_STATES for client in clients))
+    elapsed, packets = network.clock.time() - start, sent() - before
+
+    errors = {"delay": [], "offset": [], "min": [], "median": []}
+    clocks = {client._myself.get_name(): client.clock for client in clients}
+    for client in clients:
+        transport = client._transportLayer
+        now = client.clock.time()
+        for player_id, delay in transport.sync._delay_dict.items():
+            errors["delay"].append(abs(delay - transport.netem.get_delay(player_id)))
+            offset = transport.sync.get_offset(player_id, now)
+            if offset is not None:
+                errors["offset"].append(
+                    abs(offset - (clocks[player_id].time() - now)))
+        if sync_mode == "probe":
+            for how in ("min", "median"):
+                for player_id, rtt in transport.sync.rtt_row(how).items():
+                    errors[how].append(abs(rtt - 2 * transport.netem.get_delay(player_id)))
+    network.shutdown()
+    return elapsed, packets, errors
+
+
+def bench(player_counts=PLAYER_COUNTS):
+    print(f"clocks up to {SKEW * 1000:.0f}ms off, errors in ms")
+    print(f"{'players':>8}{'mode':>8}{'sync s':>9}{'packets':>9}{'delay err':>11}"
+          f"{'offset err':>12}{'rtt min err':>13}{'rtt median err':>16}")
+    for num_players in player_counts:
+        for sync_mode in MODES:
+            # the clients print their progress, which is just noise here
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, packets, errors = run(num_players, sync_mode)
+            error = {what: f"{statistics.mean(values) * 1000:.2f}" if values else "-"
+                     for what, values in errors.items()}
+            print(f"{num_players:>8}{sync_mode:>8}{elapsed:>9.2f}{packets:>9}"
+                  f"{error['delay']:>11}{error['offset']:>12}"
+                  f"{error['min']:>13}{error['median']:>16}")
+
+
+if __name__ == "__main__":
+    bench([int(n) for n in sys.argv[1:]] or PLAYER_COUNTS)
@@ -0,0 +1,126 @@
+"""
+Compare the threaded Transport, AsyncTransport and UdpTransport for 2-32
+local peers.
+
+For every peer count this measures the time taken to build the full mesh,
+the number of threads the process needs, and the time for every peer to
+broadcast one packet and receive everyone else's. Every run gets a fresh
+process, so threads left over from an earlier run are not counted.
+
+Run from the repository root with:
+    python -m benchmarks.transport_bench [peer counts...]
+"""
+import contextlib
+import io
+import logging
+import multiprocessing
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.thread_manager import ThreadManager
+from game.transport.async_transport import AsyncTransport
+from game.transport.packet import Vote
+from game.transport.transport import Transport
+from game.transport.udp_transport import UdpTransport
+
+BACKENDS = {"thread": Transport, "async": AsyncTransport, "udp": UdpTransport}
+BASE_PORT = 30000
+TIMEOUT = 120
+
+
+def wait_until(condition, timeout=TIMEOUT):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def listen(port):
+    # reuse the address so back to back runs do not trip over TIME_WAIT
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(("0.0.0.0", port))
+    s.listen()
+    return s
+
+
+def run(transport_cls, num_peers, base_port):
+    logger = logging.getLogger("transport_bench")
+    names = [f"peer-{i}" for i in range(num_peers)]
+    tracker_list = {name: ("127.0.0.1", base_port + i)
+                    for i, name in enumerate(names)}
+    threads_before = threading.active_count()
+
+    transports = [None] * num_peers
+
+    def start(i):
+        transports[i] = transport_cls(names[i], base_port + i, ThreadManager(),
+                                      logger, Tracker(dict(tracker_list)),
+                                      host_socket=listen(base_port + i))
+
+    start_time = time.time()
+    starters = [threading.Thread(target=start, args=(i,))
+                for i in range(num_peers)]
+    for t in starters:
+        t.start()
+    for t in starters:
+        t.join()
+    connected = wait_until(lambda: all(t.ready.is_set() for t in transports))
+    mesh_time = time.time() - start_time
+    threads = threading.active_count() - threads_before
+
+    received = [0] * num_peers
+
+    def all_received():
+        for i, transport in enumerate(transports):
+            received[i] += len(transport.receive_many())
+        return all(n >= num_peers - 1 for n in received)
+
+    start_time = time.time()
+    for transport in transports:
+        transport.sendall(Vote("nobody", Player(transport.myself)),
+                          use_sync=False)
+    delivered = wait_until(all_received)
+    broadcast_time = time.time() - start_time
+
+    for transport in transports:
+        try:
+            transport.shutdown()
+        except OSError:
+            pass
+    return connected and delivered, mesh_time, threads, broadcast_time
+
+
+def run_quietly(backend, num_peers, base_port):
+    # the transports print their progress, which is just noise here
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run(BACKENDS[backend], num_peers, base_port)
+
+
+def run_in_process(backend, num_peers, base_port):
+    """run in a process of its own, which exits with every thread it started."""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_quietly, backend, num_peers, base_port).result()
+
+
+def bench(peer_counts):
+    print(f"{'backend':<8}{'peers':>6}{'mesh s':>10}{'threads':>9}{'broadcast s':>13}")
+    base_port = BASE_PORT
+    for num_peers in peer_counts:
+        for name in BACKENDS:
+            ok, mesh_time, threads, broadcast_time = run_in_process(
+                name, num_peers, base_port)
+            base_port += num_peers
+            print(f"{name:<8}{num_peers:>6}{mesh_time:>10.2f}{threads:>9}{broadcast_time:>13.3f}"
+                  + ("" if ok else "  (timed out)"))
+
+
+if __name__ == "__main__":
+    bench([int(n) for n in sys.argv[1:]] or [2, 4, 8, 16, 32])
@@ -1,4 +1,5 @@
 import json
+import math
 import threading
 from platform import system
 from game.clock.clock import Clock
@@ -6,19 +7,48 @@ from game.models.player import Player
 from game.lobby.tracker import Tracker
 from game.thread_manager import ThreadManager
 from game.transport.transport import Transport
-from game.transport.packet import AckStart, EndGame, Nak, Ack, PeerSyncAck, PeeringCompleted, Packet, ReadyToStart, SatDown, FrameSync, SyncAck, UpdateLeader, Action, Vote
+from game.transport.async_transport import AsyncTransport
+from game.transport.udp_transport import UdpTransport
+from game.transport.packet import AckStart, EndGame, Nak, Ack, PeerSyncAck, PeeringCompleted, Packet, ProbeReply, ReadyToStart, RttRow, SatDown, FrameSync, SyncAck, UpdateLeader, Action, Vote
 import keyboard
 import game.clock.sync as sync
-from time import time, sleep
 import logging
 
 
+def packet_handler(packet_type: str):
+    """
+    Mark a Client method as the handler for a packet type.
+    Subclasses can override a handler or add handlers for new packet types.
+    """
+    def decorator(fn):
+        fn.handles_packet_type = packet_type
+        return fn
+    return decorator
+
+
 class Client():
     """
     Game FSM
     """
 
-    def __init__(self, my_name: str, tracker: Tracker, logger, host_socket=None, ):
+    # packet type -> name of the handler method, collected once per class
+    _packet_handler_names: dict[str, str] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._packet_handler_names = cls._collect_packet_handlers()
+
+    @classmethod
+    def _collect_packet_handlers(cls) -> dict:
+        handlers = {}
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                packet_type = getattr(attr, "handles_packet_type", None)
+                if packet_type is not None:
+                    handlers[packet_type] = name
+        return handlers
+
+    def __init__(self, my_name: str, tracker: Tracker, logger, host_socket=None, codec="binary", frame_rate=2, backend="thread", scenario=None, transport=None, batch_window=0, relay_fanout=0, sync_mode="continuous"):
         super().__init__()
 
         self._state: str = "PEERING"
@@ -41,7 +71,9 @@ class Client():
 
         self.os_name = system()
 
-        self.loop_interval = 0.5
+        # frames are ticked at a fixed rate, packets are handled as they arrive
+        self.frame_rate = frame_rate
+        self.loop_interval = 1 / frame_rate
 
         # INITIALIZE ROUND INPUTS #
         LETTERS = ["Q", "W", "E", "R", "T", "Y"]
@@ -59,8 +91,8 @@ class Client():
             self.key_to_letter[mapping[i]] = LETTERS[i]
             self.letter_to_key[LETTERS[i]] = mapping[i]
 
-        self._round_inputs = {k: None for k in [
-            self.key_to_letter[mapping[i]] for i in range(self._total_players - 1)]}
+        self._round_inputs = {k: None for k in self._seats(
+            [self.key_to_letter[key] for key in mapping], self._total_players - 1)}
 
         self.hotkeys_added = False
         self._round_started = False
@@ -75,6 +107,11 @@ class Client():
         self.init_send_time = None
         self.init_ack_start = None
 
+        # start of round countdown
+        self.countdown = 3
+        self._countdown_end = None
+        self._countdown_shown = None
+
         # selecting seats algo
         self._nak_count = 0
         self._ack_count = 0
@@ -82,49 +119,129 @@ class Client():
         self._done_voting = False
 
         # transport layer stuff
-        self._transportLayer = Transport(my_name,
-                                         self.tracker.get_ip_port(my_name)[1],
-                                         ThreadManager(),
-                                         logger,
-                                         tracker=self.tracker,
-                                         host_socket=host_socket)
+        if transport is not None:
+            # already connected, e.g. a LoopbackTransport in a simulation
+            self._transportLayer = transport
+        else:
+            transport_cls = {"async": AsyncTransport,
+                             "udp": UdpTransport}.get(backend, Transport)
+            # only the threaded transport batches writes
+            options = {"batch_window": batch_window} if transport_cls is Transport else {}
+            self._transportLayer = transport_cls(my_name,
+                                                 self.tracker.get_ip_port(my_name)[1],
+                                                 ThreadManager(),
+                                                 logger,
+                                                 tracker=self.tracker,
+                                                 host_socket=host_socket,
+                                                 codec=codec,
+                                                 scenario=scenario,
+                                                 relay_fanout=relay_fanout,
+                                                 **options)
+        self.clock = self._transportLayer.clock
+        self._next_frame = self.clock.time()
         self.is_peering_completed = False
         # print(f"Tracker_List Before Sync:{self.tracker.get_tracker_list()}")
         # print(
         #     f"Leader List Before Sync Initialisation:{self.tracker.get_leader_list()}")
 
+        # ticks frames at the master's pace, see game/clock/clock.py
         self._frameSync = Clock(
-            self._myself, self._transportLayer, self._myself if host_socket else None)
-        self.frame_delta_threshold = 2
+            self._myself, self._transportLayer, self._myself if host_socket else None,
+            frame_interval=self.loop_interval)
         self.frame_count = 0
-        self.alpha = 0.1
 
         self.is_peering_completed = False
         self.is_sync_complete = False
+        # "leader" measures delays one leader at a time, "probe" has every
+        # player probe every other at once and share an rtt matrix, and
+        # "continuous" skips the sync phase and measures delays off the
+        # game's own traffic, as the other two also do once they are done
+        self.sync_mode = sync_mode
+        self.sent_rtt_row = False
 
         self.round_number = 1
         self._am_spectator = False
 
+        # O(1) dispatch of incoming packets to bound handler methods
+        self._packet_handlers = {packet_type: getattr(self, name)
+                                 for packet_type, name in self._packet_handler_names.items()}
+
     def _state(self):
         return self._state
 
     def start(self):
         try:
             while not self.game_over:
-                sleep(self.loop_interval)  # slow down game loop
-                temporary_logger_dict = json.dumps(
-                    {"Logger Name": "FRAME COUNT", "Logging Data": self.frame_count, "Player Name": self._myself.get_name(), "Time": time()})
-                self.logger.info(f'{temporary_logger_dict}')
-                self.frame_count += 1
-                if self._frameSync.get_master() == self._myself and self.frame_count % 10 == 0:
-                    self._transportLayer.sendall(
-                        FrameSync(self.frame_count, self._myself))
-                self.trigger_handler(self._state)
+                # block until a packet arrives or there is something to do
+                self.step(timeout=max(0, self.next_wakeup() - self.clock.time()))
 
         except KeyboardInterrupt:
             print("Exiting game")
             self._transportLayer.shutdown()
 
+    def step(self, timeout: float = None):
+        """
+        One pass of the game loop: tick the frame if it is due, handle the
+        packets that have arrived and run the current state. With a timeout,
+        wait up to timeout seconds for a packet first.
+        """
+        now = self.clock.time()
+        if now >= self._next_frame:
+            self._tick_frame()
+            self._next_frame += self._frameSync.period
+            if self._next_frame < now:
+                # we stalled for more than a frame, don't try to catch up
+                self._next_frame = now + self._frameSync.period
+
+        for pkt in self._transportLayer.receive_many(timeout=timeout):
+            self._handle_packet(pkt)
+        self._frameSync.poll(self.clock.time())
+        self.trigger_handler(self._state)
+
+    def next_wakeup(self) -> float:
+        """When step next has something to do if no packets arrive."""
+        wakeup = self._next_frame
+        election = self._frameSync.next_deadline()
+        if election is not None:
+            # the master's lease or an election we stand in runs out
+            wakeup = min(wakeup, election)
+        if self._countdown_end is not None:
+            # the next time the countdown shows a new number
+            wakeup = min(wakeup, self._countdown_end -
+                         self._countdown_shown + 1)
+        return wakeup
+
+    def frame_position(self) -> float:
+        """How far we are into the game in frames, counting the frame in progress."""
+        return self.frame_count + 1 - (self._next_frame - self.clock.time()) / self._frameSync.period
+
+    def _tick_frame(self):
+        temporary_logger_dict = json.dumps(
+            {"Logger Name": "FRAME COUNT", "Logging Data": self.frame_count, "Player Name": self._myself.get_name(), "Time": self.clock.time()})
+        self.logger.info(f'{temporary_logger_dict}')
+        self.frame_count += 1
+        if not self._transportLayer.all_connected():
+            # a report nobody gets would throw everyone's reckoning of us off
+            return
+        now = self.clock.time()
+        if self._frameSync.should_send(self.frame_count, now):
+            self._transportLayer.sendall(
+                FrameSync(self.frame_count, self._myself))
+            self._frameSync.sent_frame(self.frame_count, now)
+        slowdown = self._frameSync.tick(self.frame_count, now)
+        if slowdown:
+            print(
+                f"[FRAME_SYNC] Slowing down since I'm ahead by {self._frameSync.error:.1f} frames")
+            temporary_logger_dict = json.dumps(
+                {"Logger Name": "FRAME SLOWING-BEFORE", "Frame Count": self.frame_count, "Player Name": self._myself.get_name(), "Time": now})
+            self.logger.info(f'{temporary_logger_dict}')
+
+            # hold back the next frame rather than sleeping
+            self._next_frame += slowdown
+            temporary_logger_dict = json.dumps(
+                {"Logger Name": "FRAME SLOWING-AFTER", "Frame Count": self.frame_count, "Player Name": self._myself.get_name(), "Time": now + slowdown})
+            self.logger.info(f'{temporary_logger_dict}')
+
     def trigger_handler(self, state):
         if state == "PEERING":
             self.peering()
@@ -165,10 +282,17 @@ class Client():
 
     def reset_sync(self):
         self._transportLayer.reset_sync()
+        self.sent_rtt_row = False
         self._state = "SYNCHRONIZE_CLOCK"
 
     def sync_clock(self):
         self._checkTransportLayerForIncomingData()
+        if self.sync_mode == "probe":
+            self.probe_clock()
+            return
+        if self.sync_mode == "continuous":
+            self.sync_complete()
+            return
         if not self._transportLayer.sync.done():
             self.is_sync_complete = self._transportLayer.syncing(
                 self.round_number)
@@ -189,30 +313,56 @@ class Client():
             self._transportLayer.sync.next_leader()
             self._state = "AWAIT_SYNC_END"
 
+    def probe_clock(self):
+        sync = self._transportLayer.sync
+        self._transportLayer.probe_peers(self.round_number)
+        if not sync.probing_done(self.round_number):
+            return
+        if not self.sent_rtt_row:
+            sync.delays_from_rtt()
+            self._transportLayer.sendall(
+                RttRow(sync.rtt_row(), self.round_number, self._myself), use_sync=False)
+            self.sent_rtt_row = True
+        if sync.matrix_done(self.round_number):
+            temporary_logger_dict = json.dumps(
+                {"Logger Name": "RTT MATRIX", "Round Number": self.round_number, "Logging Data": sync.get_rtt_matrix()})
+            self.logger.info(f'{temporary_logger_dict}')
+            temporary_logger_dict = json.dumps(
+                {"Logger Name": "WAIT LIST", "Round Number": self.round_number, "Logging Data": sync.get_wait_times()})
+            self.logger.info(f'{temporary_logger_dict}')
+            self.sync_complete()
+
     def await_sync_end(self):
         self._checkTransportLayerForIncomingData()
         if self._transportLayer.sync.no_more_leader():
             self._transportLayer.stop_timers()
-            print(f"[SYNC COMPLETE]")
-            self._state = "INIT" if self.round_number == 1 else "AWAIT_KEYPRESS"
+            self.sync_complete()
+
+    def sync_complete(self):
+        self._transportLayer.sync.log_offsets()
+        # from now on delays follow the game's own traffic
+        self._transportLayer.sync.refreshing = True
+        print(f"[SYNC COMPLETE]")
+        self._state = "INIT" if self.round_number == 1 else "AWAIT_KEYPRESS"
 
     def init(self):
         # we only reach here once peering is completed
         # everybody sends ok start to everyone else
         self._checkTransportLayerForIncomingData()
 
-        if len(self._round_ready.keys()) < self._total_players - 1:
-            if self.init_send_time is None:
-                print(f"[SYSTEM] Sending Ready to Start...")
-                self.init_send_time = time()
-                temporary_logger_dict = json.dumps(
-                    {"Logger Name": "FRAME SYNCING", "Frame Count": self.frame_count, "Player Name": self._myself.get_name(), "Time": time()})
-                self.logger.info(f'{temporary_logger_dict}')
-                self._frameSync.if_master_emit_new_master(self._myself)
-                self._transportLayer.sendall(ReadyToStart(self._myself))
-        else:
+        # always announce ourselves, even if everyone else is already ready
+        if self.init_send_time is None:
+            print(f"[SYSTEM] Sending Ready to Start...")
+            self.init_send_time = self.clock.time()
+            temporary_logger_dict = json.dumps(
+                {"Logger Name": "FRAME SYNCING", "Frame Count": self.frame_count, "Player Name": self._myself.get_name(), "Time": self.clock.time()})
+            self.logger.info(f'{temporary_logger_dict}')
+            self._frameSync.if_master_emit_new_master(self._myself)
+            self._transportLayer.sendall(ReadyToStart(self._myself))
+
+        if len(self._round_ready.keys()) >= self._total_players - 1:
             if self.init_ack_start is None:
-                self.init_ack_start = time()
+                self.init_ack_start = self.clock.time()
                 print("[SYSTEM] Voting to start now...")
                 self._transportLayer.sendall(AckStart(self._myself))
                 self._state = "AWAIT_KEYPRESS"
@@ -225,41 +375,33 @@ class Client():
             return
 
         if not self._round_started:
-            if self._all_voted_to_start():
-                # waiting for everyone to ackstart
-                print(f"[SYSTEM] STARTING GAME IN 3 SECONDS")
-                sleep(1)
-
-                print(f"[SYSTEM] STARTING GAME IN 2 SECONDS")
-                sleep(1)
-
-                print(f"[SYSTEM] STARTING GAME IN 1 SECONDS")
-                sleep(1)
-                
-                self._round_started = True
-                print(f"\n|-------- ROUND {self.round_number} --------|")
-                print(f"[PLAYING AS] {self._myself.get_name()}")
-                print(f"[CURRENT PLAYERS] {list(self._players.keys())}")
-                print(f"[AVAILABLE SEATS] {self._round_inputs}")
-                print("[SYSTEM] GRAB A SEAT NOW !!!")
+            now = self.clock.time()
+            if self._countdown_end is None and self._all_voted_to_start():
+                # everyone has voted to start, count down without blocking
+                self._countdown_end = now + self.countdown
+                self._countdown_shown = None
+
+            if self._countdown_end is not None:
+                seconds_left = math.ceil(self._countdown_end - now)
+                if seconds_left > 0:
+                    if seconds_left != self._countdown_shown:
+                        print(f"[SYSTEM] STARTING GAME IN {seconds_left} SECONDS")
+                        self._countdown_shown = seconds_left
+                else:
+                    self._countdown_end = None
+                    self._round_started = True
+                    print(f"\n|-------- ROUND {self.round_number} --------|")
+                    print(f"[PLAYING AS] {self._myself.get_name()}")
+                    print(f"[CURRENT PLAYERS] {list(self._players.keys())}")
+                    print(f"[AVAILABLE SEATS] {self._round_inputs}")
+                    print("[SYSTEM] GRAB A SEAT NOW !!!")
 
         if self._round_started:
             # 1) Received local keypress
             if self._my_keypress is None:
                 if not self.hotkeys_added:
-                    for k in self._round_inputs.keys():
-                        ## FOR TESTING ONLY ##
-                        # player takes hotkey sequentially accordingly to port number
-                        # port 9999 takes 12, 10000 takes 13...
-                        # if not (k + 9987 == self.my_port_number):
-                        #     continue
-                        if self.os_name != "Windows":
-                            translated_key: str = self.letter_to_key[k]
-                        else:
-                            translated_key = k.lower()
-                        keyboard.add_hotkey(
-                            translated_key, self._insert_input, args=(k,))
-                        self.hotkeys_added = True
+                    self._add_hotkeys()
+                    self.hotkeys_added = True
 
             elif not self._is_selecting_seat:
                 # first time we've received a keypress, and have yet to enter selecting seat
@@ -282,8 +424,9 @@ class Client():
                         self._round_inputs[self._my_keypress] = self._myself.get_name(
                         )
                         self.lock.release()
+                        self._log_round_inputs()
                         self._transportLayer.sendall(
-                            SatDown(self._my_keypress, self._myself))
+                            SatDown(self._my_keypress, self._myself, self.round_number))
                         self._sat_down_count += 1
                         print("[ACTION] I have sat down successfully!")
                         print(f"[SEATS] {self._round_inputs}")
@@ -386,174 +529,213 @@ class Client():
         self._checkTransportLayerForIncomingData()
 
 
-######### helper functions #########
+######### incoming packets #########
 
     def _checkTransportLayerForIncomingData(self):
-        """handle data being received from transport layer"""
-        pkt: Packet = self._transportLayer.receive()
+        """handle all data waiting in the transport layer"""
+        for pkt in self._transportLayer.receive_many():
+            self._handle_packet(pkt)
+
+    def _handle_packet(self, pkt: Packet):
+        handler = self._packet_handlers.get(pkt.get_packet_type())
+        if handler:
+            handler(pkt)
+
+    def register_packet_handler(self, packet_type: str, handler):
+        """Handle packet_type with handler(pkt), replacing any existing handler."""
+        self._packet_handlers[packet_type] = handler
+
+    def _log_round_inputs(self):
         temporary_logger_dict = json.dumps(
             {"Logger Name": "GAME PLAY LIST", "Round Number": self.round_number, "Logging Data": self._round_inputs})
         self.logger.info(f'{temporary_logger_dict}')
 
-        if pkt:
-            if pkt.get_packet_type() == "action":
-                # keypress
-                packet = pkt
-                length = len(packet)
-                rtt = time() - packet.get_created_at()
-                throughput = length / rtt
-                if packet.get_packet_type() == "action":
-                    temporary_logger_dict = json.dumps({"Logger Name": "ACTION PACKET INFO-RECEIVE", "Length": length,
-                                                       "Packet Type": packet.get_packet_type(), "Data": packet.get_data(), "RTT": rtt, "Throughput": throughput})
-                    self.logger.info(f'{temporary_logger_dict}')
-                if not self._state == "SPECTATOR":
-                    self._receiving_seats(pkt)
-
-            elif pkt.get_packet_type() == "ss_nak":
-                # drop the nak/ack if we've moved on
-                if self._is_selecting_seat:
-                    self._nak_count += 1
-
-            elif pkt.get_packet_type() == "ss_ack":
-                # drop the nak/ack if we've moved on
-                if self._is_selecting_seat:
-                    self._ack_count += 1
-
-            elif pkt.get_packet_type() == "peering_completed" and not self._round_started:
-                print(
-                    f"[Peering Completed] {pkt.get_player().get_name()}")
-
-            elif pkt.get_packet_type() == "ready_to_start" and not self._round_started:
-                player_name = pkt.get_player().get_name()
-                self._round_ready[player_name] = True
-                self._players[player_name] = Player(player_name)
-                print(f"[Ready to Start]{player_name}")
-
-            elif pkt.get_packet_type() == "ack_start" and not self._round_started:
-                player_name = pkt.get_player().get_name()
-                self._round_ackstart[player_name] = True
-                print(f"[Vote to Start] {player_name}")
-
-            elif pkt.get_packet_type() == "ack":
-                player_name = pkt.get_player().get_name()
-                self._ack_count += 1
-                # print(f"[ACK from] {player_name}")
-
-            elif pkt.get_packet_type() == "nak":
-                player_name = pkt.get_player().get_name()
-                self._nak_count += 1
-                # print(f"[NAK from] {player_name}")
-
-            elif pkt.get_packet_type() == "sat_down":
-                player_name = pkt.get_player().get_name()
-                seat = pkt.get_data()
-                self._sat_down_count += 1
-                self.lock.acquire()
-                self._round_inputs[seat] = player_name
-                self.lock.release()
-                print(f"[ACTION] {player_name} has sat down!")
-                print(f"[SEATS] {self._round_inputs}")
-
-            elif pkt.get_packet_type() == "vote":
-                player_to_kick = pkt.get_data()
-                print(f"[SYSTEM] Received vote to kick {player_to_kick}")
-                if player_to_kick in self._votekick:
-                    self._votekick[player_to_kick] += 1
-                else:
-                    self._votekick[player_to_kick] = 1
+######### packet handlers #########
 
-                # print(f"{self._votekick}")
+    @packet_handler("action")
+    def _on_action(self, pkt: Packet):
+        # keypress
+        length = len(pkt)
+        rtt = pkt.get_received_at() - pkt.get_created_at()
+        throughput = length / rtt if rtt > 0 else 0
+        temporary_logger_dict = json.dumps({"Logger Name": "ACTION PACKET INFO-RECEIVE", "Length": length,
+                                           "Packet Type": pkt.get_packet_type(), "Data": pkt.get_data(), "RTT": rtt, "Throughput": throughput})
+        self.logger.info(f'{temporary_logger_dict}')
+        if not self._state == "SPECTATOR":
+            self._receiving_seats(pkt)
+
+    @packet_handler("ss_nak")
+    def _on_ss_nak(self, pkt: Packet):
+        # drop the nak/ack if we've moved on
+        if self._is_selecting_seat:
+            self._nak_count += 1
+
+    @packet_handler("ss_ack")
+    def _on_ss_ack(self, pkt: Packet):
+        # drop the nak/ack if we've moved on
+        if self._is_selecting_seat:
+            self._ack_count += 1
+
+    @packet_handler("peering_completed")
+    def _on_peering_completed(self, pkt: Packet):
+        if not self._round_started:
+            print(
+                f"[Peering Completed] {pkt.get_player().get_name()}")
 
-            elif pkt.get_packet_type() == "update_master":
-                player = pkt.get_player()
-                new_master_name = pkt.get_data()
-                if self._frameSync.get_master() is None or player.get_name() == self._frameSync.get_master().get_name():
-                    print(f"[FRAME_SYNC] Updating master to {new_master_name}")
-                    self._frameSync.update_master(
-                        Player(new_master_name), player)
-                    print(
-                        f"[FRAME_SYNC] Master is now {self._frameSync.get_master().get_name()}")
-
-            elif pkt.get_packet_type() == "acquire_master":
-                playerRequestingForMaster = pkt.get_player()
-                print(
-                    f"[FRAME_SYNC] {playerRequestingForMaster} requested to acquire master")
-                self._frameSync.if_master_emit_new_master(
-                    playerRequestingForMaster)
-                self._frameSync.update_master(
-                    playerRequestingForMaster, self._myself)
-                print(
-                    f"[FRAME_SYNC] Master is now {self._frameSync.get_master().get_name()}")
-
-            elif pkt.get_packet_type() == "frame_sync":
-                frame = pkt.get_data()
-                player = pkt.get_player()
-                self._frameSync.update_frame(player.get_name(), frame)
-                if self._frameSync.get_master():
-                    if self._frameSync.get_master().get_name() == player.get_name():
-                        if self.frame_count > frame + self.frame_delta_threshold:
-                            print(
-                                f"[FRAME_SYNC] Slowing down since I'm ahead by {self.frame_count - frame} frames")
-                            temporary_logger_dict = json.dumps(
-                                {"Logger Name": "FRAME SLOWING-BEFORE", "Frame Count": self.frame_count, "Player Name": self._myself.get_name(), "Time": time()})
-                            self.logger.info(f'{temporary_logger_dict}')
-
-                            sleep(self.loop_interval *
-                                  (self.frame_count - frame)*self.alpha)
-                            temporary_logger_dict = json.dumps(
-                                {"Logger Name": "FRAME SLOWING-AFTER", "Frame Count": self.frame_count, "Player Name": self._myself.get_name(), "Time": time()})
-                            self.logger.info(f'{temporary_logger_dict}')
-                            # print(f"[FRAME_SYNC] Slowing down since I'm ahead")
-                        elif frame > self.frame_count:
-                            print(
-                                f"[FRAME_SYNC] Requesting to be master since I'm behind by {self.frame_count - frame} frames")
-                            self._frameSync.acquire_master()
-
-            elif pkt.get_packet_type() == "end_game":
-                winner = pkt.get_player()
-                if self._state == "SPECTATOR":
-                    print(
-                        f"\n ---- [GAME ENDED] {winner} has won the game! ----")
-                    self._state = "END_GAME"
+    @packet_handler("ready_to_start")
+    def _on_ready_to_start(self, pkt: Packet):
+        if not self._round_started:
+            player_name = pkt.get_player().get_name()
+            self._round_ready[player_name] = True
+            self._players[player_name] = Player(player_name)
+            print(f"[Ready to Start]{player_name}")
+
+    @packet_handler("ack_start")
+    def _on_ack_start(self, pkt: Packet):
+        if not self._round_started:
+            player_name = pkt.get_player().get_name()
+            self._round_ackstart[player_name] = True
+            print(f"[Vote to Start] {player_name}")
+
+    @packet_handler("ack")
+    def _on_ack(self, pkt: Packet):
+        self._ack_count += 1
+
+    @packet_handler("nak")
+    def _on_nak(self, pkt: Packet):
+        self._nak_count += 1
+
+    @packet_handler("sat_down")
+    def _on_sat_down(self, pkt: Packet):
+        player_name = pkt.get_player().get_name()
+        seat = pkt.get_data()["seat"]
+        if pkt.get_data()["round"] != self.round_number or seat not in self._round_inputs:
+            # from a round we have already finished, having heard of every
+            # seat being taken from the claims for them
+            return
+        self._sat_down_count += 1
+        self.lock.acquire()
+        self._round_inputs[seat] = player_name
+        self.lock.release()
+        self._log_round_inputs()
+        print(f"[ACTION] {player_name} has sat down!")
+        print(f"[SEATS] {self._round_inputs}")
+
+    @packet_handler("vote")
+    def _on_vote(self, pkt: Packet):
+        player_to_kick = pkt.get_data()
+        print(f"[SYSTEM] Received vote to kick {player_to_kick}")
+        if player_to_kick in self._votekick:
+            self._votekick[player_to_kick] += 1
+        else:
+            self._votekick[player_to_kick] = 1
+
+    @packet_handler("update_master")
+    def _on_update_master(self, pkt: Packet):
+        player = pkt.get_player()
+        data = pkt.get_data()
+        if self._frameSync.update_master(Player(data["master"]), player, data["term"], data["score"]):
+            print(
+                f"[FRAME_SYNC] Master is now {self._frameSync.get_master().get_name()} for term {data['term']}")
 
-            elif pkt.get_packet_type() == "sync_req":
-                rcv_time = time()
-                # print("rcv time: {}".format(rcv_time))
-                leader_id = pkt.get_player().get_name()
-                print(f"[SYNCING WITH LEADER] {leader_id}")
-                delay_from_leader = float(
-                    rcv_time) - float(pkt.get_created_at())
-                # print("delay from leader {}".format(delay_from_leader))
+    @packet_handler("acquire_master")
+    def _on_acquire_master(self, pkt: Packet):
+        player = pkt.get_player()
+        data = pkt.get_data()
+        print(
+            f"[FRAME_SYNC] {player} stands for master in term {data['term']}")
+        self._frameSync.on_candidate(player.get_name(), data["term"], data["score"])
+
+    @packet_handler("frame_sync")
+    def _on_frame_sync(self, pkt: Packet):
+        frame = pkt.get_data()
+        player = pkt.get_player()
+        # the player was at frame when they sent it, the time the packet
+        # took to get here and to be handled ago
+        delay = self._transportLayer.sync.one_way_delay(pkt) + \
+            self.clock.time() - pkt.get_received_at()
+        self._frameSync.update_frame(player.get_name(), frame, self.clock.time() - delay)
+
+    @packet_handler("end_game")
+    def _on_end_game(self, pkt: Packet):
+        winner = pkt.get_player()
+        if self._state == "SPECTATOR":
+            print(
+                f"\n ---- [GAME ENDED] {winner} has won the game! ----")
+            self._state = "END_GAME"
 
-                sync_ack_pkt = SyncAck(
-                    delay_from_leader, self._myself, self.round_number)
-                self._transportLayer.send(
-                    packet=sync_ack_pkt, player_id=leader_id)
+    @packet_handler("player_lost")
+    def _on_player_lost(self, pkt: Packet):
+        # put there by our own transport, which has given up reconnecting
+        player_name = pkt.get_player().get_name()
+        print(f"[SYSTEM] Lost the connection to {player_name} for good")
+        temporary_logger_dict = json.dumps(
+            {"Logger Name": "PLAYER LOST", "Player Name": self._myself.get_name(), "Lost": player_name, "Time": pkt.get_received_at()})
+        self.logger.info(f'{temporary_logger_dict}')
 
-            elif pkt.get_packet_type() == "sync_ack":
-                rcv_time = time()
-                self._transportLayer.sync.update_delay_dict(pkt)
+    @packet_handler("sync_req")
+    def _on_sync_req(self, pkt: Packet):
+        leader_id = pkt.get_player().get_name()
+        print(f"[SYNCING WITH LEADER] {leader_id}")
 
-                print(self._transportLayer.sync._delay_dict)
+        # echo the leader's timestamps so they can work out our offset
+        sync_ack_pkt = SyncAck(
+            {"sent": pkt.get_created_at(), "received": pkt.get_received_at()},
+            self._myself, self.round_number)
+        self._transportLayer.send(
+            packet=sync_ack_pkt, player_id=leader_id)
 
-                peer_id = pkt.get_player().get_name()
-                self._transportLayer.sync_req_timers[peer_id].cancel()
+    @packet_handler("sync_ack")
+    def _on_sync_ack(self, pkt: Packet):
+        peer_id = pkt.get_player().get_name()
+        delay_to_peer, delay_from_peer = self._transportLayer.sync.add_exchange(pkt)
+        self._transportLayer.sync.set_delay(peer_id, delay_to_peer)
 
-                delay_from_peer = float(rcv_time) - float(pkt.get_created_at())
+        print(self._transportLayer.sync._delay_dict)
 
-                peer_sync_ack_pkt = PeerSyncAck(
-                    delay_from_peer, self._myself, self.round_number)
-                self._transportLayer.send(
-                    packet=peer_sync_ack_pkt, player_id=peer_id)
+        self._transportLayer.sync_req_timers[peer_id].cancel()
 
-            elif pkt.get_packet_type() == "peer_sync_ack":
-                self._transportLayer.sync.update_delay_dict(pkt)
+        temporary_logger_dict = json.dumps(
+            {"Logger Name": "SYNC RTT", "Peer": peer_id, "RTT": delay_to_peer + delay_from_peer,
+             "Offset": self._transportLayer.sync.get_offset(peer_id)})
+        self.logger.info(f'{temporary_logger_dict}')
 
-            elif pkt.get_packet_type() == "update_leader":
-                self._transportLayer.sync.next_leader()
-                if self._transportLayer.sync.no_more_leader():
-                    # print(self._transportLayer.sync._delay_dict)
-                    self._transportLayer.is_sync_completed = True
+        peer_sync_ack_pkt = PeerSyncAck(
+            delay_from_peer, self._myself, self.round_number)
+        self._transportLayer.send(
+            packet=peer_sync_ack_pkt, player_id=peer_id)
+
+    @packet_handler("peer_sync_ack")
+    def _on_peer_sync_ack(self, pkt: Packet):
+        self._transportLayer.sync.update_delay_dict(pkt)
+
+    @packet_handler("probe")
+    def _on_probe(self, pkt: Packet):
+        self._transportLayer.send(
+            packet=ProbeReply(pkt.get_created_at(), pkt.get_received_at(),
+                              pkt.get_data(), self._myself),
+            player_id=pkt.get_player().get_name())
+
+    @packet_handler("probe_reply")
+    def _on_probe_reply(self, pkt: Packet):
+        sync = self._transportLayer.sync
+        delay_there, delay_back = sync.add_exchange(pkt)
+        sync.add_rtt_sample(pkt.get_player().get_name(),
+                            delay_there + delay_back, pkt.get_data()["round"])
+
+    @packet_handler("rtt_row")
+    def _on_rtt_row(self, pkt: Packet):
+        data = pkt.get_data()
+        self._transportLayer.sync.update_rtt_row(
+            pkt.get_player().get_name(), data["rtt"], data["round"])
+
+    @packet_handler("update_leader")
+    def _on_update_leader(self, pkt: Packet):
+        self._transportLayer.sync.next_leader()
+        if self._transportLayer.sync.no_more_leader():
+            self._transportLayer.is_sync_completed = True
+
+######### helper functions #########
 
     def _all_voted_to_start(self):
         return len(self._round_ackstart.keys()) >= len(self._round_inputs)
@@ -561,9 +743,11 @@ class Client():
     def _selecting_seats(self):
         self._is_selecting_seat = True
         pkt = Action(self._my_keypress, self._myself)
-        self._my_keypress_time = pkt.get_created_at()
+        # stamped here rather than by the transport, so everyone compares
+        # the same keypress time with ours
+        pkt.createdAt = self._my_keypress_time = self.clock.time()
         temporary_logger_dict = json.dumps(
-            {"Logger Name": "KEYPRESS TIME", "Seat Selected": self._my_keypress, "Time": time()})
+            {"Logger Name": "KEYPRESS TIME", "Seat Selected": self._my_keypress, "Time": self._my_keypress_time})
         self.logger.info(f'{temporary_logger_dict}')
         self._transportLayer.sendall(pkt)
 
@@ -577,10 +761,34 @@ class Client():
         self._state = self.trigger_handler(self._state)
         return self._state
 
+    def _seats(self, letters: list, count: int) -> list:
+        """The count seats of the first round, out of the keys in letters."""
+        return [letters[i] for i in range(count)]
+
+    def _add_hotkeys(self):
+        """Listen for a key press for every seat."""
+        for k in self._round_inputs.keys():
+            ## FOR TESTING ONLY ##
+            # player takes hotkey sequentially accordingly to port number
+            # port 9999 takes 12, 10000 takes 13...
+            # if not (k + 9987 == self.my_port_number):
+            #     continue
+            if self.os_name != "Windows":
+                translated_key: str = self.letter_to_key[k]
+            else:
+                translated_key = k.lower()
+            keyboard.add_hotkey(
+                translated_key, self._insert_input, args=(k,))
+
+    def _remove_hotkeys(self):
+        keyboard.remove_all_hotkeys()
+
     def _insert_input(self, keypress):
         self._my_keypress = keypress
         print(f"[ACTION] I HAVE PRESSED {keypress}")
-        keyboard.remove_all_hotkeys()
+        self._remove_hotkeys()
+        # handle the keypress now rather than at the next frame
+        self._transportLayer.wakeup()
 
     def _receiving_seats(self, action: Packet):
         seat = action.get_data()
@@ -589,7 +797,8 @@ class Client():
         if seat:
             # print(f"[ACTION] Received seat: {seat} from {player}")
             self.lock.acquire()
-            if self._round_inputs[seat] is not None:
+            if seat not in self._round_inputs or self._round_inputs[seat] is not None:
+                # taken, or a seat from a round we have already finished
                 self._send_nak(player)
                 self.lock.release()
                 return
@@ -605,6 +814,7 @@ class Client():
             self._send_ack(player)
             self._round_inputs[seat] = player.get_name()
             self.lock.release()
+            self._log_round_inputs()
             return
 
     def _reset_round(self):
@@ -633,3 +843,6 @@ class Client():
         self._vote_tied = False
         self.init_send_time = None
         self.init_ack_start = None
+
+
+Client._packet_handler_names = Client._collect_packet_handlers()
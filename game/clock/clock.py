@@ -1,33 +1,391 @@
+import json
+import statistics
+from collections import deque
+
 from game.models.player import Player
 from game.transport.packet import AcquireMaster, UpdateMaster
 from game.transport.transport import Transport
 
+"""
+Keeps every player's frames in step with the rest of the cluster's.
+
+Every player keeps the last few frame counts each peer reported, with when
+the peer was at that frame on our clock, so it can work out the peer's frame
+rate and reckon what frame they are at now. Reports are only sent when they
+are needed: a player reports its frame when it strays more than
+RECKONING_FRAMES from where the others reckon it is, working that out from
+its own reports the same way they do. The master also reports every
+HEARTBEAT_FRAMES frames to show it is still there.
+
+On every tick a PI controller stretches or shortens the tick period to close
+the gap to the median of everyone's frames over the next few dozen frames,
+rather than all at once or by following any single player. The integral
+term takes up a steady difference in clock rates. Only a gap of more than
+STEP_FRAMES ahead is closed in one go, by holding back the next frame, and
+nothing ever sleeps, so packets keep being handled meanwhile.
+
+The master is elected. Every election has a term number, one higher than
+the last, and anything from an older term is ignored, so a late UpdateMaster
+can never bring back a master that has since been replaced. The master's
+FrameSyncs renew its lease, and once a player has heard none for the length
+of a lease it starts an election for the next term. A lease is as short as
+it can be without a live master losing it: LEASE_HEARTBEATS heartbeats,
+so one can be lost or held back by a slowed down tick, plus LEASE_RTTS of
+our longest round trip for the last one to arrive. At the default 2 frames
+a second that is 3 seconds and a few round trips. So does a player at the median once
+the master has been more than HANDOFF_FRAMES off it for HANDOFF_HOLD frames,
+though not within HANDOFF_COOLDOWN frames of the last change of master, so
+mastership does not bounce between players that are about level.
+
+Elections are a bully algorithm, keyed on how central a player is: its mean
+round trip time to everyone else, as measured by Sync. A player stands by
+broadcasting AcquireMaster with its score, and players who hear a candidate
+stand too, if they are at the median and would beat every candidate so far.
+A candidate that still has the best score once ELECTION_RTTS of its longest
+round trips have passed, by when every candidacy has reached it, takes over
+and broadcasts UpdateMaster. So the cluster fails over within a lease and
+an election timeout. Should two candidates miss each other and both take
+over in the same term, everyone, the two included, goes with the better
+score.
+"""
+
+# the master reports its frame at least every this many frames' time
+HEARTBEAT_FRAMES = 2
+# report our frame once we are this many frames off where the others reckon
+RECKONING_FRAMES = 0.25
+# frame reports kept per player, and the fewest frames they must span to
+# work out a frame rate from, below that the nominal rate is used. The
+# master's heartbeats alone have to span that many frames
+RATE_MIN_FRAMES = 10
+FRAME_HISTORY = RATE_MIN_FRAMES // HEARTBEAT_FRAMES + 2
+# fraction of the error taken off the tick period per frame of error, so
+# half the gap is gone in about 14 frames
+GAIN = 1 / 20
+# integral gain, relative to GAIN, and the error within which the integral
+# is kept, it only has to take up small differences in clock rates
+INTEGRAL_GAIN = 0.025
+INTEGRAL_FRAMES = 1
+# the tick period is kept within this fraction of the frame interval
+MAX_RATE_ADJUST = 0.5
+# further ahead than this many frames, the next frame is held back instead
+STEP_FRAMES = 4
+# master hand-off hysteresis, see above
+HANDOFF_FRAMES = 2
+HANDOFF_HOLD = 20
+HANDOFF_COOLDOWN = 30
+# how long the master's lease lasts, see above
+LEASE_HEARTBEATS = 3
+LEASE_RTTS = 4
+# how long candidates wait for each other, in round trips, at least
+# ELECTION_MIN seconds, and DEFAULT_RTT when none have been measured yet
+ELECTION_RTTS = 2
+ELECTION_MIN = 0.05
+DEFAULT_RTT = 0.2
+# within this many frames of the median for CONVERGED_TICKS frames in a row
+# counts as converged
+CONVERGED_FRAMES = 0.5
+CONVERGED_TICKS = 20
+
 
 class Clock:
-    def __init__(self, myself: Player, transportLayer: Transport, initial_master=None):
-        self.indiv_clocks = {}
+    def __init__(self, myself: Player, transportLayer: Transport, initial_master=None, frame_interval: float = 0.5):
         self.master: Player = initial_master
         self.myself: Player = myself
         self.transportLayer = transportLayer
 
-    def update_frame(self, player_id, frame):
-        self.indiv_clocks[player_id] = frame
+        # per player, including ourselves, the last frames they reported as
+        # (when they were at it on our clock, frame)
+        self._history: dict[str, deque] = {}
+        self.frame_syncs_sent = 0
+
+        # the tick period, frame_interval adjusted by the controller
+        self.frame_interval = frame_interval
+        self.period = frame_interval
+        self._integral = 0.0
+        # frames ahead of the median and spread of the cluster at the last tick
+        self.error = None
+        self.spread = None
+        self._stray = 0
+        self._master_since = None
+        self.handoffs = 0
+
+        # elections: the current term, when the master's lease runs out, the
+        # candidates for this term by their scores, and when we take over if
+        # we stand and nobody better does
+        self.term = 0
+        self._master_term = 0
+        self._master_score = None
+        self._lease_expires = None
+        self._candidates: dict[str, float] = {}
+        self._election_deadline = None
+        self.elections = 0
+
+        self._started_at = None
+        self._in_band = 0
+        self.time_to_converge = None
+
+    def update_frame(self, player_id, frame, at: float):
+        """The player reported being at frame at time at, on our clock."""
+        history = self._history.get(player_id)
+        if history is None:
+            history = self._history.setdefault(player_id, deque(maxlen=FRAME_HISTORY))
+        history.append((at, frame))
+        if self.master is not None and player_id == self.master.get_name():
+            self._renew_lease(self.transportLayer.clock.time())
 
     def get_frame(self, player_id):
-        return self.indiv_clocks[player_id]
+        """The last frame the player reported."""
+        return self._history[player_id][-1][1]
+
+    def frame_rate(self, player_id) -> float:
+        """The player's frames per second over their last reports."""
+        history = self._history.get(player_id)
+        if history and len(history) > 1:
+            (first_at, first), (last_at, last) = history[0], history[-1]
+            if last - first >= RATE_MIN_FRAMES and last_at > first_at:
+                return (last - first) / (last_at - first_at)
+        return 1 / self.frame_interval
+
+    def frame_at(self, player_id, now: float) -> float:
+        """The frame the player is reckoned to be at now, None if they never reported."""
+        history = self._history.get(player_id)
+        if not history:
+            return None
+        at, frame = history[-1]
+        return frame + self.frame_rate(player_id) * (now - at)
+
+    def positions(self, now: float, position: float) -> dict:
+        """Everyone's frame now, ours being position."""
+        positions = {player_id: self.frame_at(player_id, now) for player_id in self._history
+                     if player_id != self.myself.get_name()}
+        positions[self.myself.get_name()] = position
+        return positions
+
+    def frame_skew(self, now: float, position: float) -> dict:
+        """
+        How far ahead of us the players furthest behind and ahead and the
+        median are, in frames, and the spread between the first two.
+        """
+        skews = [frame - position for frame in self.positions(now, position).values()]
+        return {"min": min(skews), "max": max(skews), "median": statistics.median(skews),
+                "spread": max(skews) - min(skews)}
 
     def get_master(self) -> Player:
         return self.master
 
-    def acquire_master(self):
-        self.transportLayer.send(AcquireMaster(
-            self.myself), self.get_master().get_name())
+    def is_master_myself(self) -> bool:
+        return self.master is not None and self.master.get_name() == self.myself.get_name()
 
     def if_master_emit_new_master(self, new_master: Player):
-        if self.master == self.myself:
+        if self.is_master_myself():
             self.transportLayer.sendall(UpdateMaster(
-                new_master.get_name(), self.myself))
+                new_master.get_name(), self.myself, self.term, self._master_score), use_sync=False)
+
+    def update_master(self, new_master: Player, _from: Player, term: int = None, score: float = None):
+        """
+        new_master is the master for term, the current one if not given.
+        Returns whether we went with it.
+        """
+        term = self.term if term is None else term
+        if term < self.term:
+            self.transportLayer.logger.debug(
+                f"Ignored stale master {new_master} for term {term} from {_from}, we are in term {self.term}")
+            return False
+        if (term == self._master_term and self.master is not None
+                and self.master.get_name() != new_master.get_name()
+                and self._priority(self.master.get_name(), self._master_score)
+                < self._priority(new_master.get_name(), score)):
+            # two masters for the same term, keep the better one
+            return False
+        if self.master is not None and self.master.get_name() != new_master.get_name():
+            self.handoffs += 1
+        # players off the wire are new objects, and the client checks
+        # whether it is the master by identity
+        if new_master.get_name() == self.myself.get_name():
+            new_master = self.myself
+        now = self.transportLayer.clock.time()
+        self.term = term
+        self.master = new_master
+        self._master_term = term
+        self._master_score = score
+        self._candidates = {}
+        self._election_deadline = None
+        self._stray = 0
+        self._master_since = now
+        self._renew_lease(now)
+        return True
+
+    def _renew_lease(self, now: float):
+        self._lease_expires = now + self.lease()
+
+    def lease(self) -> float:
+        """How long the master may go without a FrameSync before we call an election."""
+        return LEASE_HEARTBEATS * HEARTBEAT_FRAMES * self.frame_interval + LEASE_RTTS * self._max_rtt()
+
+    def _max_rtt(self) -> float:
+        rtts = [rtt for rtt in self.transportLayer.sync.rtt_row().values() if rtt is not None]
+        return max(rtts) if rtts else DEFAULT_RTT
+
+    def score(self):
+        """Our mean round trip time to the others, None until we have measured any."""
+        rtts = [rtt for rtt in self.transportLayer.sync.rtt_row().values() if rtt is not None]
+        return statistics.mean(rtts) if rtts else None
+
+    @staticmethod
+    def _priority(player_id, score) -> tuple:
+        # lower is better, players we have no score for last
+        return (score is None, score or 0.0, player_id)
+
+    def _eligible(self) -> bool:
+        return self.error is None or abs(self.error) <= HANDOFF_FRAMES
+
+    def election_timeout(self) -> float:
+        return max(ELECTION_MIN, ELECTION_RTTS * self._max_rtt())
+
+    def start_election(self, now: float):
+        """Call an election for the next term."""
+        self._new_term(self.term + 1, now)
+        self.elections += 1
+        temporary_logger_dict = json.dumps({"Logger Name": "MASTER ELECTION", "Player Name": self.myself.get_name(),
+                                            "Term": self.term, "Master": self.master.get_name() if self.master else None})
+        self.transportLayer.logger.info(f'{temporary_logger_dict}')
+        if self._eligible():
+            self._stand(now)
+
+    def _new_term(self, term: int, now: float):
+        self.term = term
+        self._candidates = {}
+        self._election_deadline = None
+        # start over should this election come to nothing
+        self._renew_lease(now)
+
+    def _stand(self, now: float):
+        score = self.score()
+        self._candidates[self.myself.get_name()] = score
+        self._election_deadline = now + self.election_timeout()
+        self.transportLayer.sendall(AcquireMaster(self.myself, self.term, score), use_sync=False)
+
+    def on_candidate(self, player_id, term: int, score: float):
+        """The player stands for master in the election for term."""
+        if term < self.term:
+            return
+        now = self.transportLayer.clock.time()
+        if term > self.term:
+            self._new_term(term, now)
+        self._candidates[player_id] = score
+        best = min(self._priority(*candidate) for candidate in self._candidates.items())
+        if (self._election_deadline is None and self._eligible()
+                and self._priority(self.myself.get_name(), self.score()) < best):
+            self._stand(now)
+
+    def next_deadline(self):
+        """When poll next has something to do, None if never."""
+        if self._election_deadline is not None:
+            return self._election_deadline
+        if self.master is not None and not self.is_master_myself():
+            return self._lease_expires
+        return None
+
+    def poll(self, now: float):
+        """End our election or call one if the master's lease has run out."""
+        if self._election_deadline is not None:
+            if now >= self._election_deadline:
+                self._end_election(now)
+        elif (self.master is not None and not self.is_master_myself()
+              and self._lease_expires is not None and now >= self._lease_expires):
+            print(f"[FRAME_SYNC] Nothing from {self.master} for {self.lease():.2f}s, calling an election")
+            self.start_election(now)
+
+    def _end_election(self, now: float):
+        self._election_deadline = None
+        best = min(self._candidates.items(), key=lambda candidate: self._priority(*candidate))
+        if best[0] != self.myself.get_name():
+            # wait for them to take over
+            return
+        print(f"[FRAME_SYNC] Taking over as master for term {self.term}")
+        self.update_master(self.myself, self.myself, self.term, best[1])
+        self.if_master_emit_new_master(self.myself)
+
+    def should_send(self, frame: int, now: float) -> bool:
+        """Whether to report frame, which we just ticked over to at now."""
+        history = self._history.get(self.myself.get_name())
+        if not history:
+            return True
+        # by the time rather than the frame, which a slowed down master takes
+        # longer to reach, so the heartbeat always beats the lease
+        if self.is_master_myself() and now - history[-1][0] >= HEARTBEAT_FRAMES * self.frame_interval:
+            return True
+        return abs(frame - self.frame_at(self.myself.get_name(), now)) > RECKONING_FRAMES
+
+    def sent_frame(self, frame: int, now: float):
+        self.update_frame(self.myself.get_name(), frame, now)
+        self.frame_syncs_sent += 1
+
+    def tick(self, frame: int, now: float) -> float:
+        """
+        Steer towards the median of everyone's frames, having just ticked
+        over to frame at now. Returns how many seconds to hold back the next
+        frame, almost always 0.
+        """
+        positions = self.positions(now, frame)
+        if len(positions) < 2:
+            return 0.0
+        if self._started_at is None:
+            self._started_at = now
+        median = statistics.median(positions.values())
+        error = frame - median
+        self.error = error
+        self.spread = max(positions.values()) - min(positions.values())
+        self._track_convergence(error, now)
+        self._check_master(positions, median, now)
+
+        if error > STEP_FRAMES:
+            self._integral = 0.0
+            self.period = self.frame_interval
+            return error * self.frame_interval
+
+        # don't wind up the integral while closing a large gap
+        if abs(error) <= INTEGRAL_FRAMES:
+            self._integral += error
+        adjust = GAIN * (error + INTEGRAL_GAIN * self._integral)
+        adjust = max(-MAX_RATE_ADJUST, min(MAX_RATE_ADJUST, adjust))
+        self.period = self.frame_interval * (1 + adjust)
+        return 0.0
+
+    def _check_master(self, positions: dict, median: float, now: float):
+        master = self.master.get_name() if self.master else None
+        if master not in positions or self.is_master_myself():
+            self._stray = 0
+            return
+        at_median = abs(positions[self.myself.get_name()] - median) <= CONVERGED_FRAMES
+        if abs(positions[master] - median) > HANDOFF_FRAMES and at_median:
+            self._stray += 1
+        else:
+            self._stray = 0
+        cooldown = HANDOFF_COOLDOWN * self.frame_interval
+        cooled_down = self._master_since is None or now - self._master_since >= cooldown
+        if self._stray >= HANDOFF_HOLD and cooled_down:
+            print(f"[FRAME_SYNC] Calling an election since {master} is "
+                  f"{positions[master] - median:+.1f} frames off the median")
+            self.start_election(now)
+            self._stray = 0
+            # don't ask again before the cooldown is up
+            self._master_since = now
+
+    def _track_convergence(self, error: float, now: float):
+        if abs(error) > CONVERGED_FRAMES:
+            self._in_band = 0
+            return
+        self._in_band += 1
+        if self._in_band == CONVERGED_TICKS and self.time_to_converge is None:
+            self.time_to_converge = now - self._started_at
+            temporary_logger_dict = json.dumps({"Logger Name": "FRAME SYNC CONVERGED", "Player Name": self.myself.get_name(),
+                                                "Logging Data": self.stats()})
+            self.transportLayer.logger.info(f'{temporary_logger_dict}')
 
-    def update_master(self, new_master: Player, _from: Player):
-        if self.master is None or _from.get_name() == self.master.get_name():
-            self.master = new_master
+    def stats(self) -> dict:
+        return {"error": self.error, "spread": self.spread, "period": self.period,
+                "rate_adjust": self.period / self.frame_interval - 1,
+                "time_to_converge": self.time_to_converge, "handoffs": self.handoffs,
+                "frame_syncs_sent": self.frame_syncs_sent, "term": self.term,
+                "master": self.master.get_name() if self.master else None, "elections": self.elections}
@@ -0,0 +1,220 @@
+import json
+import random
+import threading
+
+from game.clock.timebase import RealTimeClock, SkewedClock
+from game.lobby.tracker import Tracker
+
+"""
+NetworkEmulator decides what the network does to every packet we send, in
+the style of Linux netem: how long it is delayed, whether it is lost or
+reordered and how long it waits behind earlier packets on a rate limited
+link. The transport holds delayed packets in a timed queue, nothing sleeps.
+
+Links are described by a scenario, usually loaded from a json file:
+
+    {
+        "seed": 7,
+        "default": {"latency": 0.03, "jitter": 0.01, "distribution": "normal"},
+        "links": {
+            "alice->bob": {"latency": 0.12, "loss": 0.01},
+            "*->carol": {"rate": 50000}
+        },
+        "clocks": {
+            "bob": {"offset": 0.25, "drift": 50e-6}
+        }
+    }
+
+Each link starts from "default" and is overridden by the first of
+"src->dst", "src->*" and "*->dst" found in "links". Every link draws from
+its own random generator seeded from the seed and the link, so a run with
+the same scenario and seed sees the same delays, losses and reorders.
+
+Without a scenario every link gets a fixed latency of 10-80ms, which is
+what Delay used to do. A scenario with nothing but a seed keeps those
+latencies but makes them reproducible.
+
+"clocks" sets players' clocks off from the others: offset seconds ahead
+and running drift faster, see skew_clock.
+
+Over a stream transport (TCP) the network's losses are hidden by
+retransmission: a lost packet arrives STREAM_RTO late instead of never,
+and as a stream is delivered in order everything sent after it waits for
+it. Over datagrams (UDP) a lost packet is gone and packets can overtake
+each other.
+"""
+
+DISTRIBUTIONS = ("uniform", "normal", "pareto")
+# retransmission timeout of an emulated stream, Linux's minimum RTO
+STREAM_RTO = 0.2
+# give up retransmitting over a stream after this many losses in a row
+STREAM_RETRIES = 15
+
+
+class LinkProfile:
+    """
+    latency      - one way delay in seconds
+    jitter       - spread of the delay in seconds
+    distribution - how the jitter is distributed, one of DISTRIBUTIONS
+    loss         - probability a packet is lost
+    reorder      - probability a packet skips the delay and overtakes
+                   packets still queued, as netem's reorder does. Streams
+                   are never reordered
+    rate         - bandwidth cap in bytes per second, 0 for none
+    """
+
+    def __init__(self, latency: float = 0, jitter: float = 0, distribution: str = "uniform", loss: float = 0, reorder: float = 0, rate: float = 0):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {distribution}, expected one of {DISTRIBUTIONS}")
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.loss = loss
+        self.reorder = reorder
+        self.rate = rate
+
+    @staticmethod
+    def from_dict(d: dict, base: "LinkProfile" = None) -> "LinkProfile":
+        fields = dict(base.__dict__) if base else {}
+        fields.update(d)
+        return LinkProfile(**fields)
+
+
+class Link:
+    """State of the link to one peer."""
+
+    def __init__(self, profile: LinkProfile, rng: random.Random, stream: bool = False):
+        self.profile = profile
+        self.rng = rng
+        self.stream = stream
+        # when the last packet finishes going out on a rate limited link
+        self.busy_until = 0.0
+        # when the last packet arrives on a stream
+        self.last_arrival = 0.0
+
+        self.sent = 0
+        self.bytes_sent = 0
+        self.lost = 0
+        self.reordered = 0
+
+    def plan(self, size: int, now: float) -> float:
+        """Seconds until a packet of size bytes arrives, None if it is lost."""
+        p = self.profile
+        # always draw the same numbers in the same order so a link's
+        # behaviour only depends on how many packets went over it
+        lost = self.rng.random() < p.loss
+        reordered = self.rng.random() < p.reorder
+        jitter = self._jitter()
+
+        self.bytes_sent += size
+        if self.stream:
+            return self._plan_stream(size, now, lost, jitter)
+
+        if lost:
+            self.lost += 1
+            return None
+        self.sent += 1
+
+        queued = 0.0
+        if p.rate > 0:
+            self.busy_until = max(self.busy_until, now) + size / p.rate
+            queued = self.busy_until - now
+
+        if reordered:
+            self.reordered += 1
+            return queued
+        return queued + max(0.0, p.latency + jitter)
+
+    def _plan_stream(self, size: int, now: float, lost: bool, jitter: float) -> float:
+        p = self.profile
+        retransmits = 0
+        while lost and retransmits < STREAM_RETRIES:
+            self.lost += 1
+            retransmits += 1
+            lost = self.rng.random() < p.loss
+        self.sent += 1
+
+        start = now
+        if p.rate > 0:
+            self.busy_until = max(self.busy_until, now) + size / p.rate
+            start = self.busy_until
+        # each retransmission waits twice as long as the one before
+        backoff = STREAM_RTO * ((1 << retransmits) - 1)
+        arrival = max(self.last_arrival, start + backoff + max(0.0, p.latency + jitter))
+        self.last_arrival = arrival
+        return arrival - now
+
+    def _jitter(self) -> float:
+        p = self.profile
+        if p.distribution == "normal":
+            return self.rng.gauss(0, p.jitter)
+        if p.distribution == "pareto":
+            # heavy tailed, pareto(3) has a mean of 1.5
+            return p.jitter * (self.rng.paretovariate(3) - 1.5)
+        return self.rng.uniform(-p.jitter, p.jitter)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "bytes": self.bytes_sent, "lost": self.lost, "reordered": self.reordered}
+
+
+def skew_clock(clock, scenario: dict, player_id):
+    """The player's clock as the scenario skews it, clock itself if it does not."""
+    skew = (scenario or {}).get("clocks", {}).get(player_id)
+    if not skew:
+        return clock
+    return SkewedClock(clock, skew.get("offset", 0.0), skew.get("drift", 0.0))
+
+
+def load_scenario(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+class NetworkEmulator:
+
+    def __init__(self, myself: str, tracker: Tracker, scenario: dict = None, clock=None, stream: bool = False):
+        print("Network Emulator Initiated")
+        self.myself = myself
+        self.scenario = scenario
+        self.clock = clock or RealTimeClock()
+        self.seed = scenario.get("seed") if scenario else None
+        if self.seed is None:
+            self.seed = random.randrange(1 << 32)
+        self.lock = threading.Lock()
+        self._links: dict[str, Link] = {}
+
+        for player_id in tracker.get_leader_list():
+            if player_id == self.myself:
+                continue
+            rng = random.Random(f"{self.seed}/{self.myself}->{player_id}")
+            self._links[player_id] = Link(
+                self._profile(player_id, rng), rng, stream)
+
+    def _profile(self, player_id, rng: random.Random) -> LinkProfile:
+        if self.scenario is None or not ("default" in self.scenario or "links" in self.scenario):
+            return LinkProfile(latency=0.01 * rng.randrange(1, 9))
+        default = LinkProfile.from_dict(self.scenario.get("default", {}))
+        links = self.scenario.get("links", {})
+        for key in (f"{self.myself}->{player_id}", f"{self.myself}->*", f"*->{player_id}"):
+            if key in links:
+                return LinkProfile.from_dict(links[key], default)
+        return default
+
+    def plan(self, player_id, size: int) -> float:
+        """
+        Seconds to hold a packet of size bytes to the player before sending,
+        or None to drop it.
+        """
+        link = self._links.get(player_id)
+        if link is None:
+            return 0.0
+        with self.lock:
+            return link.plan(size, self.clock.time())
+
+    def get_delay(self, player_id) -> float:
+        """Base latency of the link to the player."""
+        link = self._links.get(player_id)
+        return link.profile.latency if link else 0
+
+    def stats(self) -> dict:
+        return {player_id: link.stats() for player_id, link in self._links.items()}
@@ -0,0 +1,97 @@
+from collections import deque
+
+"""
+NTP style estimates of how far a peer's clock is from ours.
+
+Every exchange of a request and its reply gives four timestamps: t1 when we
+sent the request and t4 when the reply arrived, on our clock, and t2 when
+the peer got the request and t3 when it replied, on theirs. Then
+
+    round trip  delay  = (t4 - t1) - (t3 - t2)
+    offset      theta  = ((t2 - t1) + (t3 - t4)) / 2
+
+where theta is how far the peer's clock is ahead of ours. theta is exact
+when the delays there and back are equal, and is off by at most half the
+round trip otherwise, so the exchange with the smallest round trip, which
+queued least along the way, gives the best estimate (NTP's clock filter).
+
+The same holds the other way around: paths that are slower one way than
+the other look like an offset of up to half the round trip. correction()
+still applies the offset however small it is, since leaving a real offset
+out is off by all of it while path asymmetry is off by at most accuracy().
+
+Clocks also run at slightly different rates. The drift is the slope of a
+line fitted through the offsets of the good exchanges, those not much slower
+than the best one, so an estimate stays usable long after it was made. A
+few noisy exchanges close together can fit any slope at all, so the drift is
+kept within MAX_DRIFT, the most NTP assumes a clock to be off by.
+"""
+
+# exchanges kept per peer
+OFFSET_WINDOW = 32
+# exchanges with a round trip at most this much longer than the best one are
+# used to fit the drift
+DRIFT_SLACK = 0.005
+# only fit the drift over exchanges at least this many seconds apart
+DRIFT_MIN_SPAN = 1.0
+# 500 parts per million
+MAX_DRIFT = 500e-6
+
+
+class OffsetEstimator:
+
+    def __init__(self, window: int = OFFSET_WINDOW):
+        # (t4, offset, round trip) of the latest exchanges
+        self._samples = deque(maxlen=window)
+        self.drift = 0.0
+
+    def add(self, t1: float, t2: float, t3: float, t4: float):
+        rtt = (t4 - t1) - (t3 - t2)
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        self._samples.append((t4, offset, rtt))
+        self._fit_drift()
+
+    def _best(self):
+        return min(self._samples, key=lambda sample: sample[2], default=None)
+
+    def _fit_drift(self):
+        best = self._best()
+        good = [sample for sample in self._samples if sample[2] <= best[2] + DRIFT_SLACK]
+        times = [sample[0] for sample in good]
+        if len(good) < 2 or max(times) - min(times) < DRIFT_MIN_SPAN:
+            self.drift = 0.0
+            return
+        # least squares slope of offset against time
+        mean_t = sum(times) / len(good)
+        mean_offset = sum(sample[1] for sample in good) / len(good)
+        drift = (sum((t - mean_t) * (offset - mean_offset) for t, offset, _ in good)
+                 / sum((t - mean_t) ** 2 for t in times))
+        self.drift = max(-MAX_DRIFT, min(MAX_DRIFT, drift))
+
+    def offset(self, now: float = None):
+        """How far the peer's clock is ahead of ours at now, None before any exchange."""
+        best = self._best()
+        if best is None:
+            return None
+        if now is None:
+            return best[1]
+        return best[1] + self.drift * (now - best[0])
+
+    def correction(self, now: float = None) -> float:
+        """The offset at now, 0 before any exchange."""
+        offset = self.offset(now)
+        return offset or 0.0
+
+    def rtt(self):
+        """Round trip time of the best exchange."""
+        best = self._best()
+        return best[2] if best else None
+
+    def accuracy(self):
+        """The most the offset can be off by, half the best round trip."""
+        best = self._best()
+        return best[2] / 2 if best else None
+
+    def stats(self) -> dict:
+        return {"offset": self.offset(), "drift": self.drift, "rtt": self.rtt(),
+                "accuracy": self.accuracy(), "samples": len(self._samples)}
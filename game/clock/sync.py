@@ -1,15 +1,27 @@
 import functools
-import time
+import statistics
 import socket
 import json
 import logging
+from collections import deque
 from random import randrange
 
+from game.clock.offset import OffsetEstimator
 from game.models.player import Player
 from game.lobby.tracker import Tracker
 from game.transport.packet import UpdateLeader, Packet
 # TODO Modify Sync Function Based on New FSM
 
+# probes sent to every peer per round when probing, see probe_peers in
+# BaseTransport
+PROBE_SAMPLES = 4
+# seconds between them, so they do not all queue up behind one another
+PROBE_INTERVAL = 0.05
+# round trip times kept per peer for filtering
+PROBE_WINDOW = 16
+# delays measured off echoes kept per peer, the least of them is used
+DELAY_WINDOW = 8
+
 
 class Sync:
     """
@@ -20,11 +32,33 @@ class Sync:
         print("Sync Initiated")
         self.myself = myself
         self._delay_dict = {}
+        # latest delay measured to each peer, kept across rounds
+        self._known_delays = {}
         self.logger = logger
 
         self.leader_idx = 0
         self.leader_list = tracker.get_leader_list()
 
+        # probing: round trip times to each peer, newest last, the probe
+        # replies received per round and every player's row of the rtt
+        # matrix as (round, row)
+        self._rtt_samples: dict[str, deque] = {}
+        self._probe_replies: dict[int, dict] = {}
+        self._rtt_rows: dict[str, tuple] = {}
+
+        # how far each peer's clock is from ours
+        self._offsets: dict[str, OffsetEstimator] = {}
+
+        # once set, delays follow what echoes on ordinary traffic measure
+        self.refreshing = False
+        self._delay_samples: dict[str, deque] = {}
+
+        # wait times worked out from the delays, redone only when a delay
+        # changes, and a version bumped every time so whatever is worked out
+        # from the delays elsewhere can be cached against it
+        self._wait_times = None
+        self.version = 0
+
     def next_leader(self):
         if self.leader_idx < len(self.leader_list) - 1:
             self.leader_idx += 1
@@ -38,32 +72,169 @@ class Sync:
         return self.myself == self.leader_list[self.leader_idx]
 
     def update_delay_dict(self, pkt: Packet):
-        peer_player_id = pkt.get_player().get_name()
-        self._delay_dict[peer_player_id] = pkt.get_data()
+        self.set_delay(pkt.get_player().get_name(), pkt.get_data())
 
-    def done(self):
-        return len(self._delay_dict) == len(self.leader_list) - 1
+    def set_delay(self, player_id, delay: float):
+        """The delay of the packets we send to the player."""
+        if self._delay_dict.get(player_id) == delay:
+            return
+        self._delay_dict[player_id] = delay
+        self._known_delays[player_id] = delay
+        self._delays_changed()
+
+    def _delays_changed(self):
+        self.version += 1
+        wait_times = self._compute_wait_times()
+        if wait_times == self._wait_times:
+            return
+        self._wait_times = wait_times
+        temporary_logger_dict = json.dumps({"Logger Name": "WAIT TABLE", "Player Name": self.myself, "Version": self.version,
+                                            "Delays": self._delay_dict, "Logging Data": wait_times})
+        self.logger.info(f'{temporary_logger_dict}')
+
+    def get_delay(self, player_id, default=None) -> float:
+        """Last delay measured to the player, default if there is none yet."""
+        return self._known_delays.get(player_id, default)
 
-    def add_delay(self, player_id):
+    def one_way_delay(self, pkt: Packet) -> float:
         """
-        Adds a random delay at first and second hops of the measure delay.
-        This value returned by this function + measured difference will serve
-        as the sample RTT on the game client.
+        Delay from the sender to us, in seconds, measured from the packet's
+        send timestamp to the time it was read off our socket. The send
+        timestamp is on the sender's clock, so it is moved to ours by the
+        offset estimated for them.
         """
-        if len(self._delay_dict) != len(self.leader_list) - 1:
-            return
-        else:
-            delay = self._delay_dict[player_id]
-            time.sleep(delay)
-        return
+        estimator = self._offsets.get(pkt.get_player().get_name())
+        correction = estimator.correction(pkt.get_received_at()) if estimator else 0
+        return pkt.get_received_at() - pkt.get_created_at() + correction
+
+    def add_exchange(self, reply: Packet) -> tuple:
+        """
+        Record the four timestamps of a request and the reply to it, whose
+        data echoes when the request was sent and when it arrived. Returns
+        the one way delays there and back, with the peer's timestamps moved
+        to our clock by the offset estimated for them.
+        """
+        data = reply.get_data()
+        return self.add_timestamps(reply.get_player().get_name(), data["sent"], data["received"],
+                                   reply.get_created_at(), reply.get_received_at())
+
+    def add_timestamps(self, peer_id, t1: float, t2: float, t3: float, t4: float) -> tuple:
+        """The four timestamps of an exchange with the peer, see add_exchange."""
+        estimator = self._offsets.get(peer_id)
+        if estimator is None:
+            estimator = self._offsets.setdefault(peer_id, OffsetEstimator())
+        estimator.add(t1, t2, t3, t4)
+        correction = estimator.correction(t4)
+        return t2 - t1 - correction, t4 - t3 + correction
+
+    def add_echo(self, peer_id, t1: float, t2: float, t3: float, t4: float):
+        """
+        An exchange made of a packet we sent the peer and the one that
+        echoed it. Once refreshing, the delay to the peer is the least of
+        the last DELAY_WINDOW measured this way, so it follows the network
+        without the sync phase.
+        """
+        delay_there, delay_back = self.add_timestamps(peer_id, t1, t2, t3, t4)
+        self.add_rtt_sample(peer_id, delay_there + delay_back)
+        samples = self._delay_samples.get(peer_id)
+        if samples is None:
+            samples = self._delay_samples.setdefault(peer_id, deque(maxlen=DELAY_WINDOW))
+        samples.append(delay_there)
+        if self.refreshing:
+            self.set_delay(peer_id, min(samples))
+
+    def get_offset(self, player_id, now: float = None):
+        """
+        How far the player's clock is ahead of ours at now, None if we never
+        exchanged timestamps with them.
+        """
+        estimator = self._offsets.get(player_id)
+        return estimator.offset(now) if estimator else None
+
+    def log_offsets(self):
+        temporary_logger_dict = json.dumps({"Logger Name": "CLOCK OFFSETS", "Player Name": self.myself, "Logging Data": {
+            player_id: estimator.stats() for player_id, estimator in self._offsets.items()}})
+        self.logger.info(f'{temporary_logger_dict}')
+
+    def add_rtt_sample(self, player_id, rtt: float, round_number=None):
+        """A round trip time to the player, from a probe sent in round_number if given."""
+        samples = self._rtt_samples.get(player_id)
+        if samples is None:
+            samples = self._rtt_samples.setdefault(player_id, deque(maxlen=PROBE_WINDOW))
+        samples.append(rtt)
+        if round_number is not None:
+            replies = self._probe_replies.setdefault(round_number, {})
+            replies[player_id] = replies.get(player_id, 0) + 1
+
+    def get_rtt(self, player_id, how: str = "min"):
+        """
+        Round trip time to the player over the last PROBE_WINDOW probes,
+        None if we never probed them. "min" takes the fastest probe, which
+        waited least in queues along the way, "median" is steadier when
+        the fastest ones are flukes.
+        """
+        samples = self._rtt_samples.get(player_id)
+        if not samples:
+            return None
+        return min(samples) if how == "min" else statistics.median(samples)
+
+    def probing_done(self, round_number) -> bool:
+        replies = self._probe_replies.get(round_number, {})
+        return all(replies.get(player_id, 0) >= PROBE_SAMPLES
+                   for player_id in self.leader_list if player_id != self.myself)
+
+    def rtt_row(self, how: str = "min") -> dict:
+        """Our round trip times to every peer we probed."""
+        return {player_id: self.get_rtt(player_id, how) for player_id in self._rtt_samples}
+
+    def update_rtt_row(self, player_id, row: dict, round_number):
+        """A row of the rtt matrix, as measured by that player."""
+        self._rtt_rows[player_id] = (round_number, row)
+
+    def matrix_done(self, round_number) -> bool:
+        """Whether every other player sent us their row for this round."""
+        return all(self._rtt_rows.get(player_id, (None,))[0] == round_number
+                   for player_id in self.leader_list if player_id != self.myself)
+
+    def get_rtt_matrix(self, how: str = "min") -> dict:
+        """
+        Round trip time between every pair of players, as
+        matrix[a][b], from a's measurements. Our own row is always up to
+        date, the others are as of the last row each player sent.
+        """
+        matrix = {player_id: row for player_id, (_, row) in self._rtt_rows.items()}
+        matrix[self.myself] = self.rtt_row(how)
+        return matrix
+
+    def get_pair_rtt(self, a, b, how: str = "min"):
+        """Round trip time between players a and b, measured by either, or None."""
+        matrix = self.get_rtt_matrix(how)
+        rtt = matrix.get(a, {}).get(b)
+        return rtt if rtt is not None else matrix.get(b, {}).get(a)
+
+    def delays_from_rtt(self, how: str = "min"):
+        """Use half of each round trip time we probed as the delay to that peer."""
+        for player_id, rtt in self.rtt_row(how).items():
+            self._delay_dict[player_id] = rtt / 2
+            self._known_delays[player_id] = rtt / 2
+        self._delays_changed()
+
+    def done(self):
+        return len(self._delay_dict) == len(self.leader_list) - 1
 
     def get_ordered_delays(self):
         return sorted(self._delay_dict.items(), key=lambda x:x[1], reverse=True)
     
     def get_wait_times(self):
-        self.logger.info(f"DELAYLIST\n{self.myself} | Actual delays: {self._delay_dict.items()}")
+        """
+        How long to hold a broadcast back for each player so it reaches
+        everyone at once, None until we have a delay to every player. This
+        is the table kept by Sync, not a copy, so it must not be changed.
+        """
+        return self._wait_times
+
+    def _compute_wait_times(self):
         ordered_delays = self.get_ordered_delays()
-        self.logger.info(f"DELAYLIST_ORDERED\n{self.myself} | Ordered delays: {self._delay_dict.items()}")
         wait_times = {}
         if len(ordered_delays) == len(self.leader_list) - 1:
             for i in range(len(ordered_delays)-1):
@@ -78,3 +249,4 @@ class Sync:
     def reset_sync(self):
         self._delay_dict = {}
         self.leader_idx = 0
+        self._delays_changed()
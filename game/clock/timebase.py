@@ -0,0 +1,115 @@
+import heapq
+import itertools
+import logging
+import time
+
+from game.transport.scheduler import ScheduledCall, SendScheduler
+
+"""
+Clocks tell the game what time it is and run callbacks at a given time.
+Everything that needs the time is handed one, so the same game can run in
+real time or in simulated time.
+
+RealTimeClock is the wall clock, with callbacks run by a SendScheduler
+thread. SimulatedClock is a discrete event simulation: time only moves
+when run() takes the next callback off its queue, so a game runs as fast
+as the CPU allows and the same inputs always give the same timings.
+SkewedClock is another clock as read by a machine whose clock is off, to
+emulate clock skew between players.
+"""
+
+
+class RealTimeClock:
+
+    def __init__(self, logger: logging.Logger = None):
+        self.logger = logger or logging.getLogger(__name__)
+        self._scheduler = None
+
+    def time(self) -> float:
+        return time.time()
+
+    def call_at(self, deadline: float, fn) -> ScheduledCall:
+        if self._scheduler is None:
+            # only start a thread for clocks that are actually used for timers
+            self._scheduler = SendScheduler(self.logger)
+        return self._scheduler.call_at(deadline, fn)
+
+    def call_later(self, delay: float, fn) -> ScheduledCall:
+        return self.call_at(self.time() + delay, fn)
+
+    def shutdown(self):
+        if self._scheduler:
+            self._scheduler.shutdown()
+
+
+class SimulatedClock:
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self._heap = []
+        # tie breaker so callbacks due at the same time run in the order they were added
+        self._counter = itertools.count()
+
+    def time(self) -> float:
+        return self.now
+
+    def call_at(self, deadline: float, fn) -> ScheduledCall:
+        call = ScheduledCall(max(deadline, self.now), fn)
+        heapq.heappush(self._heap, (call.deadline, next(self._counter), call))
+        return call
+
+    def call_later(self, delay: float, fn) -> ScheduledCall:
+        return self.call_at(self.now + delay, fn)
+
+    def run(self, until: float = None, stop=None) -> bool:
+        """
+        Run callbacks in time order until stop() is true, there is nothing
+        left to run or the next callback is after until. Returns whether
+        stop() became true.
+        """
+        while self._heap:
+            if stop and stop():
+                return True
+            deadline, _, call = self._heap[0]
+            if until is not None and deadline > until:
+                self.now = until
+                return False
+            heapq.heappop(self._heap)
+            if call.cancelled:
+                continue
+            self.now = deadline
+            call.fn()
+        return bool(stop and stop())
+
+    def shutdown(self):
+        self._heap.clear()
+
+
+class SkewedClock:
+    """
+    A clock that reads offset seconds ahead of clock and runs drift faster,
+    e.g. 50e-6 for 50 ppm. Timers still fire at the right moment.
+    """
+
+    def __init__(self, clock, offset: float = 0.0, drift: float = 0.0):
+        self.clock = clock
+        self.offset = offset
+        self.drift = drift
+        self._start = clock.time()
+
+    def time(self) -> float:
+        now = self.clock.time()
+        return now + self.offset + self.drift * (now - self._start)
+
+    def base_time(self, t: float) -> float:
+        """What the underlying clock reads when this one reads t."""
+        return (t - self.offset + self.drift * self._start) / (1 + self.drift)
+
+    def call_at(self, deadline: float, fn) -> ScheduledCall:
+        return self.clock.call_at(self.base_time(deadline), fn)
+
+    def call_later(self, delay: float, fn) -> ScheduledCall:
+        return self.clock.call_later(delay / (1 + self.drift), fn)
+
+    def shutdown(self):
+        self.clock.shutdown()
@@ -3,6 +3,7 @@ from game.lobby.tracker import Tracker
 import json
 import keyboard
 from game.thread_manager import ThreadManager
+from game.transport.framing import FrameDecoder, encode_frame
 import threading
 import logging
 
@@ -16,7 +17,7 @@ class Lobby():
     def __init__(self, logger):
         self.game_started = False
         self.lobby_host_exited = False
-        self.chunksize = 1024
+        self.chunksize = 4096  # size of a single socket read
         self.logger = logger
 
         self.lock = threading.Lock()
@@ -84,12 +85,16 @@ class Lobby():
 
         self.send(self.lobby_register_pkt(), sock)
 
+        decoder = FrameDecoder(self.chunksize)
         try:
             while not self.game_started and not self.lobby_host_exited:
-                buf = sock.recv(1024)
-                if buf:
-                    self.handle_player(buf.decode(
-                        'utf-8').rstrip("\0"), sock)
+                try:
+                    frames = decoder.recv(sock)
+                except ConnectionError:
+                    self.lobby_host_exited = True
+                    break
+                for frame in frames:
+                    self.handle_player(frame.decode('utf-8'), sock)
             print("Exiting lobby, entering game")
             return None, self.tracker
         except KeyboardInterrupt:
@@ -213,18 +218,19 @@ class Lobby():
 
     # handler threads
     def thread_handler(self, connection):
+        decoder = FrameDecoder(self.chunksize)
         while not self.game_started:
             try:
-                buf = connection.recv(1024)
-                if buf:
-                    self.handle_host(buf.decode(
-                        'utf-8').rstrip("\0"), connection)
+                for frame in decoder.recv(connection):
+                    self.handle_host(frame.decode('utf-8'), connection)
+            except ConnectionError:
+                break
             except:
                 pass
 
     # helper method to send packets
     def send(self, packet: bytes, connection):
-        connection.sendall(packet.ljust(self.chunksize, b"\0"))
+        connection.sendall(encode_frame(packet))
 
     # packets
 
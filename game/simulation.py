@@ -0,0 +1,159 @@
+import functools
+import logging
+import random
+import threading
+import time
+
+from game.client import Client
+from game.clock.timebase import SimulatedClock
+from game.lobby.tracker import Tracker
+from game.transport.loopback import LoopbackNetwork, LoopbackTransport
+
+"""
+Play whole games in one process, with bots instead of people at the
+keyboard and LoopbackTransports instead of sockets. Used for regression and
+performance testing, see benchmarks/simulate.py.
+
+Games run in simulated time by default: a single thread steps every player
+from a SimulatedClock, so a game takes as long as it takes to compute and
+the same seed always plays out the same way.
+"""
+
+
+class BotClient(Client):
+    """
+    A Client that grabs a random free seat after a random reaction time
+    instead of listening to the keyboard.
+    """
+
+    def __init__(self, *args, rng: random.Random = None, reaction_time: float = 0.3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rng = rng or random.Random()
+        self.reaction_time = reaction_time
+        self._keypress_timer = None
+
+    def _seats(self, letters: list, count: int) -> list:
+        # bots press no keys, so games can be larger than the keyboard has
+        # seats for: numbered seats follow the keys
+        return (letters + [f"S{i}" for i in range(len(letters) + 1, count + 1)])[:count]
+
+    def _add_hotkeys(self):
+        free_seats = [seat for seat, player in self._round_inputs.items()
+                      if player is None]
+        if not free_seats:
+            return
+        seat = self.rng.choice(free_seats)
+        self._keypress_timer = self._transportLayer._call_later(
+            self.rng.uniform(0, self.reaction_time), lambda: self._insert_input(seat))
+
+    def _remove_hotkeys(self):
+        if self._keypress_timer:
+            self._keypress_timer.cancel()
+            self._keypress_timer = None
+
+
+class SimulatedGame:
+    """
+    Steps the clients of one game from a SimulatedClock instead of running
+    their loops in threads. A client is stepped when a packet arrives for
+    it and when its next frame or countdown is due.
+    """
+
+    def __init__(self, clients: list, network: LoopbackNetwork):
+        self.clock: SimulatedClock = network.clock
+        self.clients = {client._myself.get_name(): client for client in clients}
+        self._pending = {}
+        network.on_ready = lambda player_id: self.schedule(
+            player_id, self.clock.time())
+
+    def schedule(self, player_id, at: float):
+        """Step the player at time at, unless they are already due by then."""
+        pending = self._pending.get(player_id)
+        if pending is not None:
+            if pending.deadline <= at:
+                return
+            pending.cancel()
+        self._pending[player_id] = self.clock.call_at(
+            at, functools.partial(self._step, player_id))
+
+    def _step(self, player_id):
+        del self._pending[player_id]
+        client = self.clients[player_id]
+        if client.game_over:
+            return
+        client.step()
+        if not client.game_over:
+            wakeup = client.next_wakeup()
+            if client.clock is not self.clock:
+                # the client's clock is skewed from the network's, wake
+                # it a microsecond late so rounding never has it wake up
+                # just before it is due, over and over
+                wakeup = client.clock.base_time(wakeup) + 1e-6
+            self.schedule(player_id, wakeup)
+
+    def run(self, timeout: float) -> bool:
+        """Play for up to timeout simulated seconds, returns whether the game ended."""
+        for player_id in self.clients:
+            self.schedule(player_id, self.clock.time())
+        return self.clock.run(until=self.clock.time() + timeout,
+                              stop=lambda: all(client.game_over for client in self.clients.values()))
+
+
+def run_game(num_players: int, codec: str = "binary", scenario: dict = None, seed=None, timeout: float = 300, simulated: bool = True, logger: logging.Logger = None, relay_fanout: int = 0, sync_mode: str = "continuous") -> dict:
+    """
+    Play one game between num_players bots over loopback, in simulated time
+    unless simulated is False, broadcasting through a relay tree if
+    relay_fanout is set and syncing the sync_mode way. Returns whether it finished within timeout
+    seconds, how long it took in game time and wall clock time, the winner
+    and the number of rounds played.
+    """
+    logger = logger or logging.getLogger("simulation")
+    rng = random.Random(seed)
+    names = [f"p{i}" for i in range(num_players)]
+    # loopback needs no addresses, but the tracker and client expect them
+    tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(names)}
+
+    # seed the network emulator too so the whole game can be replayed
+    scenario = dict(scenario or {})
+    scenario.setdefault("seed", rng.randrange(1 << 32))
+
+    network = LoopbackNetwork(logger, SimulatedClock() if simulated else None)
+    clients = []
+    for name in names:
+        tracker = Tracker(dict(tracker_list))
+        transport = LoopbackTransport(
+            name, network, logger, tracker, codec, scenario, relay_fanout)
+        clients.append(BotClient(name, tracker, logger, transport=transport,
+                                 rng=random.Random(rng.random()),
+                                 sync_mode=sync_mode))
+
+    # the first player plays the part of the lobby host, who starts out as
+    # the frame sync master
+    host = clients[0]._myself
+    clients[0]._frameSync.update_master(host, host)
+
+    start = time.time()
+    game_start = network.clock.time()
+    if simulated:
+        SimulatedGame(clients, network).run(timeout)
+    else:
+        threads = [threading.Thread(target=client.start, daemon=True)
+                   for client in clients]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(max(0, start + timeout - time.time()))
+    elapsed = network.clock.time() - game_start
+    wall_time = time.time() - start
+    network.shutdown()
+
+    winners = {list(client._players)[0] for client in clients
+               if len(client._players) == 1}
+    return {
+        "players": num_players,
+        "finished": all(client.game_over for client in clients),
+        "elapsed": elapsed,
+        "wall_time": wall_time,
+        "winner": winners.pop() if len(winners) == 1 else None,
+        "rounds": max(client.round_number for client in clients),
+    }
@@ -0,0 +1,271 @@
+import asyncio
+import collections
+import json
+import logging
+import socket
+import threading
+
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.transport.base import BaseTransport
+from game.transport.framing import FrameDecoder, encode_frame
+from game.transport.packet import ConnectionRequest, Packet
+
+"""
+AsyncTransport is an alternative to Transport that runs all network IO on a
+single asyncio event loop instead of a thread per connection. The loop runs
+in one background thread; send, sendall and receive can be called from the
+game loop exactly as with Transport.
+"""
+
+
+class StreamConnection:
+    """A TCP stream to a peer with its own send queue, drained by a writer task."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.send_queue = asyncio.Queue()
+        # frames held back before they go on the send queue, in the order
+        # they were sent, and the loop time the last of them is due
+        self.held = collections.deque()
+        self.held_until = 0.0
+        self.reader_task: asyncio.Task = None
+        self.writer_task: asyncio.Task = None
+
+    def close(self):
+        self.reader_task.cancel()
+        self.writer_task.cancel()
+        self.writer.close()
+
+
+class LoopTimer:
+    """
+    A timer scheduled on the event loop which, like threading.Timer, can be
+    cancelled from any thread.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, delay: float, fn):
+        self._loop = loop
+        self._handle = None
+        self._cancelled = False
+        loop.call_soon_threadsafe(self._schedule, delay, fn)
+
+    def _schedule(self, delay, fn):
+        if not self._cancelled:
+            self._handle = self._loop.call_later(delay, fn)
+
+    def cancel(self):
+        self._cancelled = True
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._cancel)
+
+    def _cancel(self):
+        if self._handle:
+            self._handle.cancel()
+
+
+class AsyncTransport(BaseTransport):
+
+    def __init__(self, myself: str, port, thread_manager, logger: logging.Logger, tracker: Tracker, host_socket: socket.socket = None, codec: str = "binary", scenario: dict = None, relay_fanout: int = 0):
+        super().__init__(myself, logger, tracker, codec, scenario,
+                         relay_fanout=relay_fanout)
+        self.thread_mgr = thread_manager
+
+        # asyncio only keeps weak references to streams and tasks, so hold
+        # on to every open stream, including ones not in the connection pool
+        self._streams: set[StreamConnection] = set()
+        # frames scheduled on the loop but not yet in a send queue
+        self._delayed = 0
+
+        self.loop = asyncio.new_event_loop()
+        t = threading.Thread(target=self.loop.run_forever, daemon=True)
+        t.start()
+        self.thread_mgr.add_thread(t)
+
+        # start my server, then connect to everyone in the background
+        asyncio.run_coroutine_threadsafe(
+            self._start(port, host_socket), self.loop).result()
+        self.logger.debug("Completely initialized async transport...")
+
+    async def _start(self, port, host_socket):
+        if host_socket:
+            self.server = await asyncio.start_server(self._accept, sock=host_socket)
+        else:
+            self.server = await asyncio.start_server(
+                self._accept, "0.0.0.0", port, backlog=self.NUM_PLAYERS)
+        self._connecting = self.loop.create_task(self.make_connections())
+
+    def _open(self, reader, writer) -> StreamConnection:
+        conn = StreamConnection(reader, writer)
+        conn.reader_task = self.loop.create_task(self.handle_incoming(conn))
+        conn.writer_task = self.loop.create_task(self._drain_send_queue(conn))
+        self._streams.add(conn)
+        return conn
+
+    async def _accept(self, reader, writer):
+        self._open(reader, writer)
+
+    async def make_connections(self):
+        """
+        Attempt to make outgoing connections to the players we dial, concurrently
+        """
+        await asyncio.gather(*[self._connect(player_id)
+                               for player_id in self.tracker.get_players()
+                               if player_id != self.myself and self.should_dial(player_id)])
+
+    async def _connect(self, player_id):
+        ip, port = self.tracker.get_ip_port(player_id)
+        if ip is None or port is None:
+            return
+        for attempt in range(self.CONNECT_ATTEMPTS):
+            if player_id in self._connection_pool:
+                return
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(ip, port), self.CONNECT_TIMEOUT)
+                break
+            except (TimeoutError, OSError):
+                # the player's server may not be up yet
+                await asyncio.sleep(self.retry_delay(attempt))
+        else:
+            self.logger.warning(
+                f"{self.myself} gave up connecting to {player_id} after {self.CONNECT_ATTEMPTS} attempts")
+            return
+        conn = self._open(reader, writer)
+        # send a player my conn request
+        packet = ConnectionRequest(Player(self.myself), self.codecs.names())
+        conn.send_queue.put_nowait(
+            encode_frame(self.encode(packet, player_id)))
+        self.logger.info(
+            f"{self.myself} sending connection request to {player_id} at {self.clock.time()}")
+
+    async def handle_incoming(self, conn: StreamConnection):
+        """
+        Handle incoming data from a connection.
+        """
+        decoder = FrameDecoder(self.chunksize)
+        try:
+            while True:
+                data = await conn.reader.read(self.chunksize)
+                if not data:
+                    break
+                # timestamp at the socket read, not when the game loop
+                # gets round to draining the queue
+                received_at = self.clock.time()
+                for frame in decoder.feed(data):
+                    self.handle_frame(frame, conn, received_at)
+        except (OSError, ValueError):
+            pass
+        finally:
+            # the peer has gone, stop writing to it too
+            self._streams.discard(conn)
+            conn.writer_task.cancel()
+
+    async def _drain_send_queue(self, conn: StreamConnection):
+        try:
+            while True:
+                frame = await conn.send_queue.get()
+                conn.writer.write(frame)
+                await conn.writer.drain()
+        except OSError:
+            pass
+
+    def _enqueue(self, conn: StreamConnection, frame: bytes, delay: float):
+        """Runs on the loop: queue the frame for sending after delay seconds."""
+        self._hold(conn, frame, self.loop.time() + delay)
+
+    def _hold(self, conn: StreamConnection, frame: bytes, when: float):
+        """
+        Runs on the loop: queue the frame for sending at loop time when, but
+        not before the frames held back for the peer already, so a later
+        send with a shorter wait never overtakes an earlier one.
+        """
+        if not conn.held and when <= self.loop.time():
+            conn.send_queue.put_nowait(frame)
+            return
+        conn.held_until = max(when, conn.held_until) if conn.held else when
+        conn.held.append(frame)
+        self._delayed += 1
+        self.loop.call_at(conn.held_until, self._release, conn)
+
+    def _release(self, conn: StreamConnection):
+        # the loop does not keep timers due at the same time in order, so
+        # whichever fires releases the frame held back longest
+        self._delayed -= 1
+        conn.send_queue.put_nowait(conn.held.popleft())
+
+    def is_reachable(self, player_id) -> bool:
+        # the reader drops the stream once the player hangs up
+        return self._connection_pool.get(player_id) in self._streams
+
+    def send(self, packet: Packet, player_id, wait: float = 0):
+        conn = self._connection_pool.get(player_id)
+        if conn is None:
+            self.logger.warning(f"No connection to {player_id}, dropping packet")
+            return
+        frame = encode_frame(self.encode(packet, player_id))
+        delay = self.netem.plan(player_id, len(frame))
+        if delay is None:
+            self.logger.debug(f"Emulated loss of packet to {player_id}")
+            return
+        self.loop.call_soon_threadsafe(
+            self._enqueue, conn, frame, wait + delay)
+
+    def sendall(self, packet: Packet, use_sync: bool = True):
+        """
+        Send the packet to every peer, each released on the loop at its own
+        deadline: now, plus the sync wait for that peer, plus the emulated
+        network delay to it.
+        """
+        if self.should_relay(packet):
+            self.relay_broadcast(packet)
+            return
+        wait_dict = self.sync.get_wait_times() if use_sync else None
+        now = self.clock.time()
+        sends = []
+        for player_id, conn in list(self._connection_pool.items()):
+            wait = wait_dict.get(player_id, 0) if wait_dict else 0
+            frame = encode_frame(self.encode(packet, player_id, wait))
+            delay = self.netem.plan(player_id, len(frame))
+            if delay is None:
+                self.logger.debug(f"Emulated loss of packet to {player_id}")
+                continue
+            sends.append((conn, frame, wait + delay))
+            if packet.get_packet_type() == "action":
+                temporary_logger_dict = json.dumps({"Logger Name": "ACTION PACKET INFO-SEND", "Sender": self.myself, "SEND_TIME": now + wait, "DATA": packet.get_data(), "DELAY": wait, "TO": player_id})
+                self.logger.info(f'{temporary_logger_dict}')
+        self.loop.call_soon_threadsafe(self._fan_out, now, sends)
+
+    def _fan_out(self, sent_at: float, sends: list):
+        """Runs on the loop: schedule every send against the same start time."""
+        # time spent getting onto the loop counts towards every peer's wait
+        start = self.loop.time() - (self.clock.time() - sent_at)
+        for conn, frame, delay in sends:
+            self._hold(conn, frame, start + delay)
+
+    async def _close(self):
+        # let packets that are still delayed or queued go out first, the
+        # last thing we send is usually EndGame
+        deadline = self.loop.time() + self.SHUTDOWN_TIMEOUT
+        while self.loop.time() < deadline and (
+                self._delayed or any(not conn.send_queue.empty() for conn in self._streams)):
+            await asyncio.sleep(0.01)
+
+        self.server.close()
+        self._connecting.cancel()
+        tasks = [self._connecting]
+        for conn in list(self._streams):
+            conn.close()
+            tasks += [conn.reader_task, conn.writer_task]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def shutdown(self):
+        self.stop_timers()
+        self.log_netem_stats()
+        self.thread_mgr.shutdown()
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _call_later(self, delay: float, fn):
+        return LoopTimer(self.loop, delay, fn)
@@ -0,0 +1,527 @@
+import base64
+import copy
+import itertools
+import json
+import logging
+import math
+import threading
+import zlib
+
+from game.clock.netem import NetworkEmulator, skew_clock
+from game.clock.sync import PROBE_INTERVAL, PROBE_SAMPLES, Sync
+from game.clock.timebase import RealTimeClock
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.transport.codec import CodecRegistry, JsonCodec, PlayerTable
+from game.transport.inbox import Inbox
+from game.transport.packet import ConnectionEstab, ConnectionResumed, Packet, Probe, Relay, SyncReq
+from game.transport.replay import ReplayWindow
+
+"""
+BaseTransport holds everything a transport does that does not depend on how
+bytes get on and off the network: encoding, sequence numbers, duplicate
+detection, the handshake, the receive queue and sync.
+
+Subclasses provide the IO by implementing send, sendall, shutdown and
+_call_later, and by passing every frame they read to handle_frame.
+Transports that can reconnect to a peer also implement resume_session.
+
+Every numbered packet echoes the last one we got from its receiver: its
+sequence number, when it arrived and when the echo leaves. With the time we
+sent the echoed packet that is an NTP exchange, so Sync can keep delays and
+clock offsets up to date from the game's own traffic.
+
+With a relay_fanout, broadcasts are not sent to every peer but passed down
+a relay tree: the sender sends to at most relay_fanout of the nearest
+players, each of whom passes it on to a share of the rest, and so on. Every
+hop splits up the players below it by its own measured delays, so nobody
+needs to agree on the whole tree. Broadcasts are numbered per sender and
+deduplicated by (sender, number), so a broadcast is handed over only once
+however it arrives. Players we cannot reach, such as those who have left,
+are left out of the tree, and a relay that has gone since the tree was
+worked out is skipped by sending to its players directly.
+"""
+
+# always sent as json, so they can be read before a codec is agreed
+HANDSHAKE_TYPES = ("connection_req", "connection_estab",
+                   "connection_resume", "connection_resumed")
+# sent outside of the numbered stream of packets they resume, so they are
+# not numbered and skip the replay window
+RESUME_TYPES = ("connection_resume", "connection_resumed")
+# send times kept per peer, for the packets they have yet to echo
+DEPARTURES_KEPT = 256
+# the results of a round and the end of the game, sent straight to every
+# peer even with a relay_fanout: players leave once the game is over, and a
+# relay that has left would take its whole subtree's copy with it
+UNRELAYED_TYPES = ("sat_down", "end_game")
+
+
+class BaseTransport:
+    # how long shutdown waits for delayed and queued packets to go out
+    SHUTDOWN_TIMEOUT = 5
+
+    # dialling a peer: a timeout per attempt, then retries backing off
+    # exponentially from CONNECT_RETRY_BASE up to CONNECT_RETRY_MAX seconds
+    CONNECT_TIMEOUT = 2
+    CONNECT_RETRY_BASE = 0.05
+    CONNECT_RETRY_MAX = 2
+    CONNECT_ATTEMPTS = 12
+
+    # whether packets go over a reliable, ordered stream like TCP, which is
+    # how the network emulator treats lost packets
+    STREAM = True
+
+    def __init__(self, myself: str, logger: logging.Logger, tracker: Tracker, codec: str = "binary", scenario: dict = None, clock=None, relay_fanout: int = 0):
+        self.myself = myself
+        network_clock = clock or RealTimeClock(logger)
+        # the time on this player's machine, which the scenario can skew
+        self.clock = skew_clock(network_clock, scenario, myself)
+        self.my_player = Player(name=self.myself)
+        self.queue = Inbox()
+        self.chunksize = 4096  # size of a single socket read
+        self.NUM_PLAYERS = tracker.get_player_count()
+        self.lock = threading.Lock()
+        self.logger = logger
+
+        self.tracker = tracker
+        self._connection_pool = {}
+        # set once we are connected to every other player
+        self.ready = threading.Event()
+
+        # codec used to send to each peer, agreed during the handshake
+        self.players = PlayerTable(tracker.get_players())
+        self.codecs = CodecRegistry(codec, self.players)
+        self._peer_codecs: dict[str, str] = {}
+
+        self.sync = Sync(myself=self.myself,
+                         tracker=self.tracker, logger=self.logger)
+        self.pre_game_sync = True
+        self.is_sync_completed = False
+
+        # emulated network conditions on the links to every peer
+        self.netem = NetworkEmulator(
+            myself, tracker, scenario, network_clock, self.STREAM)
+        self.sent_sync = False
+        self.sent_probes = False
+
+        self.sync_req_timers = {}
+
+        # sequence numbers are per link: one counter for every peer we send
+        # to and one replay window for every peer we receive from
+        self._send_seqs: dict[str, itertools.count] = {}
+        self._replay_windows: dict[str, ReplayWindow] = {}
+
+        # per peer, when each of our packets actually left, by sequence
+        # number, and the packet of theirs to echo next
+        self._departures: dict[str, dict] = {}
+        self._echoes: dict[str, tuple] = {}
+
+        # broadcasting through a relay tree, off with a fanout of 0
+        self.relay_fanout = relay_fanout
+        self._msg_ids = itertools.count(1)
+        self._relay_windows: dict[str, ReplayWindow] = {}
+        self._relay_lock = threading.Lock()
+        self.relayed = 0
+        # relay plans by (origin, players), for the sync version they were
+        # worked out at, swapped out whole when the delays change
+        self._relay_plans = (None, {})
+
+    # FOR TESTING PURPOSES ONLY
+    def get_connection_pool(self):
+        return self._connection_pool
+
+    def all_connected(self):
+        return len(self._connection_pool) == self.NUM_PLAYERS - 1
+
+    def is_reachable(self, player_id) -> bool:
+        """
+        Whether a packet sent to the player now would get to them, as far
+        as the transport can tell. Players who left are not.
+        """
+        return True
+
+    def should_relay(self, packet: Packet) -> bool:
+        """Whether sendall passes the packet down the relay tree."""
+        return bool(self.relay_fanout) and packet.get_packet_type() not in UNRELAYED_TYPES
+
+    def wait_until_connected(self, timeout: float = None) -> bool:
+        return self.ready.wait(timeout)
+
+    def should_dial(self, player_id) -> bool:
+        """
+        Only one of each pair of players opens the connection between them,
+        the one whose name sorts first, so there is never a second socket
+        from both dialling at once.
+        """
+        return self.myself < player_id
+
+    def retry_delay(self, attempt: int) -> float:
+        return min(self.CONNECT_RETRY_BASE * 2 ** attempt, self.CONNECT_RETRY_MAX)
+
+    def _add_connection(self, player_name, connection):
+        """Call with self.lock held."""
+        if not player_name in self._connection_pool:
+            self._connection_pool[player_name] = connection
+            if self.all_connected():
+                self.ready.set()
+
+    def send(self, packet: Packet, player_id):
+        raise NotImplementedError
+
+    def sendall(self, packet: Packet, use_sync: bool = True):
+        raise NotImplementedError
+
+    def shutdown(self):
+        raise NotImplementedError
+
+    def _call_later(self, delay: float, fn):
+        """Call fn after delay seconds. Returns a handle with a cancel method."""
+        raise NotImplementedError
+
+    def encode(self, packet: Packet, player_id, wait: float = 0) -> bytes:
+        """
+        Encode a packet into a frame payload for the player, see stamp and
+        encode_stamped.
+        """
+        return self.encode_stamped(self.stamp(packet, player_id, wait), player_id)
+
+    def stamp(self, packet: Packet, player_id, wait: float = 0) -> Packet:
+        """
+        A copy of the packet as it goes to the player: stamped with the time
+        it was sent unless it already has one, its sequence number on the
+        link and an echo. wait is how long the packet is held back before it
+        actually leaves, as with a sync wait. The packet itself is left
+        alone, as it may be going to other players from other threads at the
+        same time.
+        """
+        packet = copy.copy(packet)
+        now = self.clock.time()
+        if packet.createdAt is None:
+            packet.createdAt = now
+        packet.seq = 0 if packet.get_packet_type() in RESUME_TYPES else self._next_seq(player_id)
+        packet.echo = None
+        if packet.seq:
+            departure = now + wait
+            departures = self._departures.get(player_id)
+            if departures is None:
+                departures = self._departures.setdefault(player_id, {})
+            departures[packet.seq] = departure
+            departures.pop(packet.seq - DEPARTURES_KEPT, None)
+            echo = self._echoes.pop(player_id, None)
+            if echo:
+                packet.echo = [echo[0], echo[1], departure]
+        return packet
+
+    def encode_stamped(self, packet: Packet, player_id) -> bytes:
+        """
+        Encode a packet returned by stamp using the codec agreed with the
+        player. Handshake packets are always sent as json.
+        """
+        if packet.get_packet_type() in HANDSHAKE_TYPES:
+            codec = self.codecs.get(JsonCodec.name)
+        else:
+            codec = self.codecs.get(
+                self._peer_codecs.get(player_id, JsonCodec.name))
+        return codec.encode(packet, packet.seq)
+
+    def _next_seq(self, player_id) -> int:
+        counter = self._send_seqs.get(player_id)
+        if counter is None:
+            counter = self._send_seqs.setdefault(player_id, itertools.count(1))
+        return next(counter)
+
+    def received_state(self, player_id) -> list:
+        """What we have received from the player, as [highest seq, replay window bitmap]."""
+        window = self._replay_windows.get(player_id)
+        if window is None:
+            return [0, 0]
+        return [window.highest, window.bitmap]
+
+    def log_netem_stats(self):
+        temporary_logger_dict = json.dumps({"Logger Name": "NETEM INFO", "Sender": self.myself, "SEED": self.netem.seed, "LINKS": self.netem.stats()})
+        self.logger.info(f'{temporary_logger_dict}')
+
+    def get_duplicate_count(self) -> int:
+        """Number of packets dropped as duplicates or replays."""
+        windows = list(self._replay_windows.values()) + list(self._relay_windows.values())
+        return sum(window.dropped() for window in windows)
+
+    def receive(self, timeout: float = None) -> Packet:
+        """
+        Drain the queue when we are ready to handle data.
+        With a timeout, block for up to timeout seconds for a packet.
+        """
+        packets = self.receive_many(1, timeout)
+        if packets:
+            return packets[0]
+
+    def receive_many(self, max_n: int = None, timeout: float = None) -> list:
+        """
+        Drain up to max_n packets (all of them by default) in one go, in
+        arrival order. Each packet carries the time it was read off the
+        socket in get_received_at().
+        With a timeout, block for up to timeout seconds for a packet.
+        """
+        packets = self.queue.get_many(max_n, timeout)
+        for packet in packets:
+            if packet.echo:
+                self._handle_echo(packet)
+        if packets:
+            rtts = [packet.get_received_at() - packet.get_created_at()
+                    for packet in packets]
+            length = sum(len(packet) for packet in packets)
+            mean_rtt = sum(rtts) / len(rtts)
+            throughput = length / mean_rtt if mean_rtt > 0 else 0
+            self.logger.info(
+                f"PACKET_INFO\nCount: {len(packets)} | Length: {length} | Packet Types: {[packet.get_packet_type() for packet in packets]} | Mean RTT: {mean_rtt} | Throughput: {throughput}")
+        return packets
+
+    def _handle_echo(self, packet: Packet):
+        peer_id = packet.get_player().get_name()
+        seq, received_at, sent_at = packet.echo
+        departure = self._departures.get(peer_id, {}).pop(int(seq), None)
+        if departure is not None:
+            self.sync.add_echo(peer_id, departure, received_at,
+                               sent_at, packet.get_received_at())
+
+    def wakeup(self):
+        """Wake up a receive that is blocked waiting for a packet."""
+        self.queue.wakeup()
+
+    def check_if_peering_and_handle(self, packet: Packet, connection):
+        packet_type = packet.get_packet_type()
+        if packet_type == "connection_req":
+            self.handle_connection_request(packet, connection)
+            return True
+        elif packet_type == "connection_estab":
+            self.handle_connection_estab(packet, connection)
+            return True
+        elif packet_type == "connection_resume":
+            self.handle_connection_resume(packet, connection)
+            return True
+        elif packet_type == "connection_resumed":
+            self.handle_connection_resumed(packet, connection)
+            return True
+        else:
+            return False
+
+    def handle_connection_request(self, packet: Packet, connection):
+        player_name = packet.get_player().get_name()
+        codec = self.codecs.choose(packet.get_data())
+        self.lock.acquire()
+        # add player to connection pool
+        self._add_connection(player_name, connection)
+        self._peer_codecs[player_name] = codec
+
+        # send estab and trigger the other player to add back same conn
+        print(
+            f"{self.clock.time()} [Receive Conn Request] Sending conn estab to {player_name} using {codec} codec")
+        self.send(ConnectionEstab(Player(self.myself), codec), player_name)
+        self.lock.release()
+
+    def handle_connection_estab(self, packet: Packet, connection):
+        player_name = packet.get_player().get_name()
+        self.lock.acquire()
+        self._peer_codecs[player_name] = packet.get_data() or JsonCodec.name
+        if not player_name in self._connection_pool:
+            # only add player to connection pool if not already inside
+            print(f"{self.clock.time()} [Receive Conn Estab] Saving connection")
+            self._add_connection(player_name, connection)
+        self.lock.release()
+
+    def handle_connection_resume(self, packet: Packet, connection):
+        player_name = packet.get_player().get_name()
+        data = packet.get_data()
+        codec = self.codecs.choose(data.get("codecs"))
+        self.lock.acquire()
+        self._peer_codecs[player_name] = codec
+        self.lock.release()
+        print(
+            f"{self.clock.time()} [Receive Conn Resume] Resuming session with {player_name}")
+        reply = ConnectionResumed(
+            Player(self.myself), codec, self.received_state(player_name))
+        self.resume_session(player_name, connection, data.get("received"), reply)
+
+    def handle_connection_resumed(self, packet: Packet, connection):
+        player_name = packet.get_player().get_name()
+        print(
+            f"{self.clock.time()} [Receive Conn Resumed] Resumed session with {player_name}")
+        self.resume_session(player_name, connection,
+                            packet.get_data().get("received"))
+
+    def resume_session(self, player_id, connection, received: list, reply: Packet = None):
+        """
+        Carry on the session with the player over a new connection: send
+        reply first if there is one, then the packets they are missing
+        according to received.
+        """
+        self.logger.warning(
+            f"{self.myself} cannot resume a session with {player_id}")
+
+    def is_new(self, packet: Packet) -> bool:
+        """Check the packet against its sender's replay window."""
+        # only this peer's reader touches its window
+        sender = packet.get_player().get_name()
+        window = self._replay_windows.get(sender)
+        if window is None:
+            window = self._replay_windows.setdefault(sender, ReplayWindow())
+        return window.check_and_update(packet.get_seq())
+
+    def handle_frame(self, frame: bytes, connection, received_at: float):
+        """
+        Handle a single complete frame read from a connection.
+        """
+        if frame:
+            packet = self.codecs.decode(frame)
+            packet.receivedAt = received_at
+
+            if packet.get_packet_type() in RESUME_TYPES:
+                self.check_if_peering_and_handle(packet, connection)
+                return
+
+            if not self.is_new(packet):
+                self.logger.debug(
+                    f"Dropped duplicate packet {packet.get_seq()} from {packet.get_player().get_name()}")
+                return
+
+            is_peering = self.check_if_peering_and_handle(
+                packet, connection)
+            if is_peering:
+                return
+            if packet.get_seq():
+                self._echoes[packet.get_player().get_name()] = (packet.get_seq(), received_at)
+            if packet.get_packet_type() == "relay":
+                self.handle_relay(packet)
+            else:
+                self.queue.put(packet)
+
+    # Relay tree
+    def relay_broadcast(self, packet: Packet):
+        """
+        Broadcast the packet down the relay tree. Sync wait times are not
+        applied, the packet reaches each player after however many hops.
+        """
+        packet = copy.copy(packet)
+        if packet.createdAt is None:
+            packet.createdAt = self.clock.time()
+        # numbered per sender rather than per link, as it travels over several
+        msg_id = next(self._msg_ids)
+        codec = self.codecs.get(self.codecs.names()[0])
+        inner = base64.b64encode(codec.encode(packet, msg_id)).decode("ascii")
+        self.lock.acquire()
+        player_ids = list(self._connection_pool)
+        self.lock.release()
+        self._relay(self.myself, msg_id, inner, player_ids)
+        if packet.get_packet_type() == "action":
+            temporary_logger_dict = json.dumps({"Logger Name": "ACTION PACKET INFO-SEND", "Sender": self.myself, "SEND_TIME": packet.createdAt, "DATA": packet.get_data(), "DELAY": 0, "TO": "relay"})
+            self.logger.info(f'{temporary_logger_dict}')
+
+    def relay_plan(self, origin, player_ids: list) -> list:
+        """
+        Split the players into at most relay_fanout subtrees, as pairs of
+        the player to send to and the players they pass it on to. The
+        nearest players relay, and everyone else is dealt out between them.
+        Ties, such as players we have no delay for yet, are broken
+        differently for every origin so the same few players do not end up
+        relaying everyone's broadcasts. Players we cannot reach are left out.
+        Plans are only worked out again once the delays change.
+        """
+        version, plans = self._relay_plans
+        if version != self.sync.version:
+            plans = {}
+            self._relay_plans = (self.sync.version, plans)
+        key = (origin, tuple(player_ids))
+        plan = plans.get(key)
+        if plan is None:
+            plan = plans[key] = self._make_relay_plan(origin, player_ids)
+        return plan
+
+    def _make_relay_plan(self, origin, player_ids: list) -> list:
+        player_ids = sorted(filter(self.is_reachable, player_ids), key=lambda player_id: (
+            self.sync.get_delay(player_id, math.inf),
+            zlib.crc32(f"{origin}/{player_id}".encode())))
+        fanout = self.relay_fanout
+        relays, rest = player_ids[:fanout], player_ids[fanout:]
+        return [(relay, rest[i::fanout]) for i, relay in enumerate(relays)]
+
+    def _relay(self, origin, msg_id: int, inner: str, player_ids: list):
+        for relay, relay_to in self.relay_plan(origin, player_ids):
+            if not self.is_reachable(relay):
+                # gone since the plan was worked out, unicast to its subtree
+                for player_id in filter(self.is_reachable, relay_to):
+                    self.send(Relay(self.my_player, origin, msg_id, [], inner), player_id)
+                continue
+            # players are sent by their ids to keep the packet small
+            self.send(Relay(self.my_player, origin, msg_id,
+                            [self.players.get_id(player_id) for player_id in relay_to],
+                            inner), relay)
+
+    def handle_relay(self, packet: Packet):
+        data = packet.get_data()
+        origin = data["origin"]
+        with self._relay_lock:
+            window = self._relay_windows.setdefault(origin, ReplayWindow())
+            if not window.check_and_update(data["msg_id"]):
+                self.logger.debug(
+                    f"Dropped duplicate broadcast {data['msg_id']} from {origin}")
+                return
+        if data["to"]:
+            self.relayed += 1
+            self._relay(origin, data["msg_id"], data["packet"],
+                        [self.players.get_name(player_id) for player_id in data["to"]])
+        inner = self.codecs.decode(base64.b64decode(data["packet"]))
+        inner.receivedAt = packet.get_received_at()
+        self.queue.put(inner)
+
+    # Sync class functions
+    def syncing(self, round_number):
+        if self.sync.is_leader_myself() and not self.sent_sync:
+            print("sending sync req")
+            sync_req_pkt = SyncReq(round_number, self.my_player)
+
+            if not self.sent_sync:
+                for player_id in self.sync.leader_list:
+                    if not player_id == self.myself and not player_id in self.sync._delay_dict.keys():
+                        self.set_packet_timer(player_id, sync_req_pkt)
+                self.sent_sync = True
+        return
+
+    def probe_peers(self, round_number):
+        """
+        Probe every peer PROBE_SAMPLES times, PROBE_INTERVAL apart, all at
+        the same time as everyone else does, instead of one leader at a
+        time.
+        """
+        if self.sent_probes:
+            return
+        self.sent_probes = True
+        for i in range(PROBE_SAMPLES):
+            self._call_later(i * PROBE_INTERVAL, lambda: self._send_probes(round_number))
+
+    def _send_probes(self, round_number):
+        self.lock.acquire()
+        player_ids = list(self._connection_pool)
+        self.lock.release()
+        # sent straight to every peer, never down the relay tree
+        for player_id in player_ids:
+            self.send(Probe(round_number, self.my_player), player_id)
+
+    def reset_sync(self):
+        self.sync.reset_sync()
+        self.sent_sync = False
+        self.sent_probes = False
+
+    def set_packet_timer(self, player_id, packet: Packet):
+        self.sync_req_timers[player_id] = self._call_later(
+            3, lambda: self.handle_timeout(packet, player_id))
+
+    def handle_timeout(self, packet, player_id):
+        print(f"Packet timeout! Resending sync_req to player:{player_id}")
+        self.send(packet, player_id)
+        # start timer again
+        self.set_packet_timer(player_id, packet)
+        return
+
+    def stop_timers(self):
+        for player, timer in self.sync_req_timers.items():
+            timer.cancel()
@@ -0,0 +1,253 @@
+import json
+import struct
+
+from game.models.player import Player
+from game.transport.packet import Packet
+
+"""
+Codecs turn packets into bytes and back.
+
+Every encoded packet starts with a single byte identifying the codec that
+produced it, so a receiver can always decode what it is sent. Which codec a
+sender uses for a peer is agreed during the ConnectionRequest/ConnectionEstab
+handshake; the handshake itself is always sent as JSON.
+"""
+
+# Packet types are sent as their index in this list. Only ever append to it,
+# otherwise peers running different versions will disagree on the tags.
+PACKET_TYPES = [
+    "action",
+    "ack",
+    "nak",
+    "ss_ack",
+    "ss_nak",
+    "peering_completed",
+    "sync_req",
+    "sync_ack",
+    "peer_sync_ack",
+    "update_leader",
+    "ready_to_start",
+    "ack_start",
+    "sat_down",
+    "frame_sync",
+    "acquire_master",
+    "update_master",
+    "connection_req",
+    "connection_estab",
+    "end_game",
+    "vote",
+    "relay",
+    "probe",
+    "probe_reply",
+    "rtt_row",
+]
+PACKET_TYPE_TAGS = {packet_type: tag for tag,
+                    packet_type in enumerate(PACKET_TYPES)}
+UNKNOWN_TAG = 0xFF
+UNKNOWN_PLAYER_ID = 0xFFFF
+
+
+class PlayerTable:
+    """
+    Per-session interned table of player names.
+
+    Every player in the session is given a small integer id. Both ends build
+    the table from the same tracker so the ids agree without being exchanged.
+    Player objects are cached so decoding a packet does not allocate a new
+    Player for every packet.
+    """
+
+    def __init__(self, names=()):
+        self._names = sorted(names)
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._players: dict[str, Player] = {}
+
+    def get_id(self, name: str) -> int:
+        return self._ids.get(name, UNKNOWN_PLAYER_ID)
+
+    def get_name(self, player_id: int) -> str:
+        return self._names[player_id]
+
+    def get_player(self, name: str) -> Player:
+        player = self._players.get(name)
+        if player is None:
+            player = Player(name)
+            self._players[name] = player
+        return player
+
+
+class Codec:
+    """Base class of all codecs."""
+
+    name = None
+    codec_id = None
+
+    def __init__(self, players: PlayerTable = None):
+        self.players = players or PlayerTable()
+
+    def encode(self, packet: Packet, seq: int = 0) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Packet:
+        """Decode bytes produced by encode, including the codec id."""
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """Human readable codec, useful for debugging."""
+
+    name = "json"
+    codec_id = ord("J")
+
+    def encode(self, packet: Packet, seq: int = 0) -> bytes:
+        d = packet.dict()
+        d["seq"] = seq
+        if packet.echo:
+            d["echo"] = packet.echo
+        return bytes((self.codec_id,)) + json.dumps(d).encode('utf-8')
+
+    def decode(self, data: bytes) -> Packet:
+        d = json.loads(bytes(data[1:]))
+        player = self.players.get_player(d["player"].get("name"))
+        return Packet.from_json(d, player)
+
+
+class BinaryCodec(Codec):
+    """
+    Compact codec with a fixed struct header:
+    codec id | packet type tag | flags | sender id | created_at | sequence number
+    followed by the echo if the flags say there is one, and the data,
+    prefixed with a one byte type marker.
+    """
+
+    name = "binary"
+    codec_id = ord("B")
+
+    HEADER = struct.Struct("!BBBHdI")
+    # seq | received_at | sent_at
+    ECHO = struct.Struct("!Idd")
+    FLAG_ECHO = 1
+    LENGTH = struct.Struct("!H")
+    LONG_LENGTH = struct.Struct("!I")
+    INT = struct.Struct("!q")
+    FLOAT = struct.Struct("!d")
+
+    DATA_NONE = 0
+    DATA_INT = 1
+    DATA_FLOAT = 2
+    DATA_STR = 3
+    DATA_JSON = 4
+
+    def encode(self, packet: Packet, seq: int = 0) -> bytes:
+        packet_type = packet.get_packet_type()
+        sender = packet.get_player().get_name()
+        type_tag = PACKET_TYPE_TAGS.get(packet_type, UNKNOWN_TAG)
+        sender_id = self.players.get_id(sender)
+
+        flags = self.FLAG_ECHO if packet.echo else 0
+        parts = [self.HEADER.pack(self.codec_id, type_tag, flags, sender_id,
+                                  packet.get_created_at(), seq)]
+        if type_tag == UNKNOWN_TAG:
+            parts.append(self._pack_str(packet_type))
+        if sender_id == UNKNOWN_PLAYER_ID:
+            parts.append(self._pack_str(sender))
+        if packet.echo:
+            parts.append(self.ECHO.pack(*packet.echo))
+        parts.append(self._pack_data(packet.get_data()))
+        return b"".join(parts)
+
+    def decode(self, data: bytes) -> Packet:
+        _, type_tag, flags, sender_id, created_at, seq = self.HEADER.unpack_from(
+            data, 0)
+        offset = self.HEADER.size
+
+        if type_tag == UNKNOWN_TAG:
+            packet_type, offset = self._unpack_str(data, offset)
+        else:
+            packet_type = PACKET_TYPES[type_tag]
+        if sender_id == UNKNOWN_PLAYER_ID:
+            sender, offset = self._unpack_str(data, offset)
+        else:
+            sender = self.players.get_name(sender_id)
+        echo = None
+        if flags & self.FLAG_ECHO:
+            echo = list(self.ECHO.unpack_from(data, offset))
+            offset += self.ECHO.size
+
+        packet = Packet(self._unpack_data(data, offset),
+                        self.players.get_player(sender), packet_type)
+        packet.createdAt = created_at
+        packet.seq = seq
+        packet.echo = echo
+        return packet
+
+    def _pack_str(self, s: str) -> bytes:
+        b = s.encode('utf-8')
+        return self.LENGTH.pack(len(b)) + b
+
+    def _unpack_str(self, data, offset):
+        (length,) = self.LENGTH.unpack_from(data, offset)
+        offset += self.LENGTH.size
+        return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+
+    def _pack_data(self, value) -> bytes:
+        if value is None:
+            return bytes((self.DATA_NONE,))
+        # bool is a subclass of int, keep it out of the int branch
+        if isinstance(value, int) and not isinstance(value, bool) and -2**63 <= value < 2**63:
+            return bytes((self.DATA_INT,)) + self.INT.pack(value)
+        if isinstance(value, float):
+            return bytes((self.DATA_FLOAT,)) + self.FLOAT.pack(value)
+        if isinstance(value, str):
+            return bytes((self.DATA_STR,)) + self._pack_str(value)
+        b = json.dumps(value).encode('utf-8')
+        return bytes((self.DATA_JSON,)) + self.LONG_LENGTH.pack(len(b)) + b
+
+    def _unpack_data(self, data, offset):
+        marker = data[offset]
+        offset += 1
+        if marker == self.DATA_NONE:
+            return None
+        if marker == self.DATA_INT:
+            return self.INT.unpack_from(data, offset)[0]
+        if marker == self.DATA_FLOAT:
+            return self.FLOAT.unpack_from(data, offset)[0]
+        if marker == self.DATA_STR:
+            return self._unpack_str(data, offset)[0]
+        (length,) = self.LONG_LENGTH.unpack_from(data, offset)
+        offset += self.LONG_LENGTH.size
+        return json.loads(bytes(data[offset:offset + length]))
+
+
+CODECS = {codec.name: codec for codec in (BinaryCodec, JsonCodec)}
+
+
+class CodecRegistry:
+    """
+    The codecs available to a transport, in order of preference.
+    """
+
+    def __init__(self, preferred: str, players: PlayerTable):
+        if preferred not in CODECS:
+            raise ValueError(f"Unknown codec: {preferred}")
+        names = [preferred] + [name for name in CODECS if name != preferred]
+        self._codecs = {name: CODECS[name](players) for name in names}
+        self._by_id = {codec.codec_id: codec for codec in self._codecs.values()}
+
+    def names(self) -> list:
+        """Codec names in order of preference, as offered in a handshake."""
+        return list(self._codecs.keys())
+
+    def get(self, name: str) -> Codec:
+        return self._codecs[name]
+
+    def choose(self, offered) -> str:
+        """Pick the most preferred codec that the peer also supports."""
+        for name in self._codecs:
+            if name in (offered or []):
+                return name
+        return JsonCodec.name
+
+    def decode(self, data: bytes) -> Packet:
+        """Decode a packet produced by any of the known codecs."""
+        return self._by_id[data[0]].decode(data)
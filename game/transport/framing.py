@@ -0,0 +1,69 @@
+import socket
+import struct
+
+"""
+Framing splits a TCP byte stream back into the packets that were sent.
+Every frame is a 4 byte big-endian length followed by that many bytes of
+payload, so packets of any size can be sent without padding.
+"""
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1 << 20
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """Prefix the payload with its length."""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {len(payload)} bytes is too large")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class FrameDecoder:
+    """
+    Streaming decoder for length-prefixed frames.
+
+    Bytes read from the socket are appended to a single buffer which is reused
+    for the lifetime of the connection, so a frame split across several reads
+    or several frames coalesced into one read are both handled.
+    """
+
+    def __init__(self, recv_size: int = 4096):
+        self._buffer = bytearray()
+        self._chunk = bytearray(recv_size)
+        self._view = memoryview(self._chunk)
+
+    def recv(self, connection: socket.socket) -> list:
+        """
+        Read once from the connection and return every complete frame.
+        Raises ConnectionResetError when the peer has closed the connection.
+        """
+        n = connection.recv_into(self._chunk)
+        if n == 0:
+            raise ConnectionResetError("Connection closed by peer")
+        return self.feed(self._view[:n])
+
+    def feed(self, data) -> list:
+        """Add data to the buffer and return every complete frame."""
+        buffer = self._buffer
+        buffer += data
+
+        frames = []
+        offset = 0
+        while len(buffer) - offset >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(buffer, offset)
+            if length > MAX_FRAME_SIZE:
+                raise ValueError(f"Frame of {length} bytes is too large")
+            start = offset + FRAME_HEADER.size
+            end = start + length
+            if len(buffer) < end:
+                break
+            frames.append(bytes(buffer[start:end]))
+            offset = end
+
+        if offset:
+            del buffer[:offset]
+        return frames
+
+    def pending(self) -> int:
+        """Number of buffered bytes that do not yet form a complete frame."""
+        return len(self._buffer)
@@ -0,0 +1,48 @@
+from collections import deque
+import threading
+
+"""
+Inbox holds packets received by the transport until the game loop is ready
+to handle them. Unlike queue.Queue it can hand over everything that is
+waiting in a single locked operation.
+"""
+
+
+class Inbox:
+
+    def __init__(self):
+        self._packets = deque()
+        self._ready = threading.Condition(threading.Lock())
+        self._woken = False
+
+    def put(self, packet):
+        with self._ready:
+            self._packets.append(packet)
+            self._ready.notify()
+
+    def wakeup(self):
+        """Wake up a get_many that is blocked waiting for packets."""
+        with self._ready:
+            self._woken = True
+            self._ready.notify()
+
+    def get_many(self, max_n: int = None, timeout: float = None) -> list:
+        """
+        Return up to max_n packets in arrival order, or every waiting packet
+        if max_n is None. With a timeout, block for up to timeout seconds
+        until a packet arrives or wakeup is called.
+        """
+        with self._ready:
+            if timeout and not self._packets and not self._woken:
+                self._ready.wait_for(
+                    lambda: self._packets or self._woken, timeout)
+            self._woken = False
+
+            n = len(self._packets)
+            if max_n is not None:
+                n = min(n, max_n)
+            popleft = self._packets.popleft
+            return [popleft() for _ in range(n)]
+
+    def __len__(self):
+        return len(self._packets)
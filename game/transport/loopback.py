@@ -0,0 +1,131 @@
+import functools
+import json
+import logging
+import threading
+
+from game.clock.timebase import RealTimeClock
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.transport.base import BaseTransport
+from game.transport.packet import ConnectionRequest, Packet
+
+"""
+LoopbackTransport connects players running in the same process without any
+sockets. Every player in a game registers with the same LoopbackNetwork,
+which hands encoded packets straight to the receiving transport once the
+network emulator says they have arrived.
+
+Packets still go through the codecs, sequence numbers, replay windows and
+the handshake, so a game over loopback behaves like one over TCP, minus the
+ports and the waits for servers to come up.
+
+The network and all of its transports share one clock. With a
+SimulatedClock nothing here uses threads: packets are delivered and timers
+fire as the clock runs.
+"""
+
+
+class LoopbackNetwork:
+    """The players of one game, and the clock that delivers their packets."""
+
+    def __init__(self, logger: logging.Logger, clock=None):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self._transports: dict[str, "LoopbackTransport"] = {}
+        self._own_clock = clock is None
+        self.clock = clock or RealTimeClock(logger)
+
+        # called with a player's name whenever they have something to
+        # handle, for drivers that step players instead of running their loops
+        self.on_ready = None
+
+    def register(self, transport: "LoopbackTransport") -> list:
+        """Add a player, returns the players that were already here."""
+        with self.lock:
+            others = list(self._transports)
+            self._transports[transport.myself] = transport
+        return others
+
+    def unregister(self, player_id):
+        with self.lock:
+            self._transports.pop(player_id, None)
+
+    def is_registered(self, player_id) -> bool:
+        """Whether the player is still here, as a closed socket would tell."""
+        return player_id in self._transports
+
+    def deliver(self, src, dst, payload: bytes, deadline: float):
+        """Hand payload from src to dst at time deadline."""
+        self.clock.call_at(deadline, functools.partial(
+            self._arrive, src, dst, payload))
+
+    def _arrive(self, src, dst, payload: bytes):
+        transport = self._transports.get(dst)
+        if transport is None:
+            # the player has left the game
+            return
+        transport.handle_frame(payload, src, transport.clock.time())
+        self.notify(dst)
+
+    def notify(self, player_id):
+        if self.on_ready:
+            self.on_ready(player_id)
+
+    def shutdown(self):
+        if self._own_clock:
+            self.clock.shutdown()
+
+
+class LoopbackTransport(BaseTransport):
+
+    def __init__(self, myself: str, network: LoopbackNetwork, logger: logging.Logger, tracker: Tracker, codec: str = "binary", scenario: dict = None, relay_fanout: int = 0):
+        super().__init__(myself, logger, tracker, codec, scenario, network.clock, relay_fanout)
+        self.network = network
+
+        # connect to everyone who is already here, anyone who joins later
+        # connects to us
+        for player_id in network.register(self):
+            if player_id in tracker.get_players():
+                self.send(ConnectionRequest(
+                    Player(self.myself), self.codecs.names()), player_id)
+        self.logger.debug("Completely initialized loopback transport...")
+
+    def is_reachable(self, player_id) -> bool:
+        return self.network.is_registered(player_id)
+
+    def send(self, packet: Packet, player_id):
+        self._send_at(packet, player_id, self.network.clock.time())
+
+    def _send_at(self, packet: Packet, player_id, start: float):
+        payload = self.encode(packet, player_id, start - self.network.clock.time())
+        delay = self.netem.plan(player_id, len(payload))
+        if delay is None:
+            self.logger.debug(f"Emulated loss of packet to {player_id}")
+            return
+        # start is on the network's clock, which may not be ours
+        self.network.deliver(self.myself, player_id, payload, start + delay)
+
+    def sendall(self, packet: Packet, use_sync: bool = True):
+        if self.should_relay(packet):
+            self.relay_broadcast(packet)
+            return
+        wait_dict = self.sync.get_wait_times() if use_sync else None
+        now = self.network.clock.time()
+        for player_id in list(self._connection_pool):
+            wait = wait_dict.get(player_id, 0) if wait_dict else 0
+            self._send_at(packet, player_id, now + wait)
+            if packet.get_packet_type() == "action":
+                temporary_logger_dict = json.dumps({"Logger Name": "ACTION PACKET INFO-SEND", "Sender": self.myself, "SEND_TIME": now + wait, "DATA": packet.get_data(), "DELAY": wait, "TO": player_id})
+                self.logger.info(f'{temporary_logger_dict}')
+
+    def wakeup(self):
+        super().wakeup()
+        self.network.notify(self.myself)
+
+    def shutdown(self):
+        self.stop_timers()
+        self.log_netem_stats()
+        self.network.unregister(self.myself)
+
+    def _call_later(self, delay: float, fn):
+        return self.network.clock.call_later(delay, fn)
@@ -1,6 +1,5 @@
 from game.models.player import Player
 import json
-import time
 import sys
 
 
@@ -14,6 +13,9 @@ class Packet:
     - SyncReq
     - SyncAck
     - SyncUpdate
+    - Probe
+    - ProbeReply
+    - RttRow
     - LobbyRegister
     - LobbyLeave
     - LobbyStart
@@ -23,13 +25,23 @@ class Packet:
     - vote
     - sat_down
     - end_game
+    - relay
     """
 
     def __init__(self, data, player: Player, packet_type: str):
         self.data = data
         self.player = player
         self.packet_type = packet_type
-        self.createdAt = int(time.time())
+        # stamped by the transport from its clock when the packet is sent,
+        # unless it was set beforehand
+        self.createdAt = None
+        # set by the transport when the packet is read off the socket
+        self.receivedAt = None
+        self.seq = 0
+        # [seq, received_at, sent_at]: the last packet we got from the
+        # receiver, when it arrived and when this one leaves, on our clock.
+        # Set by the transport so every packet doubles as a clock probe
+        self.echo = None
 
     def get_data(self):
         return self.data
@@ -43,25 +55,36 @@ class Packet:
     def get_created_at(self):
         return self.createdAt
 
-    def __hash__(self):
-        return hash(self.packet_type + self.player.name + (str(hash(self.data)) if self.data else ""))
+    def get_received_at(self):
+        return self.receivedAt
 
-    def json(self) -> str:
-        """Return a json representation of the packet."""
-        return json.dumps(dict(
+    def get_seq(self):
+        return self.seq
+
+    def dict(self) -> dict:
+        """Return a dict representation of the packet."""
+        return dict(
             data=self.data,
             player=self.player.dict(),
             packet_type=self.packet_type,
             created_at=self.createdAt
-        ))
+        )
+
+    def json(self) -> str:
+        """Return a json representation of the packet."""
+        return json.dumps(self.dict())
 
-    def from_json(d):
+    def from_json(d, player: Player = None):
         """Return a packet from a json representation."""
-        return Packet(
+        packet = Packet(
             d["data"],
-            Player(d["player"].get("name")),
+            player or Player(d["player"].get("name")),
             d["packet_type"]
         )
+        packet.createdAt = d.get("created_at", packet.createdAt)
+        packet.seq = d.get("seq", 0)
+        packet.echo = d.get("echo")
+        return packet
 
     def __str__(self):
         return f"Packet: {str(self.data)}"
@@ -78,10 +101,6 @@ class Action(Packet):
     def __str__(self):
         return f"Action: {super().get_packet_type()}"
 
-    def __hash__(self):
-        # frame sync packets are unique for keypress, createdat
-        return hash(self.packet_type + self.player.get_name() + self.data + str(self.get_created_at()))
-
 
 class Ack(Packet):
     """Acknowledge a seat selection."""
@@ -89,9 +108,6 @@ class Ack(Packet):
     def __init__(self, player: Player):
         super().__init__(None, player, "ack")
 
-    def __hash__(self):
-        return hash(self.packet_type + self.player.get_name() + str(self.get_created_at()))
-
 
 class Nak(Packet):
     """Nack seat selection."""
@@ -99,9 +115,6 @@ class Nak(Packet):
     def __init__(self, player: Player):
         super().__init__(None, player, "nak")
 
-    def __hash__(self):
-        return hash(self.packet_type + self.player.get_name() + str(self.get_created_at()))
-
 
 class PeeringCompleted(Packet):
     """Peering has been completed."""
@@ -109,8 +122,6 @@ class PeeringCompleted(Packet):
     def __init__(self, player: Player):
         super().__init__(None, player, "peering_completed")
 
-    def __hash__(self):
-        return hash(self.packet_type + self.player.get_name() + str(self.get_created_at()))
 
 # Timer Packets
 
@@ -123,15 +134,15 @@ class SyncReq(Packet):
 
 
 class SyncAck(Packet):
-    """Send a Sync packet."""
+    """
+    Reply to a SyncReq, with the time it was sent, on the leader's clock,
+    and the time it arrived, on ours.
+    """
 
     def __init__(self, data, player: Player, round_number):
         super().__init__(data, player, "sync_ack")
         self.round_number = round_number
 
-    def __hash__(self):
-        return hash(self.packet_type + self.player.get_name() + str(self.round_number))
-
 
 class PeerSyncAck(Packet):
     """Send peer their delay measurement."""
@@ -140,9 +151,6 @@ class PeerSyncAck(Packet):
         super().__init__(data, player, "peer_sync_ack")
         self.round_number = round_number
 
-    def __hash__(self):
-        return hash(self.packet_type + self.player.get_name() + str(self.round_number))
-
 
 class UpdateLeader(Packet):
     """Update the leader of syncing."""
@@ -151,6 +159,31 @@ class UpdateLeader(Packet):
         super().__init__(data, player, "update_leader")
 
 
+class Probe(Packet):
+    """Probe the round trip time to a peer, every peer probes every other at once."""
+
+    def __init__(self, round_number, player: Player):
+        super().__init__(round_number, player, "probe")
+
+
+class ProbeReply(Packet):
+    """
+    Reply to a Probe, with the time it was sent, on the prober's clock, and
+    the time it arrived, on ours.
+    """
+
+    def __init__(self, sent_at: float, received_at: float, round_number, player: Player):
+        super().__init__({"sent": sent_at, "received": received_at, "round": round_number},
+                         player, "probe_reply")
+
+
+class RttRow(Packet):
+    """Our round trip times to every peer, one row of the rtt matrix."""
+
+    def __init__(self, row: dict, round_number, player: Player):
+        super().__init__({"rtt": row, "round": round_number}, player, "rtt_row")
+
+
 # End of Timer Packets
 
 
@@ -169,14 +202,10 @@ class AckStart(Packet):
 
 
 class SatDown(Packet):
-    """Player has sat down."""
-
-    def __init__(self, seat, player: Player):
-        super().__init__(seat, player, "sat_down")
+    """Player has sat down in seat in round round_number."""
 
-    def __hash__(self):
-        # frame sync packets are unique for keypress, createdat
-        return hash(self.packet_type + self.player.get_name() + self.data + str(self.get_created_at()))
+    def __init__(self, seat, player: Player, round_number: int = 0):
+        super().__init__({"seat": seat, "round": round_number}, player, "sat_down")
 
 
 class FrameSync(Packet):
@@ -185,42 +214,75 @@ class FrameSync(Packet):
     def __init__(self, frame, player: Player):
         super().__init__(frame, player, "frame_sync")
 
-    def __hash__(self):
-        # frame sync packets are unique for (frame, createdAt)
-        return hash(self.packet_type + self.player.name + str(self.data) + str(self.get_created_at()))
-
 
 class AcquireMaster(Packet):
-    def __init__(self, player: Player):
-        super().__init__(None, player, "acquire_master")
+    """Standing for master in the election for term, see game/clock/clock.py."""
 
-    def __hash__(self):
-        # frame sync packets are unique for (frame, createdAt)
-        return hash(self.packet_type + self.player.name + str(self.data) + str(self.get_created_at()))
+    def __init__(self, player: Player, term: int = 0, score: float = None):
+        super().__init__({"term": term, "score": score}, player, "acquire_master")
 
 
 class UpdateMaster(Packet):
-    def __init__(self, new_master_id: str, player: Player):
-        super().__init__(new_master_id, player, "update_master")
+    """new_master_id is the master for term, with its election score."""
 
-    def __hash__(self):
-        # frame sync packets are unique for (frame, createdAt)
-        return hash(self.packet_type + self.player.name + str(self.data) + str(self.get_created_at()))
+    def __init__(self, new_master_id: str, player: Player, term: int = 0, score: float = None):
+        super().__init__({"master": new_master_id, "term": term, "score": score}, player, "update_master")
 
 
 # initial transport layer initiation
 class ConnectionRequest(Packet):
-    """Initial request to connect"""
+    """Initial request to connect, offering the codecs we can speak."""
 
-    def __init__(self, player: Player):
-        super().__init__(None, player, "connection_req")
+    def __init__(self, player: Player, codecs: list = None):
+        super().__init__(codecs, player, "connection_req")
 
 
 class ConnectionEstab(Packet):
-    """Connection has been established."""
+    """Connection has been established, with the codec chosen for it."""
+
+    def __init__(self, player: Player, codec: str = None):
+        super().__init__(codec, player, "connection_estab")
+
+
+class ConnectionResume(Packet):
+    """
+    Request to resume a session after the connection dropped, with what we
+    have received from the player as [highest seq, replay window bitmap].
+    """
+
+    def __init__(self, player: Player, codecs: list = None, received: list = None):
+        super().__init__({"codecs": codecs, "received": received},
+                         player, "connection_resume")
+
+
+class ConnectionResumed(Packet):
+    """Session resumed, with the codec and what we have received from the player."""
+
+    def __init__(self, player: Player, codec: str = None, received: list = None):
+        super().__init__({"codec": codec, "received": received},
+                         player, "connection_resumed")
+
+
+class PlayerLost(Packet):
+    """
+    Never sent: the transport puts it on its own queue once it has given up
+    getting a dropped connection to the player back.
+    """
 
     def __init__(self, player: Player):
-        super().__init__(None, player, "connection_estab")
+        super().__init__(None, player, "player_lost")
+
+
+class Relay(Packet):
+    """
+    A broadcast from origin passed on by player, who is one hop of the relay
+    tree. The receiver hands on the packet, encoded and in base64, and
+    passes it on to the players whose ids are in relay_to.
+    """
+
+    def __init__(self, player: Player, origin: str, msg_id: int, relay_to: list, packet: str):
+        super().__init__({"origin": origin, "msg_id": msg_id, "to": relay_to,
+                          "packet": packet}, player, "relay")
 
 
 class EndGame(Packet):
@@ -233,6 +295,3 @@ class EndGame(Packet):
 class Vote(Packet):
     def __init__(self, playerid: str, player: Player):
         super().__init__(playerid, player, "vote")
-
-    def __hash__(self):
-        return hash(self.packet_type + self.player.get_name() + self.data + str(self.get_created_at()))
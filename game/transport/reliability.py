@@ -0,0 +1,222 @@
+import struct
+import threading
+
+"""
+Selective reliability for packets sent as UDP datagrams, used by
+UdpTransport.
+
+Every packet type has a delivery class:
+
+    UNRELIABLE_LATEST   sent once, and dropped by the receiver if a newer
+                        packet of the same type already arrived. For state
+                        that is sent over and over, like FrameSync
+    RELIABLE_UNORDERED  retransmitted until acknowledged, handed over as
+                        soon as it arrives. For Ack and Nak, the replies to
+                        a seat selection, which are only counted
+    RELIABLE_ORDERED    retransmitted until acknowledged, handed over in the
+                        order sent. The default, as most of the game's
+                        messages, like Vote, SatDown and EndGame, depend on
+                        the ones before them. Action too: a seat selection
+                        is not tagged with the attempt it belongs to, so it
+                        must not overtake the SatDown before it
+
+Reliable packets to a peer are numbered 1, 2, 3, ... in one sequence,
+ordered ones also in a second sequence of their own, so losing an unordered
+packet never holds up an ordered one. The receiver acknowledges every
+reliable datagram with everything it has received so far: a cumulative ack
+plus a bitmap of the 64 numbers after it (a selective ack), so one ack can
+cover several packets and a lost ack is made up for by the next.
+
+Unacknowledged packets are retransmitted when their retransmission timeout,
+worked out from the measured round trip time as in RFC 6298, runs out.
+Unordered packets are given up on after max_retransmits, but ordered ones
+are retransmitted for as long as the link lasts: every later ordered packet
+waits for them, so giving up on one would hold up the rest for good.
+"""
+
+UNRELIABLE_LATEST = 0
+RELIABLE_UNORDERED = 1
+RELIABLE_ORDERED = 2
+
+DELIVERY_CLASSES = {
+    "frame_sync": UNRELIABLE_LATEST,
+    "ack": RELIABLE_UNORDERED,
+    "nak": RELIABLE_UNORDERED,
+}
+
+# kind | sender id | delivery class | reliable seq | ordered seq
+DATA_HEADER = struct.Struct("!BHBII")
+# kind | sender id | cumulative ack | selective ack bitmap
+ACK_HEADER = struct.Struct("!BHIQ")
+DATA = ord("D")
+ACK = ord("A")
+SACK_BITS = 64
+MAX_DATAGRAM_SIZE = 65507
+
+
+def delivery_class(packet_type: str) -> int:
+    return DELIVERY_CLASSES.get(packet_type, RELIABLE_ORDERED)
+
+
+class RttEstimator:
+    """Smoothed round trip time and retransmission timeout, as in RFC 6298."""
+
+    def __init__(self, initial_rto: float = 0.25, min_rto: float = 0.02, max_rto: float = 2.0):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+    def sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
+    def backoff(self, retransmits: int) -> float:
+        """Timeout before the next retransmission of a packet sent retransmits times already."""
+        return min(self.max_rto, self.rto * (1 << retransmits))
+
+
+class Unacked:
+
+    def __init__(self, datagram: bytes, sent_at: float, delivery: int):
+        self.datagram = datagram
+        self.sent_at = sent_at
+        self.delivery = delivery
+        self.retransmits = 0
+        self.timer = None
+
+
+class ReliableLink:
+    """
+    Reliability state for one peer: what we sent them that they have not
+    acknowledged yet, and what we received from them.
+    """
+
+    def __init__(self, my_id: int, max_retransmits: int = 20):
+        self.my_id = my_id
+        self.max_retransmits = max_retransmits
+        self.lock = threading.Lock()
+        self.rtt = RttEstimator()
+
+        # sending
+        self._next_rseq = 1
+        self._next_oseq = 1
+        self._unacked: dict[int, Unacked] = {}
+
+        # receiving
+        self._cum = 0
+        self._received_above = set()
+        self._next_delivery = 1
+        self._held: dict[int, bytes] = {}
+
+        self.sent = 0
+        self.retransmitted = 0
+        self.given_up = 0
+
+    def prepare(self, delivery: int, payload: bytes, now: float):
+        """
+        Wrap the payload in a datagram. Returns the datagram and its
+        reliable sequence number, 0 for an unreliable one.
+        """
+        if DATA_HEADER.size + len(payload) > MAX_DATAGRAM_SIZE:
+            raise ValueError(f"Packet of {len(payload)} bytes is too large for a datagram")
+        with self.lock:
+            rseq = oseq = 0
+            if delivery != UNRELIABLE_LATEST:
+                rseq = self._next_rseq
+                self._next_rseq += 1
+            if delivery == RELIABLE_ORDERED:
+                oseq = self._next_oseq
+                self._next_oseq += 1
+            datagram = DATA_HEADER.pack(DATA, self.my_id, delivery, rseq, oseq) + payload
+            if rseq:
+                self._unacked[rseq] = Unacked(datagram, now, delivery)
+            self.sent += 1
+        return datagram, rseq
+
+    def set_timer(self, rseq: int, timer):
+        with self.lock:
+            entry = self._unacked.get(rseq)
+            if entry is None:
+                timer.cancel()
+            else:
+                entry.timer = timer
+
+    def timed_out(self, rseq: int):
+        """
+        The packet's timer ran out. Returns the datagram to send again and
+        the timeout to wait for it, or None if it was acknowledged meanwhile
+        or is unordered and has been retransmitted too often.
+        """
+        with self.lock:
+            entry = self._unacked.get(rseq)
+            if entry is None:
+                return None
+            if entry.retransmits >= self.max_retransmits and entry.delivery != RELIABLE_ORDERED:
+                del self._unacked[rseq]
+                self.given_up += 1
+                return None
+            entry.retransmits += 1
+            self.retransmitted += 1
+            return entry.datagram, self.rtt.backoff(entry.retransmits)
+
+    def acked(self, cum: int, bitmap: int, now: float) -> int:
+        """Handle an ack from the peer, returns how many packets it newly acknowledged."""
+        with self.lock:
+            done = [rseq for rseq in self._unacked
+                    if rseq <= cum or (rseq - cum <= SACK_BITS and bitmap & (1 << (rseq - cum - 1)))]
+            for rseq in done:
+                entry = self._unacked.pop(rseq)
+                if entry.timer:
+                    entry.timer.cancel()
+                # Karn's algorithm: a retransmitted packet's ack could be
+                # for any of its copies, so it says nothing about the rtt
+                if entry.retransmits == 0:
+                    self.rtt.sample(now - entry.sent_at)
+            return len(done)
+
+    def received(self, rseq: int) -> bool:
+        """Record a reliable datagram from the peer, returns False if it is a duplicate."""
+        with self.lock:
+            if rseq <= self._cum or rseq in self._received_above:
+                return False
+            self._received_above.add(rseq)
+            while self._cum + 1 in self._received_above:
+                self._cum += 1
+                self._received_above.discard(self._cum)
+            return True
+
+    def ack(self) -> bytes:
+        """An ack datagram covering everything received from the peer."""
+        with self.lock:
+            bitmap = 0
+            for rseq in self._received_above:
+                offset = rseq - self._cum - 1
+                if offset < SACK_BITS:
+                    bitmap |= 1 << offset
+            return ACK_HEADER.pack(ACK, self.my_id, self._cum, bitmap)
+
+    def deliver_ordered(self, oseq: int, payload: bytes) -> list:
+        """Hold back ordered payloads until the ones before them have arrived."""
+        with self.lock:
+            self._held[oseq] = payload
+            payloads = []
+            while self._next_delivery in self._held:
+                payloads.append(self._held.pop(self._next_delivery))
+                self._next_delivery += 1
+            return payloads
+
+    def pending(self) -> int:
+        """Packets sent that are not acknowledged yet."""
+        return len(self._unacked)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "retransmitted": self.retransmitted,
+                "given_up": self.given_up, "unacked": len(self._unacked),
+                "srtt": self.rtt.srtt, "rto": self.rtt.rto}
@@ -0,0 +1,48 @@
+"""
+Anti-replay window used to drop duplicate packets.
+
+Every sender numbers the packets it sends to a peer 1, 2, 3, ... and the
+receiver keeps one window per sender, like the IPsec/DTLS anti-replay check:
+the highest sequence number seen plus a bitmap of which of the previous
+`size` numbers have been seen. Anything older than the window is dropped.
+"""
+
+
+class ReplayWindow:
+
+    def __init__(self, size: int = 64):
+        self.size = size
+        self._mask = (1 << size) - 1
+        self.highest = 0
+        self.bitmap = 0
+
+        self.duplicates = 0
+        self.too_old = 0
+
+    def check_and_update(self, seq: int) -> bool:
+        """
+        Return True if seq has not been seen before and mark it as seen.
+        """
+        if seq > self.highest:
+            shift = seq - self.highest
+            if shift < self.size:
+                self.bitmap = ((self.bitmap << shift) | 1) & self._mask
+            else:
+                self.bitmap = 1
+            self.highest = seq
+            return True
+
+        offset = self.highest - seq
+        if offset >= self.size:
+            self.too_old += 1
+            return False
+
+        bit = 1 << offset
+        if self.bitmap & bit:
+            self.duplicates += 1
+            return False
+        self.bitmap |= bit
+        return True
+
+    def dropped(self) -> int:
+        return self.duplicates + self.too_old
@@ -0,0 +1,107 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+"""
+SendScheduler runs callables at absolute deadlines from a single thread.
+
+Transport uses it to fan a packet out to every peer: each peer's send is
+released at its own deadline, so a broadcast takes as long as the largest
+wait rather than the sum of them. Deadlines are read off the clock it is
+given, the wall clock by default, which has to keep up with real time as
+the thread waits in real seconds.
+"""
+
+
+class ScheduledCall:
+    """Handle for a scheduled call, like threading.Timer it can be cancelled."""
+
+    def __init__(self, deadline: float, fn):
+        self.deadline = deadline
+        self.fn = fn
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SendScheduler:
+
+    def __init__(self, logger: logging.Logger, clock=None):
+        self.logger = logger
+        self._time = clock.time if clock is not None else time.time
+        self._heap = []
+        # tie breaker so calls with the same deadline run in the order they were added
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+
+        # how far behind its deadline the latest call was released
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def call_at(self, deadline: float, fn) -> ScheduledCall:
+        """Call fn at time deadline, as given by the clock."""
+        call = ScheduledCall(deadline, fn)
+        with self._cond:
+            heapq.heappush(self._heap, (deadline, next(self._counter), call))
+            # only wake the sender if this call is now the next one due
+            if self._heap[0][2] is call:
+                self._cond.notify_all()
+        return call
+
+    def call_later(self, delay: float, fn) -> ScheduledCall:
+        return self.call_at(self._time() + delay, fn)
+
+    def pending(self) -> int:
+        """Number of calls still waiting to run, not counting cancelled ones."""
+        with self._cond:
+            return sum(1 for _, _, call in self._heap if not call.cancelled)
+
+    def drain(self, timeout: float):
+        """Wait up to timeout seconds for every pending call to run."""
+        deadline = self._time() + timeout
+        with self._cond:
+            while any(not call.cancelled for _, _, call in self._heap):
+                remaining = deadline - self._time()
+                if remaining <= 0 or not self._running:
+                    return
+                self._cond.wait(remaining)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    timeout = self._heap[0][0] - self._time()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+                deadline, _, call = heapq.heappop(self._heap)
+                # let drain know a call has been taken off
+                self._cond.notify_all()
+
+            if call.cancelled:
+                continue
+            self.last_lateness = self._time() - deadline
+            self.max_lateness = max(self.max_lateness, self.last_lateness)
+            try:
+                call.fn()
+            except Exception:
+                # one failed send must not take the other peers down with it
+                self.logger.exception("Scheduled call failed")
+
+    def shutdown(self):
+        with self._cond:
+            self._running = False
+            self._heap.clear()
+            self._cond.notify()
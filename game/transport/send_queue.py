@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import deque
+
+"""
+PeerSendQueue is the bounded outbound queue Transport keeps for every peer.
+A writer thread per peer drains it onto the socket, so a slow or stalled
+peer only backs up its own queue instead of the thread that sends.
+
+What happens when a queue is full depends on its policy:
+    block       - the game thread waits for the writer to make room
+    drop_oldest - drop the oldest queued frame to make room
+    coalesce    - a packet whose type is in COALESCE_TYPES replaces the one
+                  of the same type already waiting, otherwise block
+
+put itself never waits, as frames are put on the queue by the scheduler
+thread, which must not be held up by one slow peer. Instead the game thread
+reserves room for a frame before it is scheduled, and waits for it if need
+be. A frame that has no room reserved and finds the queue full, such as a
+timer's, is dropped if it cannot be coalesced.
+
+The writer can batch the frames waiting in the queue into a single write,
+see Transport.batch_window. Timeouts are read off the clock the queue is
+given, the wall clock by default.
+"""
+
+SEND_POLICIES = ("block", "drop_oldest", "coalesce")
+
+# packets where only the latest one matters
+COALESCE_TYPES = {"frame_sync"}
+
+# latency critical packets, written as soon as they are taken off the queue
+# rather than waiting for more to batch them with
+UNBATCHED_TYPES = {"action"}
+
+
+class PeerSendQueue:
+
+    def __init__(self, maxsize: int = 256, policy: str = "coalesce", clock=None):
+        if policy not in SEND_POLICIES:
+            raise ValueError(f"Unknown send policy {policy}, expected one of {SEND_POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._time = clock.time if clock is not None else time.time
+        self._items = deque()  # (packet type, frame)
+        self._cond = threading.Condition()
+        self._closed = False
+        # room kept for frames that are on their way to the queue
+        self._reserved = 0
+
+        # metrics
+        self.max_depth = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def reserve(self, packet_type: str = None, timeout: float = None) -> bool:
+        """
+        Wait until there is room for a frame of packet_type and keep it for
+        the put of that frame. Returns whether room was reserved: never for
+        frames the policy drops or coalesces rather than waits for, nor
+        once the queue is closed or after timeout seconds.
+        """
+        if self.policy == "drop_oldest" or (
+                self.policy == "coalesce" and packet_type in COALESCE_TYPES):
+            return False
+        deadline = self._time() + timeout if timeout is not None else None
+        with self._cond:
+            while len(self._items) + self._reserved >= self.maxsize and not self._closed:
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - self._time()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            if self._closed:
+                return False
+            self._reserved += 1
+            return True
+
+    def put(self, frame: bytes, packet_type: str = None, reserved: bool = False) -> bool:
+        """
+        Queue the frame, in room reserved for it if reserved. Never waits.
+        Returns False if the frame was dropped.
+        """
+        with self._cond:
+            if reserved:
+                self._reserved -= 1
+            if self.policy == "coalesce" and packet_type in COALESCE_TYPES:
+                for i, (queued_type, _) in enumerate(self._items):
+                    if queued_type == packet_type:
+                        # keep its place in the queue but send the newer frame
+                        self._items[i] = (packet_type, frame)
+                        self.coalesced += 1
+                        return True
+            if self._closed:
+                return False
+
+            if not reserved and len(self._items) + self._reserved >= self.maxsize:
+                self.dropped += 1
+                if self.policy != "drop_oldest":
+                    return False
+                self._items.popleft()
+
+            self._items.append((packet_type, frame))
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout: float = None):
+        """
+        Block for the next frame, returns it with its packet type. Returns
+        None once the queue is closed, or if nothing was queued within
+        timeout seconds.
+        """
+        deadline = self._time() + timeout if timeout is not None else None
+        with self._cond:
+            while not self._items and not self._closed:
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - self._time()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+            if self._closed:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def join(self, timeout: float):
+        """Wait up to timeout seconds for the writer to take every frame."""
+        deadline = self._time() + timeout
+        with self._cond:
+            while self._items and not self._closed:
+                remaining = deadline - self._time()
+                if remaining <= 0:
+                    return
+                self._cond.wait(remaining)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {"depth": len(self._items), "max_depth": self.max_depth,
+                "dropped": self.dropped, "coalesced": self.coalesced}
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,98 @@
+import threading
+from collections import deque
+
+"""
+A session is what we keep about a peer across connections, so that a
+dropped connection can be replaced without losing the packets that were in
+flight on it.
+
+Every frame written to a peer is also kept in a bounded retransmit buffer.
+When the connection comes back, each side tells the other what it has
+received from them, as the highest sequence number and the bitmap of its
+replay window, and only the buffered frames the peer is missing are sent
+again. Anything sent twice is dropped by the peer's replay window.
+"""
+
+
+class RetransmitBuffer:
+    """The last `size` frames written to a peer, with their sequence numbers."""
+
+    def __init__(self, size: int = 256):
+        self._frames = deque(maxlen=size)  # (seq, frame) in the order written
+
+    def add(self, seq: int, frame: bytes):
+        self._frames.append((seq, frame))
+
+    def missing(self, highest: int, bitmap: int, window: int = 64) -> list:
+        """
+        Frames the peer has not received, given the state of its replay
+        window, in the order they were first written. Frames older than the
+        window would be dropped by the peer and are not returned.
+        """
+        frames = []
+        for seq, frame in self._frames:
+            offset = highest - seq
+            if offset < 0 or (offset < window and not bitmap & (1 << offset)):
+                frames.append(frame)
+        return frames
+
+    def __len__(self):
+        return len(self._frames)
+
+
+class PeerSession:
+
+    def __init__(self, buffer_size: int = 256):
+        self.buffer = RetransmitBuffer(buffer_size)
+        # held while writing to the peer, a resume must not interleave its
+        # frames with the writer's
+        self.write_lock = threading.Lock()
+        self._up = threading.Event()
+        self._up.set()
+        self.closed = False
+        self.lost_at = None
+
+        self.resumes = 0
+        self.replayed = 0
+        self.writes = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+
+    def is_up(self) -> bool:
+        return self._up.is_set()
+
+    def lost(self, now: float) -> bool:
+        """Mark the connection as down, returns False if it already was."""
+        if not self._up.is_set():
+            return False
+        self._up.clear()
+        self.lost_at = now
+        return True
+
+    def resumed(self, replayed: int, now: float) -> float:
+        """Mark the connection as up again, returns how long it was down."""
+        outage = now - self.lost_at if self.lost_at is not None else 0
+        self.lost_at = None
+        self.resumes += 1
+        self.replayed += replayed
+        self._up.set()
+        return outage
+
+    def wrote(self, frames: int, size: int):
+        """Count a write of frames frames, size bytes in all."""
+        self.writes += 1
+        self.frames_written += frames
+        self.bytes_written += size
+
+    def wait_until_up(self, timeout: float = None) -> bool:
+        """Block while the connection is down, returns whether it is up."""
+        return self._up.wait(timeout) and not self.closed
+
+    def close(self):
+        """Stop waiting for the connection, e.g. when shutting down."""
+        self.closed = True
+        self._up.set()
+
+    def stats(self) -> dict:
+        return {"buffered": len(self.buffer), "resumes": self.resumes, "replayed": self.replayed,
+                "writes": self.writes, "frames": self.frames_written, "bytes": self.bytes_written}
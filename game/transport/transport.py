@@ -1,49 +1,65 @@
 import json
 import socket
 from game.models.player import Player
-from game.transport.packet import ConnectionEstab, ConnectionRequest, Packet, SyncReq
+from game.transport.base import BaseTransport
+from game.transport.packet import ConnectionRequest, ConnectionResume, Packet, PlayerLost
 from game.lobby.tracker import Tracker
-from game.clock.sync import Sync
-from game.clock.delay import Delay
+from game.transport.framing import FrameDecoder, encode_frame
+from game.transport.scheduler import SendScheduler
+from game.transport.send_queue import UNBATCHED_TYPES, PeerSendQueue
+from game.transport.session import PeerSession
 
-from queue import Queue, Empty
+import functools
 import threading
 import logging
 
-import time
-
 """
 Transport is responsible for sending and receiving data from other players.
 It is also responsible for maintaining a connection pool of all players.
 """
 
 
-class Transport:
+class Transport(BaseTransport):
+    # frames kept per player to replay after a reconnect
+    RETRANSMIT_BUFFER_SIZE = 256
+    # attempts to get a dropped connection back before giving up on the player
+    RECONNECT_ATTEMPTS = 6
+    # longest the game waits for room in a player's send queue, after which
+    # the packet is dropped or coalesced as a timer's would be
+    RESERVE_TIMEOUT = 0.1
 
-    def __init__(self, myself: str, port, thread_manager, logger: logging.Logger, tracker: Tracker, host_socket: socket.socket = None):
-        self.myself = myself
-        self.my_player = Player(name=self.myself)
+    def __init__(self, myself: str, port, thread_manager, logger: logging.Logger, tracker: Tracker, host_socket: socket.socket = None, codec: str = "binary", scenario: dict = None, send_policy: str = "coalesce", send_queue_size: int = 256, batch_window: float = 0, batch_size: int = 1400, relay_fanout: int = 0):
+        super().__init__(myself, logger, tracker, codec, scenario,
+                         relay_fanout=relay_fanout)
         self.thread_mgr = thread_manager
-        self.queue = Queue()
-        self.chunksize = 1024
-        self.NUM_PLAYERS = tracker.get_player_count()
-        self.lock = threading.Lock()
-        self.logger = logger
-
-        self.tracker = tracker
-        self._connection_pool: dict[str, socket.socket] = {}
-
-        self.sync = Sync(myself=self.myself,
-                         tracker=self.tracker, logger=self.logger)
-        self.pre_game_sync = True
-        self.is_sync_completed = False
 
-        self.delayer = Delay(myself, tracker)
-        self.sent_sync = False
-
-        self.sync_req_timers = {}
-
-        self.pkt_history = {}
+        # one bounded outbound queue and writer thread per peer
+        self.send_policy = send_policy
+        self.send_queue_size = send_queue_size
+        self._send_queues: dict[str, PeerSendQueue] = {}
+        self._send_queues_lock = threading.Lock()
+        # off by default: with a batch_window, a writer holds a frame for up
+        # to batch_window seconds, or until batch_size bytes are waiting, so
+        # a burst of packets goes out in one write
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        # what we keep about each player across reconnects
+        self._sessions: dict[str, PeerSession] = {}
+        # players whose connection dropped and never came back
+        self._lost_players = set()
+        self._closing = False
+        # threads the transport started, which never wait for room in a
+        # send queue, see _reserve
+        self._own_threads = set()
+
+        # one thread releases every delayed send and timer
+        self.scheduler = SendScheduler(logger, self.clock)
+        self.thread_mgr.add_thread(self.scheduler.thread)
+        # per player, the deadline of the last send waiting on the scheduler
+        # and how many are waiting, see _schedule_release
+        self._releases_lock = threading.Lock()
+        self._last_release: dict[str, float] = {}
+        self._pending_releases: dict[str, int] = {}
 
         # start my socket
         if not host_socket:
@@ -53,20 +69,33 @@ class Transport:
             self.my_socket = s
         else:
             self.my_socket = host_socket
-        time.sleep(2)
 
-        t1 = threading.Thread(target=self.accept_connections, daemon=True)
-        t2 = threading.Thread(target=self.make_connections, daemon=True)
-        t1.start()
-        t2.start()
+        self._start_thread(self.accept_connections)
+        self._start_thread(self.make_connections)
         self.logger.debug("Completely initialized transport...")
 
-    # FOR TESTING PURPOSES ONLY
-    def get_connection_pool(self):
-        return self._connection_pool
+    def _start_thread(self, target, *args) -> threading.Thread:
+        t = threading.Thread(target=target, args=args, daemon=True)
+        self._own_threads.add(t)
+        t.start()
+        self.thread_mgr.add_thread(t)
+        return t
+
+    def is_reachable(self, player_id) -> bool:
+        # while the connection is down, packets wait for a resume that may
+        # never come
+        if player_id in self._lost_players:
+            return False
+        session = self._sessions.get(player_id)
+        return session is None or session.is_up()
 
     def all_connected(self):
-        return len(self._connection_pool) == self.NUM_PLAYERS - 1
+        # nobody is left to wait for once we have given up on a player
+        return len(self._connection_pool) + len(self._lost_players) >= self.NUM_PLAYERS - 1
+
+    def _on_own_thread(self) -> bool:
+        thread = threading.current_thread()
+        return thread is self.scheduler.thread or thread in self._own_threads
 
     def accept_connections(self):
         """
@@ -77,203 +106,403 @@ class Transport:
                 connection, _ = self.my_socket.accept()
                 if connection:
                     # start a thread to handle incoming data
-                    t = threading.Thread(target=self.handle_incoming, args=(
-                        connection,), daemon=True)
-                    t.start()
-                    self.thread_mgr.add_thread(t)
+                    self._start_thread(self.handle_incoming, connection)
             except:
                 pass
 
     def make_connections(self):
         """
-        Attempt to make outgoing connections to all players
+        Dial every player we are responsible for connecting to, all at once,
+        so the mesh is up as soon as the slowest link is rather than after
+        one connection per player in turn. The rest dial us.
         """
-        # while not self.all_connected():
-
         for player_id in self.tracker.get_players():
-            if player_id == self.myself:
+            if player_id == self.myself or not self.should_dial(player_id):
                 continue
-            self.lock.acquire()
-            if player_id not in self._connection_pool:
-                ip, port = self.tracker.get_ip_port(
-                    player_id)
-                if ip is None or port is None:
-                    continue
-                # waiting for player to start server
-                try:
-                    sock = socket.socket(
-                        socket.AF_INET, socket.SOCK_STREAM)
-                    sock.connect((ip, port))
-                    # send a player my conn request
-                    packet = ConnectionRequest(Player(self.myself))
-                    d = str(hash(packet)) + "\0" + packet.json()
-                    padded = d.encode('utf-8').ljust(self.chunksize, b"\0")
-                    sock.sendall(padded)
-                    print(
-                        f"[Make Conn] Sent conn req to {player_id} at {time.time()}")
-                    self.logger.info(
-                        f"{self.myself} sending connection request to {player_id} at {time.time()}")
-                    time.sleep(1)
-                except (ConnectionRefusedError, TimeoutError):
-                    pass
-            self.lock.release()
+            self._start_thread(self._dial, player_id)
+
+    def _retry_later(self, attempt: int, target, *args):
+        """
+        Run target(*args, attempt + 1) on a thread of its own once the
+        backoff after attempt is up, instead of sleeping through it.
+        """
+        self._call_later(self.retry_delay(attempt), functools.partial(
+            self._start_thread, target, *args, attempt + 1))
+
+    def _dial(self, player_id, attempt: int = 0):
+        """
+        Connect to the player and send them our connection request, retrying
+        with exponential backoff while their server is not up yet.
+        """
+        ip, port = self.tracker.get_ip_port(player_id)
+        if ip is None or port is None or player_id in self._connection_pool:
+            return
+        if attempt >= self.CONNECT_ATTEMPTS:
+            self.logger.warning(
+                f"{self.myself} gave up connecting to {player_id} after {self.CONNECT_ATTEMPTS} attempts")
+            return
+        try:
+            sock = socket.create_connection((ip, port), timeout=self.CONNECT_TIMEOUT)
+        except OSError:
+            self._retry_later(attempt, self._dial, player_id)
+            return
+        sock.settimeout(None)
+        # read the conn estab that the player replies with
+        self._start_thread(self.handle_incoming, sock)
+        # send a player my conn request
+        packet = ConnectionRequest(
+            Player(self.myself), self.codecs.names())
+        try:
+            sock.sendall(encode_frame(self.encode(packet, player_id)))
+        except OSError:
+            sock.close()
+            self._retry_later(attempt, self._dial, player_id)
+            return
+        print(
+            f"[Make Conn] Sent conn req to {player_id} at {self.clock.time()}")
+        self.logger.info(
+            f"{self.myself} sending connection request to {player_id} at {self.clock.time()}")
 
     def send(self, packet: Packet, player_id):
-        self.delayer.delay(player_id)
-        # add hash to packet header
-        d = str(hash(packet)) + "\0" + packet.json()
-        bd = d.encode('utf-8')
-        if len(bd) > self.chunksize:
-            print("Warning: packet too large")
-        padded = bd.ljust(self.chunksize, b"\0")
+        """
+        Queue the packet for the player. It is released to the player's
+        writer once the network emulator says it has arrived, so this never
+        blocks on the network, only on a full send queue, see _reserve.
+        """
+        packet = self.stamp(packet, player_id)
+        frame = encode_frame(self.encode_stamped(packet, player_id))
+        delay = self.netem.plan(player_id, len(frame))
+        if delay is None:
+            self.logger.debug(f"Emulated loss of packet to {player_id}")
+            return
+        reserved = self._reserve(player_id, packet.get_packet_type())
+        self._schedule_release(player_id, self.clock.time() + delay, functools.partial(
+            self._enqueue, player_id, frame, packet.get_packet_type(), packet.get_seq(), reserved))
+
+    def _schedule_release(self, player_id, deadline: float, release):
+        """
+        Call release on the scheduler at deadline, or right away if it is
+        due and nothing else is waiting for the player. Never before a send
+        made earlier to the same player, so neither a broadcast with a
+        shorter sync wait nor an immediate send overtakes a packet that is
+        still held back: the player gets our packets in the order we sent
+        them.
+        """
+        with self._releases_lock:
+            pending = self._pending_releases.get(player_id, 0)
+            if pending or deadline > self.clock.time():
+                if pending:
+                    deadline = max(deadline, self._last_release[player_id])
+                self._last_release[player_id] = deadline
+                self._pending_releases[player_id] = pending + 1
+                # under the lock, so sends with the same deadline are
+                # released in the order they were scheduled
+                self.scheduler.call_at(deadline, functools.partial(
+                    self._run_release, player_id, release))
+                return
+        release()
+
+    def _run_release(self, player_id, release):
         try:
+            release()
+        finally:
+            with self._releases_lock:
+                self._pending_releases[player_id] -= 1
+
+    def _send_queue(self, player_id) -> PeerSendQueue:
+        queue = self._send_queues.get(player_id)
+        if queue is None:
+            self._send_queues_lock.acquire()
+            queue = self._send_queues.get(player_id)
+            if queue is None:
+                self._sessions.setdefault(
+                    player_id, PeerSession(self.RETRANSMIT_BUFFER_SIZE))
+                queue = PeerSendQueue(self.send_queue_size, self.send_policy, self.clock)
+                self._send_queues[player_id] = queue
+                self._start_thread(self._drain_send_queue, player_id, queue)
+            self._send_queues_lock.release()
+        return queue
+
+    def _reserve(self, player_id, packet_type: str) -> bool:
+        """
+        Back-pressure for the game: wait up to RESERVE_TIMEOUT for room in
+        the player's send queue and keep it for a packet that is released to
+        the queue later. Returns whether room was reserved. The transport's
+        own threads never wait, one slow player would hold up every other
+        player and every timer on the scheduler thread. Packets without room
+        are dropped or coalesced instead if the queue is still full, see
+        PeerSendQueue, so a player who stopped reading never stalls the game.
+        """
+        if self._on_own_thread():
+            return False
+        return self._send_queue(player_id).reserve(packet_type, self.RESERVE_TIMEOUT)
+
+    def _enqueue(self, player_id, frame: bytes, packet_type: str, seq: int, reserved: bool = False):
+        if not self._send_queue(player_id).put((seq, frame), packet_type, reserved):
+            self.logger.debug(f"Send queue to {player_id} is full, dropped a {packet_type}")
+
+    def _drain_send_queue(self, player_id, queue: PeerSendQueue):
+        """
+        Writer thread for one player, the only thread that writes to them
+        apart from a resume. While the connection is down frames wait in
+        the retransmit buffer and are replayed when the session resumes.
+        """
+        session = self._sessions[player_id]
+        while True:
+            batch = self._take_batch(queue)
+            if not batch:
+                return
+            for seq, frame in batch:
+                session.buffer.add(seq, frame)
+            if session.wait_until_up():
+                self._write(player_id, session, b"".join(frame for _, frame in batch))
+                session.wrote(len(batch), sum(len(frame) for _, frame in batch))
+
+    def _take_batch(self, queue: PeerSendQueue) -> list:
+        """
+        Block for the next frame, then take whatever else is queued up
+        within the batch window. Returns the (seq, frame) pairs to write
+        together, an empty list once the queue is closed.
+        """
+        item = queue.get()
+        if item is None:
+            return []
+        packet_type, (seq, frame) = item
+        batch = [(seq, frame)]
+        if self.batch_window <= 0 or packet_type in UNBATCHED_TYPES:
+            return batch
+        size = len(frame)
+        deadline = self.clock.time() + self.batch_window
+        while size < self.batch_size:
+            item = queue.get(deadline - self.clock.time())
+            if item is None:
+                break
+            packet_type, (seq, frame) = item
+            batch.append((seq, frame))
+            size += len(frame)
+            if packet_type in UNBATCHED_TYPES:
+                break
+        return batch
+
+    def _write(self, player_id, session: PeerSession, frame: bytes):
+        with session.write_lock:
+            if not session.is_up():
+                # dropped while we waited for the lock, the resume sends it
+                return
             conn = self._connection_pool[player_id]
-            conn.sendall(padded)
-        except (ConnectionRefusedError, BrokenPipeError, OSError):
-            ip, port = self.tracker.get_ip_port(
-                player_id)
-            conn = socket.socket(
-                socket.AF_INET, socket.SOCK_STREAM)
-            conn.connect((ip, port))
-            conn.sendall(padded)
-            self._connection_pool[player_id] = conn
-
-    def send_within(self, packet: Packet, player_id, delay: float):
-        now = time.time()
-        time.sleep(delay)
-        self.send(packet, player_id)
-        if packet.get_packet_type() == "action":
-            temporary_logger_dict = json.dumps({"Logger Name":"ACTION PACKET INFO-SEND", "Sender":self.myself, "SEND_TIME":time.time(), "DATA": packet.get_data(),"DELAY":delay ,"TO":player_id})
-            self.logger.info(f'{temporary_logger_dict}')
+            try:
+                conn.sendall(frame)
+            except OSError as e:
+                self.logger.warning(f"Lost connection to {player_id}: {e}")
+                self._connection_lost(player_id, conn)
 
-    def sendall(self, packet: Packet, use_sync: bool = True):
-        if not use_sync:
-            for player_id in self._connection_pool:
-                self.send(packet, player_id)
+    def _connection_lost(self, player_id, conn):
+        """
+        The connection to the player dropped. Hold their packets until the
+        session resumes over a new connection, which the player who dialled
+        the old one sets up.
+        """
+        self.lock.acquire()
+        session = self._sessions.get(player_id)
+        if self._closing or session is None or self._connection_pool.get(player_id) is not conn:
+            # shutting down, or an old connection that was already replaced
+            self.lock.release()
             return
-        wait_dict = self.sync.get_wait_times()
+        lost_at = self.clock.time()
+        lost = session.lost(lost_at)
+        self.lock.release()
+        if not lost:
+            return
+        try:
+            conn.close()
+        except OSError:
+            pass
+        if self.should_dial(player_id):
+            self._start_thread(self._redial, player_id, session)
+        else:
+            # they dial us back, unless they give up first
+            self._call_later(self.reconnect_timeout(), functools.partial(
+                self._give_up, player_id, session, lost_at))
+
+    def reconnect_timeout(self) -> float:
+        """
+        The longest the player who dials takes to get a dropped connection
+        back: RECONNECT_ATTEMPTS of a connect and a resume, each up to
+        CONNECT_TIMEOUT, with the backoff between them.
+        """
+        return sum(2 * self.CONNECT_TIMEOUT + self.retry_delay(attempt)
+                   for attempt in range(self.RECONNECT_ATTEMPTS))
+
+    def _give_up(self, player_id, session: PeerSession, lost_at: float):
+        """
+        Stop waiting for the connection to the player that dropped at
+        lost_at to come back: drop their session, connection and send
+        queue, and tell the game with a PlayerLost.
+        """
+        self._send_queues_lock.acquire()
+        if self._closing or self._sessions.get(player_id) is not session \
+                or session.is_up() or session.lost_at != lost_at:
+            # resumed since, or shutting down
+            self._send_queues_lock.release()
+            return
+        del self._sessions[player_id]
+        queue = self._send_queues.pop(player_id, None)
+        self._send_queues_lock.release()
         self.lock.acquire()
-        for player_id in self._connection_pool:
-            wait = wait_dict.get(player_id, 0) if wait_dict else 0
-            threading.Thread(target=self.send_within(
-                packet, player_id, delay=wait), daemon=True)
+        self._lost_players.add(player_id)
+        conn = self._connection_pool.pop(player_id, None)
         self.lock.release()
+        if queue is not None:
+            queue.close()
+        session.close()
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        self.logger.warning(f"{self.myself} gave up on {player_id}, the connection dropped at {lost_at}")
+        packet = PlayerLost(Player(player_id))
+        packet.createdAt = packet.receivedAt = self.clock.time()
+        self.queue.put(packet)
 
-    def receive(self) -> str:
+    def _redial(self, player_id, session: PeerSession, attempt: int = 0):
         """
-        Drain the queue when we are ready to handle data.
+        Reconnect to the player and ask to resume the session, backing off
+        between attempts. Gives up on the player after RECONNECT_ATTEMPTS.
         """
+        if self._closing or session.is_up():
+            return
+        if attempt >= self.RECONNECT_ATTEMPTS:
+            self.logger.warning(
+                f"{self.myself} gave up reconnecting to {player_id} after {self.RECONNECT_ATTEMPTS} attempts")
+            self._give_up(player_id, session, session.lost_at)
+            return
+        ip, port = self.tracker.get_ip_port(player_id)
         try:
-            data = self.queue.get_nowait()
-            self.queue.task_done()
-            if data:
-                packet = Packet.from_json(json.loads(data))
-                length = len(packet)
-                rtt = time.time() - packet.get_created_at()
-                throughput = length / rtt
-                self.logger.info(
-                    f"PACKET_INFO\nLength: {length} | Packet Type: {packet.get_packet_type()} | RTT: {rtt} | Throughput: {throughput}")
-                return packet
-        except Empty:
+            sock = socket.create_connection((ip, port), timeout=self.CONNECT_TIMEOUT)
+            sock.settimeout(None)
+            self._start_thread(self.handle_incoming, sock)
+            packet = ConnectionResume(Player(self.myself), self.codecs.names(),
+                                      self.received_state(player_id))
+            sock.sendall(encode_frame(self.encode(packet, player_id)))
+        except OSError:
+            self._retry_later(attempt, self._redial, player_id, session)
             return
+        # the player replies with ConnectionResumed, which resumes the session
+        if session.wait_until_up(self.CONNECT_TIMEOUT):
+            return
+        sock.close()
+        self._redial(player_id, session, attempt + 1)
+
+    def resume_session(self, player_id, connection, received: list, reply: Packet = None):
+        self._send_queues_lock.acquire()
+        session = self._sessions.setdefault(
+            player_id, PeerSession(self.RETRANSMIT_BUFFER_SIZE))
+        self._send_queues_lock.release()
+        with session.write_lock:
+            self.lock.acquire()
+            old = self._connection_pool.get(player_id)
+            self._connection_pool[player_id] = connection
+            self.lock.release()
+            if old is not None and old is not connection:
+                try:
+                    old.close()
+                except OSError:
+                    pass
+            frames = session.buffer.missing(*(received or [0, 0]))
+            try:
+                if reply is not None:
+                    connection.sendall(encode_frame(self.encode(reply, player_id)))
+                for frame in frames:
+                    connection.sendall(frame)
+            except OSError as e:
+                # the new connection dropped too, the reader notices and
+                # the player dials again
+                self.logger.warning(f"Could not resume session with {player_id}: {e}")
+                return
+            outage = session.resumed(len(frames), self.clock.time())
+        temporary_logger_dict = json.dumps({"Logger Name": "RESUME INFO", "Sender": self.myself, "PEER": player_id, "OUTAGE": outage, "REPLAYED": len(frames)})
+        self.logger.info(f'{temporary_logger_dict}')
+
+    def get_send_queue_stats(self) -> dict:
+        """Depth, high water mark, drops and coalesced packets per player."""
+        return {player_id: queue.stats()
+                for player_id, queue in list(self._send_queues.items())}
 
-    def check_if_peering_and_handle(self, data, connection):
-        d = json.loads(data)
-        packet_type = d["packet_type"]
-        if packet_type == "connection_req":
-            self.handle_connection_request(d, connection)
-            return True
-        elif packet_type == "connection_estab":
-            self.handle_connection_estab(d, connection)
-            return True
-        else:
-            return False
-
-    def handle_connection_request(self, data, connection):
-        player: Player = Player(data["player"]["name"])
-        player_name = player.get_name()
+    def sendall(self, packet: Packet, use_sync: bool = True):
+        """
+        Send the packet to every peer. Each peer's send is released by the
+        scheduler at its own deadline: now, plus the sync wait for that peer,
+        plus the emulated network delay to it, but not before what we sent
+        them earlier, see _schedule_release.
+        """
+        if self.should_relay(packet):
+            self.relay_broadcast(packet)
+            return
+        wait_dict = self.sync.get_wait_times() if use_sync else None
+        now = self.clock.time()
         self.lock.acquire()
-        if not player_name in self._connection_pool:
-            # add player to connection pool
-            self._connection_pool[player_name] = connection
-
-        # send estab and trigger the other player to add back same conn
-        print(
-            f"{time.time()} [Receive Conn Request] Sending conn estab to {player_name}")
-        self.send(ConnectionEstab(Player(self.myself)), player_name)
+        player_ids = list(self._connection_pool)
         self.lock.release()
+        for player_id in player_ids:
+            wait = wait_dict.get(player_id, 0) if wait_dict else 0
+            # encode now so sequence numbers follow the order of sendall calls
+            stamped = self.stamp(packet, player_id, wait)
+            frame = encode_frame(self.encode_stamped(stamped, player_id))
+            delay = self.netem.plan(player_id, len(frame))
+            if delay is None:
+                self.logger.debug(f"Emulated loss of packet to {player_id}")
+                continue
+            reserved = self._reserve(player_id, packet.get_packet_type())
+            self._schedule_release(player_id, now + wait + delay, functools.partial(
+                self._release, packet, player_id, frame, stamped.get_seq(), wait, reserved))
 
-    def handle_connection_estab(self, data, connection):
-        player: Player = Player(data["player"]["name"])
-        player_name = player.get_name()
-        self.lock.acquire()
-        if not player_name in self._connection_pool:
-            # only add player to connection pool if not already inside
-            print(f"{time.time()} [Receive Conn Estab] Saving connection")
-            self._connection_pool[player_name] = connection
-        self.lock.release()
+    def _release(self, packet: Packet, player_id, frame: bytes, seq: int, wait: float, reserved: bool):
+        self._enqueue(player_id, frame, packet.get_packet_type(), seq, reserved)
+        if packet.get_packet_type() == "action":
+            temporary_logger_dict = json.dumps({"Logger Name":"ACTION PACKET INFO-SEND", "Sender":self.myself, "SEND_TIME":self.clock.time(), "DATA": packet.get_data(),"DELAY":wait ,"TO":player_id, "LATENESS": self.scheduler.last_lateness})
+            self.logger.info(f'{temporary_logger_dict}')
 
     def handle_incoming(self, connection: socket.socket):
         """
         Handle incoming data from a connection.
-        note: queue.put is blocking,
+        note: queue.put is never blocking,
         """
+        decoder = FrameDecoder(self.chunksize)
         while True:
             try:
-                data = connection.recv(self.chunksize)
-                incoming = data.decode('utf-8')
-                hashcode, data = incoming.rstrip("\0").split("\0")
-
-                self.lock.acquire()
-                if self.pkt_history.get(hashcode, False):
-                    self.lock.release()
-                    continue
-                self.pkt_history[hashcode] = True
-                self.lock.release()
-
-                if data:
-                    is_peering = self.check_if_peering_and_handle(
-                        data, connection)
-                    if not is_peering:
-                        self.queue.put(data)
+                frames = decoder.recv(connection)
+                # timestamp at the socket read, not when the game loop
+                # gets round to draining the queue
+                received_at = self.clock.time()
+                for frame in frames:
+                    self.handle_frame(frame, connection, received_at)
             except:
                 break
-
-    # Sync class functions
-    def syncing(self, round_number):
-        if self.sync.is_leader_myself() and not self.sent_sync:
-            print("sending sync req")
-            sync_req_pkt = SyncReq(round_number, self.my_player)
-
-            if not self.sent_sync:
-                for player_id in self.sync.leader_list:
-                    if not player_id == self.myself and not player_id in self.sync._delay_dict.keys():
-                        self.set_packet_timer(player_id, sync_req_pkt)
-                self.sent_sync = True
-        return
-
-    def reset_sync(self):
-        self.sync.reset_sync()
-        self.sent_sync = False
+        for player_id, conn in list(self._connection_pool.items()):
+            if conn is connection:
+                self._connection_lost(player_id, connection)
 
     def shutdown(self):
+        # let packets that are still delayed or queued go out first, the
+        # last thing we send is usually EndGame
+        self.stop_timers()
+        self._closing = True
+        self.scheduler.drain(self.SHUTDOWN_TIMEOUT)
+        for queue in list(self._send_queues.values()):
+            queue.join(self.SHUTDOWN_TIMEOUT)
+        temporary_logger_dict = json.dumps({"Logger Name": "SEND QUEUE INFO", "Sender": self.myself, "QUEUES": self.get_send_queue_stats(), "SESSIONS": {player_id: session.stats() for player_id, session in list(self._sessions.items())}})
+        self.logger.info(f'{temporary_logger_dict}')
+        self.log_netem_stats()
         self.thread_mgr.shutdown()
+        self.scheduler.shutdown()
+        for queue in list(self._send_queues.values()):
+            queue.close()
+        for session in list(self._sessions.values()):
+            session.close()
         self.my_socket.close()
         for connection in self._connection_pool.values():
             connection.close()
 
-    def set_packet_timer(self, player_id, packet: Packet):
-        self.sync_req_timers[player_id] = threading.Timer(
-            3, lambda: self.handle_timeout(packet, player_id))
-        self.sync_req_timers[player_id].start()
-
-    def handle_timeout(self, packet, player_id):
-        print(f"Packet timeout! Resending sync_req to player:{player_id}")
-        self.send(packet, player_id)
-        # start timer in thread
-        self.set_packet_timer(player_id, packet)
-        return
-
-    def stop_timers(self):
-        for player, timer in self.sync_req_timers.items():
-            timer.cancel()
+    def _call_later(self, delay: float, fn):
+        return self.scheduler.call_later(delay, fn)
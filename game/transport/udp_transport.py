@@ -0,0 +1,229 @@
+import functools
+import json
+import logging
+import socket
+import threading
+import time
+
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.transport.base import BaseTransport
+from game.transport.packet import ConnectionRequest, Packet
+from game.transport.reliability import (ACK, ACK_HEADER, DATA, DATA_HEADER,
+                                        RELIABLE_ORDERED, UNRELIABLE_LATEST,
+                                        ReliableLink, delivery_class)
+from game.transport.scheduler import SendScheduler
+
+"""
+UdpTransport sends every packet as a single UDP datagram, so a lost packet
+only holds up the packets that have to come after it instead of everything
+behind it on a TCP stream. Which packets are retransmitted, and which have
+to arrive in order, depends on their delivery class, see reliability.py.
+
+Like Transport it sends through the network emulator and a SendScheduler
+thread, which also runs the retransmission timers. One thread reads the
+socket.
+"""
+
+
+class UdpTransport(BaseTransport):
+    STREAM = False
+
+    def __init__(self, myself: str, port, thread_manager, logger: logging.Logger, tracker: Tracker, host_socket: socket.socket = None, codec: str = "binary", scenario: dict = None, relay_fanout: int = 0):
+        super().__init__(myself, logger, tracker, codec, scenario,
+                         relay_fanout=relay_fanout)
+        self.thread_mgr = thread_manager
+        self._closing = False
+
+        # datagrams name their sender by the same ids the binary codec uses
+        self.my_id = self.players.get_id(myself)
+        self._links: dict[str, ReliableLink] = {}
+        self._links_lock = threading.Lock()
+        # newest seq of each unreliable packet type from each player
+        self._latest = {}
+
+        # one thread sends delayed datagrams and runs retransmission timers
+        self.scheduler = SendScheduler(logger, self.clock)
+        self.thread_mgr.add_thread(self.scheduler.thread)
+
+        # a host_socket is the lobby's TCP socket, UDP ports are separate
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(("0.0.0.0", port))
+        self.my_socket = s
+
+        t1 = threading.Thread(target=self.handle_incoming, daemon=True)
+        t1.start()
+        self.thread_mgr.add_thread(t1)
+        self.make_connections()
+        self.logger.debug("Completely initialized udp transport...")
+
+    def make_connections(self):
+        """
+        Send a connection request to every player we dial. Requests are
+        reliable, so they are retransmitted until the player is up.
+        """
+        for player_id in self.tracker.get_players():
+            if player_id == self.myself or not self.should_dial(player_id):
+                continue
+            self.send(ConnectionRequest(
+                Player(self.myself), self.codecs.names()), player_id)
+            print(
+                f"[Make Conn] Sent conn req to {player_id} at {self.clock.time()}")
+            self.logger.info(
+                f"{self.myself} sending connection request to {player_id} at {self.clock.time()}")
+
+    def _link(self, player_id) -> ReliableLink:
+        link = self._links.get(player_id)
+        if link is None:
+            with self._links_lock:
+                link = self._links.setdefault(
+                    player_id, ReliableLink(self.my_id))
+        return link
+
+    def send(self, packet: Packet, player_id):
+        payload = self.encode(packet, player_id)
+        self._send_payload(player_id, payload, packet.get_packet_type())
+
+    def sendall(self, packet: Packet, use_sync: bool = True):
+        """
+        Send the packet to every peer, each after the sync wait for them.
+        """
+        if self.should_relay(packet):
+            self.relay_broadcast(packet)
+            return
+        wait_dict = self.sync.get_wait_times() if use_sync else None
+        now = self.clock.time()
+        self.lock.acquire()
+        player_ids = list(self._connection_pool)
+        self.lock.release()
+        for player_id in player_ids:
+            wait = wait_dict.get(player_id, 0) if wait_dict else 0
+            # encode now so sequence numbers follow the order of sendall calls
+            payload = self.encode(packet, player_id, wait)
+            if wait > 0:
+                self.scheduler.call_later(wait, functools.partial(
+                    self._send_payload, player_id, payload, packet.get_packet_type()))
+            else:
+                self._send_payload(player_id, payload, packet.get_packet_type())
+            if packet.get_packet_type() == "action":
+                temporary_logger_dict = json.dumps({"Logger Name": "ACTION PACKET INFO-SEND", "Sender": self.myself, "SEND_TIME": now + wait, "DATA": packet.get_data(), "DELAY": wait, "TO": player_id})
+                self.logger.info(f'{temporary_logger_dict}')
+
+    def _send_payload(self, player_id, payload: bytes, packet_type: str):
+        link = self._link(player_id)
+        datagram, rseq = link.prepare(
+            delivery_class(packet_type), payload, self.clock.time())
+        self._transmit(player_id, datagram)
+        if rseq:
+            self._arm(player_id, link, rseq, link.rtt.rto)
+
+    def _arm(self, player_id, link: ReliableLink, rseq: int, timeout: float):
+        link.set_timer(rseq, self.scheduler.call_later(timeout, functools.partial(
+            self._retransmit, player_id, link, rseq)))
+
+    def _retransmit(self, player_id, link: ReliableLink, rseq: int):
+        retry = link.timed_out(rseq)
+        if retry is None:
+            return
+        datagram, timeout = retry
+        self._transmit(player_id, datagram)
+        self._arm(player_id, link, rseq, timeout)
+
+    def _transmit(self, player_id, datagram: bytes):
+        """Send a datagram through the network emulator."""
+        delay = self.netem.plan(player_id, len(datagram))
+        if delay is None:
+            self.logger.debug(f"Emulated loss of datagram to {player_id}")
+        elif delay > 0:
+            self.scheduler.call_later(delay, functools.partial(
+                self._sendto, player_id, datagram))
+        else:
+            self._sendto(player_id, datagram)
+
+    def _sendto(self, player_id, datagram: bytes):
+        try:
+            self.my_socket.sendto(datagram, tuple(self.tracker.get_ip_port(player_id)))
+        except OSError as e:
+            self.logger.debug(f"Could not send datagram to {player_id}: {e}")
+
+    def handle_incoming(self):
+        """
+        Read datagrams off the socket until it is closed.
+        """
+        while not self._closing:
+            try:
+                datagram, address = self.my_socket.recvfrom(65535)
+            except OSError:
+                # a player's port was closed when we last sent to them
+                continue
+            # timestamp at the socket read, not when the game loop
+            # gets round to draining the queue
+            received_at = self.clock.time()
+            try:
+                self.handle_datagram(datagram, address, received_at)
+            except Exception:
+                self.logger.exception(f"Bad datagram from {address}")
+
+    def handle_datagram(self, datagram: bytes, address, received_at: float):
+        kind = datagram[0]
+        if kind == ACK:
+            _, sender_id, cum, bitmap = ACK_HEADER.unpack_from(datagram, 0)
+            self._link(self.players.get_name(sender_id)).acked(
+                cum, bitmap, received_at)
+            return
+        if kind != DATA:
+            return
+
+        _, sender_id, delivery, rseq, oseq = DATA_HEADER.unpack_from(datagram, 0)
+        payload = datagram[DATA_HEADER.size:]
+        sender = self.players.get_name(sender_id)
+        link = self._link(sender)
+        if rseq:
+            new = link.received(rseq)
+            # ack duplicates too, the ack for the first copy may have been lost
+            self._transmit(sender, link.ack())
+            if not new:
+                return
+        if delivery == RELIABLE_ORDERED:
+            payloads = link.deliver_ordered(oseq, payload)
+        else:
+            payloads = [payload]
+        for payload in payloads:
+            self.handle_frame(payload, address, received_at)
+
+    def is_new(self, packet: Packet) -> bool:
+        """
+        Reliable packets were already checked for duplicates by their link.
+        Unreliable ones are only new if nothing newer of their type arrived.
+        """
+        packet_type = packet.get_packet_type()
+        if delivery_class(packet_type) != UNRELIABLE_LATEST:
+            return True
+        key = (packet.get_player().get_name(), packet_type)
+        if packet.get_seq() <= self._latest.get(key, 0):
+            return False
+        self._latest[key] = packet.get_seq()
+        return True
+
+    def get_link_stats(self) -> dict:
+        """Sent, retransmitted and unacknowledged packets and rtt per player."""
+        return {player_id: link.stats() for player_id, link in list(self._links.items())}
+
+    def shutdown(self):
+        # let delayed packets go out and wait for the last of them, usually
+        # EndGame, to be acknowledged
+        self.stop_timers()
+        deadline = self.clock.time() + self.SHUTDOWN_TIMEOUT
+        while self.clock.time() < deadline and any(
+                link.pending() for link in list(self._links.values())):
+            time.sleep(0.01)
+        temporary_logger_dict = json.dumps({"Logger Name": "UDP LINK INFO", "Sender": self.myself, "LINKS": self.get_link_stats()})
+        self.logger.info(f'{temporary_logger_dict}')
+        self.log_netem_stats()
+        self._closing = True
+        self.thread_mgr.shutdown()
+        self.scheduler.shutdown()
+        self.my_socket.close()
+
+    def _call_later(self, delay: float, fn):
+        return self.scheduler.call_later(delay, fn)
@@ -1,5 +1,6 @@
 from game.lobby.lobby import Lobby
 from game.client import Client as GameClient
+from game.clock.netem import load_scenario
 import sys
 import petname
 import logging
@@ -13,6 +14,12 @@ if __name__ == "__main__":
     host_port = None
     player_ip = None
     is_player_mode = True
+    codec = "binary"
+    backend = "thread"
+    scenario = None
+    batch_window = 0
+    relay_fanout = 0
+    sync_mode = "continuous"
     player_name = petname.Generate(2)
     tracker = None
     logger = None
@@ -58,6 +65,35 @@ if __name__ == "__main__":
         if sys.argv[i] == "-n":
             player_name = sys.argv[i+1]
 
+        if sys.argv[i] == "-c":
+            # json is easier to read when debugging
+            codec = sys.argv[i+1]
+
+        if sys.argv[i] == "-b":
+            # "thread", "async" or "udp"
+            backend = sys.argv[i+1]
+
+        if sys.argv[i] == "-w":
+            # batch writes to each player within this many microseconds
+            batch_window = int(sys.argv[i+1]) / 1e6
+
+        if sys.argv[i] == "-f":
+            # relay broadcasts through a tree with this fanout
+            relay_fanout = int(sys.argv[i+1])
+
+        if sys.argv[i] == "-y":
+            # "leader", "probe" or "continuous", how delays between players
+            # are measured before the game
+            sync_mode = sys.argv[i+1]
+
+        if sys.argv[i] == "-s":
+            # network emulation scenario, see scenarios/
+            try:
+                scenario = load_scenario(sys.argv[i+1])
+            except (OSError, ValueError):
+                print("Invalid network scenario file.")
+                exit(1)
+
     if (is_player_mode) and ((player_ip is None) or (player_port is None) or (host_port is None) or (host_ip is None)):
         print("Require an ip address and port number to connect to host.")
         exit(1)
@@ -82,7 +118,13 @@ if __name__ == "__main__":
     GameClient(player_name,
                tracker,
                logger,
-               socket if not is_player_mode else None).start()
+               socket if not is_player_mode else None,
+               codec=codec,
+               backend=backend,
+               scenario=scenario,
+               batch_window=batch_window,
+               relay_fanout=relay_fanout,
+               sync_mode=sync_mode).start()
 
     logger.info("Terminating game...")
     print("Hope you had fun!")
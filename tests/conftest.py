@@ -0,0 +1,29 @@
+import logging
+
+import pytest
+
+from game.clock.timebase import SimulatedClock
+from game.lobby.tracker import Tracker
+from game.transport.loopback import LoopbackNetwork, LoopbackTransport
+
+
+@pytest.fixture
+def loopback():
+    """
+    Build connected LoopbackTransports in simulated time:
+    loopback(names, scenario) returns the network and the transports.
+    """
+    logger = logging.getLogger("tests")
+
+    def make(names, scenario=None, relay_fanout=0):
+        tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(names)}
+        network = LoopbackNetwork(logger, SimulatedClock())
+        scenario = dict(scenario or {"default": {"latency": 0.01}})
+        scenario.setdefault("seed", 1)
+        transports = [LoopbackTransport(name, network, logger, Tracker(dict(tracker_list)),
+                                        scenario=scenario, relay_fanout=relay_fanout)
+                      for name in names]
+        network.clock.run(stop=lambda: all(t.all_connected() for t in transports))
+        return network, transports
+
+    return make
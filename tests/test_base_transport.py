@@ -0,0 +1,37 @@
+from game.models.player import Player
+from game.transport.packet import FrameSync
+
+
+def test_encode_leaves_the_packet_alone(loopback):
+    network, (p0, p1, p2) = loopback(["p0", "p1", "p2"])
+    packet = FrameSync(7, Player("p0"))
+    created_at, seq, echo = packet.createdAt, packet.seq, packet.echo
+    network.clock.run(until=1.0)
+    p0.sendall(packet, use_sync=False)
+    assert (packet.createdAt, packet.seq, packet.echo) == (created_at, seq, echo)
+
+
+def test_each_peer_gets_its_own_sequence_numbers(loopback):
+    network, (p0, p1, p2) = loopback(["p0", "p1", "p2"])
+    for transport in (p1, p2):
+        transport.receive_many()
+    packet = FrameSync(7, Player("p0"))
+    p0.sendall(packet, use_sync=False)
+    p0.send(packet, "p1")
+    network.clock.run()
+    seqs = [received.get_seq() for received in p1.receive_many()]
+    assert seqs == [seqs[0], seqs[0] + 1]
+    assert [received.get_data() for received in p2.receive_many()] == [7]
+
+
+def test_packets_are_stamped_on_the_transport_clock(loopback):
+    network, (p0, p1) = loopback(["p0", "p1"])
+    p1.receive_many()
+    network.clock.run(until=1000.0)
+    sent_at = network.clock.time()
+    p0.send(FrameSync(7, Player("p0")), "p1")
+    preset = FrameSync(8, Player("p0"))
+    preset.createdAt = 123.0
+    p0.send(preset, "p1")
+    network.clock.run()
+    assert [received.get_created_at() for received in p1.receive_many()] == [sent_at, 123.0]
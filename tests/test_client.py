@@ -0,0 +1,37 @@
+import logging
+
+from game.client import Client
+from game.lobby.tracker import Tracker
+
+NAMES = ["p0", "p1", "p2"]
+
+
+def make_clients(loopback, names=NAMES):
+    network, transports = loopback(names)
+    tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(names)}
+    clients = [Client(name, Tracker(dict(tracker_list)), logging.getLogger("tests"), transport=transport)
+               for name, transport in zip(names, transports)]
+    for transport in transports:
+        transport.receive_many()
+    return network, clients
+
+
+def received_types(network, client):
+    network.clock.run()
+    return [packet.get_packet_type() for packet in client._transportLayer.receive_many()]
+
+
+def test_init_announces_ready_even_if_everyone_else_already_is(loopback):
+    network, (p0, p1, p2) = make_clients(loopback)
+    p0._round_ready = {"p1": True, "p2": True}
+    p0.init()
+    assert received_types(network, p1) == ["ready_to_start", "ack_start"]
+    assert p0._state == "AWAIT_KEYPRESS"
+
+
+def test_init_announces_ready_once(loopback):
+    network, (p0, p1, p2) = make_clients(loopback)
+    p0.init()
+    p0.init()
+    assert received_types(network, p1) == ["ready_to_start"]
+    assert p0._state == "PEERING"
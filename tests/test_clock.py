@@ -0,0 +1,181 @@
+import pytest
+
+from game.clock.clock import (FRAME_HISTORY, HEARTBEAT_FRAMES, LEASE_HEARTBEATS, LEASE_RTTS, MAX_RATE_ADJUST,
+                              RATE_MIN_FRAMES, RECKONING_FRAMES, STEP_FRAMES, Clock)
+from game.models.player import Player
+
+INTERVAL = 0.1
+
+
+@pytest.fixture
+def clock(loopback):
+    network, transports = loopback(["p0", "p1", "p2"])
+    return Clock(Player("p0"), transports[0], frame_interval=INTERVAL)
+
+
+def report(clock, frame, now, players=("p1", "p2")):
+    for player_id in players:
+        clock.update_frame(player_id, frame, now)
+
+
+def test_behind_the_median_shortens_the_period(clock):
+    report(clock, 12, 1.0)
+    assert clock.tick(10, 1.0) == 0.0
+    assert clock.error == -2
+    assert INTERVAL * (1 - MAX_RATE_ADJUST) <= clock.period < INTERVAL
+
+
+def test_ahead_of_the_median_stretches_the_period(clock):
+    report(clock, 10, 1.0)
+    assert clock.tick(12, 1.0) == 0.0
+    assert INTERVAL < clock.period <= INTERVAL * (1 + MAX_RATE_ADJUST)
+
+
+def test_far_ahead_holds_back_the_next_frame(clock):
+    report(clock, 10, 1.0)
+    hold = clock.tick(10 + STEP_FRAMES + 2, 1.0)
+    assert hold == pytest.approx((STEP_FRAMES + 2) * INTERVAL)
+    assert clock.period == INTERVAL
+
+
+def test_integral_takes_up_a_difference_in_clock_rates(clock):
+    # the others tick 2% slower than we would, and start 3 frames behind
+    now, frame = 0.0, 3
+    for _ in range(400):
+        report(clock, now / (INTERVAL * 1.02), now)
+        now += clock.period + clock.tick(frame, now)
+        frame += 1
+    # a proportional term alone would settle 0.4 frames ahead
+    assert abs(clock.error) < 0.01
+    assert clock.period == pytest.approx(INTERVAL * 1.02, rel=1e-3)
+    assert clock.time_to_converge is not None
+
+
+def test_a_peer_without_reports_is_nowhere(clock):
+    assert clock.frame_at("p1", 1.0) is None
+    assert clock.positions(1.0, 5) == {"p0": 5}
+
+
+def test_frames_are_reckoned_at_the_nominal_rate_until_reports_span_enough(clock):
+    clock.update_frame("p1", 10, 1.0)
+    clock.update_frame("p1", 12, 1.1)
+    assert clock.frame_rate("p1") == 1 / INTERVAL
+    assert clock.frame_at("p1", 1.3) == pytest.approx(14)
+
+
+def test_frames_are_reckoned_at_the_peers_own_rate(clock):
+    # p1 ticks 10% slower than we do
+    for frame in range(0, RATE_MIN_FRAMES + 1, 2):
+        clock.update_frame("p1", frame, frame * INTERVAL * 1.1)
+    assert clock.frame_rate("p1") == pytest.approx(1 / (INTERVAL * 1.1))
+    at, frame = RATE_MIN_FRAMES * INTERVAL * 1.1, RATE_MIN_FRAMES
+    assert clock.frame_at("p1", at + 1.1) == pytest.approx(frame + 10)
+
+
+def test_only_the_last_reports_are_kept(clock):
+    for frame in range(3 * FRAME_HISTORY):
+        clock.update_frame("p1", frame, frame * INTERVAL)
+    assert len(clock._history["p1"]) == FRAME_HISTORY
+    assert clock.get_frame("p1") == 3 * FRAME_HISTORY - 1
+
+
+def test_skew_is_measured_against_every_peer(clock):
+    clock.update_frame("p1", 8, 1.0)
+    clock.update_frame("p2", 13, 1.0)
+    assert clock.frame_skew(1.0, 10) == {"min": -2, "max": 3, "median": 0, "spread": 5}
+
+
+def test_frames_are_only_sent_when_we_stray(clock):
+    assert clock.should_send(0, 0.0)
+    clock.sent_frame(0, 0.0)
+    # right where the others reckon we are
+    assert not clock.should_send(5, 5 * INTERVAL)
+    assert clock.should_send(5, 5 * INTERVAL + (RECKONING_FRAMES + 0.1) * INTERVAL)
+
+
+def test_master_sends_a_heartbeat_even_on_time(clock):
+    clock.update_master(Player("p0"), Player("p0"), 1)
+    clock.sent_frame(0, 0.0)
+    assert not clock.should_send(HEARTBEAT_FRAMES - 1, (HEARTBEAT_FRAMES - 1) * INTERVAL)
+    assert clock.should_send(HEARTBEAT_FRAMES, HEARTBEAT_FRAMES * INTERVAL)
+
+
+def cluster(loopback, names):
+    """A Clock per player, all following the first as master for term 0."""
+    network, transports = loopback(names)
+    clocks = [Clock(Player(name), transport, frame_interval=INTERVAL)
+              for name, transport in zip(names, transports)]
+    for clock in clocks:
+        clock.update_master(Player(names[0]), Player(names[0]), 0)
+    return network, transports, clocks
+
+
+def advance(network, seconds):
+    # run() stops short of until when nothing is due by then
+    network.clock.call_later(seconds, lambda: None)
+    network.clock.run(until=network.clock.time() + seconds)
+
+
+def run(network, transports, clocks, until, stop=lambda: False):
+    """Hand election packets to the clocks as the client does, and poll them, until until or stop()."""
+    while network.clock.time() < until and not stop():
+        advance(network, 0.01)
+        for transport, clock in zip(transports, clocks):
+            for packet in transport.receive_many():
+                data = packet.get_data()
+                if packet.get_packet_type() == "acquire_master":
+                    clock.on_candidate(packet.get_player().get_name(), data["term"], data["score"])
+                elif packet.get_packet_type() == "update_master":
+                    clock.update_master(Player(data["master"]), packet.get_player(), data["term"], data["score"])
+            clock.poll(network.clock.time())
+
+
+def test_stale_master_is_ignored(clock):
+    assert clock.update_master(Player("p1"), Player("p1"), 2)
+    assert not clock.update_master(Player("p2"), Player("p2"), 1)
+    assert clock.get_master().get_name() == "p1"
+    assert clock.term == 2
+
+
+def test_same_term_goes_to_the_better_score(clock):
+    assert clock.update_master(Player("p2"), Player("p2"), 1, 0.05)
+    assert clock.update_master(Player("p1"), Player("p1"), 1, 0.02)
+    assert not clock.update_master(Player("p2"), Player("p2"), 1, 0.05)
+    assert clock.get_master().get_name() == "p1"
+
+
+def test_frame_syncs_from_the_master_renew_its_lease(loopback):
+    network, transports, (_, p1, _) = cluster(loopback, ["p0", "p1", "p2"])
+    lease = p1.lease()
+    expires = p1.next_deadline()
+    advance(network, lease / 2)
+    p1.update_frame("p0", 10, network.clock.time())
+    assert p1.next_deadline() == pytest.approx(expires + lease / 2)
+    p1.poll(expires)
+    assert p1.elections == 0
+    p1.poll(expires + lease / 2)
+    assert p1.elections == 1 and p1.term == 1
+
+
+@pytest.mark.parametrize("rtts", [{"p1": 0.02, "p2": 0.05}, {"p1": 0.02, "p2": 0.5}])
+def test_lease_is_a_few_heartbeats_and_round_trips(clock, rtts):
+    clock.transportLayer.sync.rtt_row = lambda: rtts
+    heartbeats = LEASE_HEARTBEATS * HEARTBEAT_FRAMES * INTERVAL
+    assert clock.lease() == pytest.approx(heartbeats + LEASE_RTTS * max(rtts.values()))
+
+
+def test_silent_master_is_replaced_within_a_lease_and_an_election(loopback):
+    network, transports, clocks = cluster(loopback, ["p0", "p1", "p2", "p3"])
+    killed_at = network.clock.time()
+    transports[0].shutdown()
+    survivors = clocks[1:]
+    # a frame to notice the lease ran out and the latency of the UpdateMaster
+    bound = survivors[0].lease() + survivors[0].election_timeout() + INTERVAL + 0.01
+
+    def failed_over():
+        return all(clock.term == 1 and clock.get_master().get_name() == "p1" for clock in survivors)
+
+    run(network, transports[1:], survivors, killed_at + 10 * bound, failed_over)
+    assert failed_over()
+    assert network.clock.time() - killed_at <= bound
+    assert clocks[1].is_master_myself()
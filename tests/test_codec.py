@@ -0,0 +1,168 @@
+import base64
+import logging
+
+import pytest
+
+from game.clock.timebase import SimulatedClock
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.transport.codec import (CODECS, PACKET_TYPES, UNKNOWN_PLAYER_ID, BinaryCodec, CodecRegistry,
+                                  JsonCodec, PlayerTable)
+from game.transport.loopback import LoopbackNetwork, LoopbackTransport
+from game.transport.packet import (Ack, AckStart, AcquireMaster, Action, ConnectionEstab, ConnectionRequest,
+                                   EndGame, FrameSync, Nak, Packet, PeerSyncAck, PeeringCompleted, Probe,
+                                   ProbeReply, ReadyToStart, Relay, RttRow, SatDown, SyncAck, SyncReq,
+                                   UpdateLeader, UpdateMaster, Vote)
+
+PLAYERS = ["p0", "p1", "p2"]
+ME = Player("p0")
+
+# The tags every released version agrees on. New packet types are appended
+# to PACKET_TYPES, never inserted, so this only ever grows at the end.
+RELEASED_TYPES = [
+    "action", "ack", "nak", "ss_ack", "ss_nak", "peering_completed", "sync_req", "sync_ack",
+    "peer_sync_ack", "update_leader", "ready_to_start", "ack_start", "sat_down", "frame_sync",
+    "acquire_master", "update_master", "connection_req", "connection_estab", "end_game", "vote",
+    "relay", "probe", "probe_reply", "rtt_row",
+]
+
+SAMPLES = {
+    "action": Action("Q", ME),
+    "ack": Ack(ME),
+    "nak": Nak(ME),
+    "ss_ack": Packet(None, ME, "ss_ack"),
+    "ss_nak": Packet(None, ME, "ss_nak"),
+    "peering_completed": PeeringCompleted(ME),
+    "sync_req": SyncReq(3, ME),
+    "sync_ack": SyncAck({"sent": 12.5, "received": 12.52}, ME, 3),
+    "peer_sync_ack": PeerSyncAck(0.0125, ME, 3),
+    "update_leader": UpdateLeader(3, ME),
+    "ready_to_start": ReadyToStart(ME),
+    "ack_start": AckStart(ME),
+    "sat_down": SatDown("W", ME, 3),
+    "frame_sync": FrameSync(1234, ME),
+    "acquire_master": AcquireMaster(ME, 2, 0.042),
+    "update_master": UpdateMaster("p1", ME, 2, 0.042),
+    "connection_req": ConnectionRequest(ME, list(CODECS)),
+    "connection_estab": ConnectionEstab(ME, "binary"),
+    "end_game": EndGame(ME),
+    "vote": Vote("p2", ME),
+    "relay": Relay(ME, "p1", 7, ["p2"], base64.b64encode(b"B\x00inner").decode()),
+    "probe": Probe(3, ME),
+    "probe_reply": ProbeReply(12.5, 12.52, 3, ME),
+    "rtt_row": RttRow({"p1": 0.02, "p2": 0.031}, 3, ME),
+}
+
+
+def test_packet_types_are_only_ever_appended():
+    assert PACKET_TYPES[:len(RELEASED_TYPES)] == RELEASED_TYPES
+
+
+def test_every_packet_type_has_a_sample():
+    assert set(SAMPLES) == set(PACKET_TYPES)
+
+
+def stamped(packet, echo=None):
+    packet.createdAt = 1700000000.25
+    packet.echo = echo
+    return packet
+
+
+@pytest.mark.parametrize("codec_cls", CODECS.values(), ids=list(CODECS))
+@pytest.mark.parametrize("packet_type", PACKET_TYPES)
+def test_every_packet_type_survives_a_round_trip(codec_cls, packet_type):
+    codec = codec_cls(PlayerTable(PLAYERS))
+    packet = stamped(SAMPLES[packet_type], echo=[41, 1700000000.5, 1700000000.125])
+    decoded = codec.decode(codec.encode(packet, 42))
+    assert decoded.get_packet_type() == packet_type
+    assert decoded.get_data() == packet.get_data()
+    assert decoded.get_player().get_name() == "p0"
+    assert decoded.get_created_at() == packet.get_created_at()
+    assert decoded.seq == 42
+    assert decoded.echo == packet.echo
+
+
+@pytest.mark.parametrize("packet_type", PACKET_TYPES)
+def test_json_and_binary_decode_to_the_same_packet(packet_type):
+    players = PlayerTable(PLAYERS)
+    json_codec, binary_codec = JsonCodec(players), BinaryCodec(players)
+    packet = stamped(SAMPLES[packet_type])
+    via_json = json_codec.decode(json_codec.encode(packet, 5))
+    via_both = binary_codec.decode(binary_codec.encode(via_json, 5))
+    for decoded in (via_json, via_both):
+        assert decoded.get_packet_type() == packet_type
+        assert decoded.get_data() == packet.get_data()
+        assert decoded.get_player().get_name() == "p0"
+        assert decoded.get_created_at() == packet.get_created_at()
+
+
+def test_binary_header_is_smaller_than_json():
+    players = PlayerTable(PLAYERS)
+    packet = stamped(FrameSync(1234, ME))
+    assert len(BinaryCodec(players).encode(packet)) < len(JsonCodec(players).encode(packet)) / 2
+
+
+def test_player_ids_are_the_sorted_names():
+    players = PlayerTable(["p2", "p0", "p1"])
+    assert [players.get_id(name) for name in PLAYERS] == [0, 1, 2]
+    assert players.get_name(1) == "p1"
+    assert players.get_id("stranger") == UNKNOWN_PLAYER_ID
+
+
+@pytest.mark.parametrize("codec_cls", CODECS.values(), ids=list(CODECS))
+def test_decoded_packets_share_one_player_per_sender(codec_cls):
+    codec = codec_cls(PlayerTable(PLAYERS))
+    first, second = (codec.decode(codec.encode(stamped(Vote("p1", ME)))) for _ in range(2))
+    assert first.get_player() is second.get_player()
+
+
+def test_sender_missing_from_the_table_is_sent_by_name():
+    codec = BinaryCodec(PlayerTable(PLAYERS))
+    decoded = codec.decode(codec.encode(stamped(Vote("p1", Player("stranger")))))
+    assert decoded.get_player().get_name() == "stranger"
+
+
+def test_packet_type_unknown_to_the_codec_is_sent_by_name():
+    codec = BinaryCodec(PlayerTable(PLAYERS))
+    decoded = codec.decode(codec.encode(stamped(Packet({"x": 1}, ME, "from_the_future"))))
+    assert decoded.get_packet_type() == "from_the_future"
+    assert decoded.get_data() == {"x": 1}
+
+
+@pytest.mark.parametrize("preferred, offered, chosen", [
+    ("binary", ["binary", "json"], "binary"),
+    ("binary", ["json"], "json"),
+    ("json", ["binary", "json"], "json"),
+    ("binary", None, "json"),
+    ("binary", ["zstd"], "json"),
+])
+def test_registry_chooses_the_preferred_codec_both_sides_have(preferred, offered, chosen):
+    assert CodecRegistry(preferred, PlayerTable(PLAYERS)).choose(offered) == chosen
+
+
+def test_registry_decodes_whatever_codec_was_used():
+    registry = CodecRegistry("binary", PlayerTable(PLAYERS))
+    for name in CODECS:
+        data = registry.get(name).encode(stamped(Vote("p1", ME)), 3)
+        assert registry.decode(data).get_data() == "p1"
+
+
+# p1 joins last and asks p0, so p0's preference wins if p1 has its codec
+@pytest.mark.parametrize("codecs, agreed", [
+    (("binary", "binary"), "binary"),
+    (("json", "binary"), "json"),
+    (("binary", "json"), "binary"),
+])
+def test_peers_agree_on_a_codec_when_they_connect(codecs, agreed):
+    logger = logging.getLogger("tests")
+    tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(PLAYERS[:2])}
+    network = LoopbackNetwork(logger, SimulatedClock())
+    p0, p1 = (LoopbackTransport(name, network, logger, Tracker(dict(tracker_list)), codec=codec,
+                                scenario={"default": {"latency": 0.01}})
+              for name, codec in zip(PLAYERS, codecs))
+    network.clock.run(stop=lambda: p0.all_connected() and p1.all_connected())
+    assert p0._peer_codecs["p1"] == p1._peer_codecs["p0"] == agreed
+
+    p0.send(Vote("p1", ME), "p1")
+    network.clock.run()
+    assert [packet.get_data() for packet in p1.receive_many()] == ["p1"]
@@ -0,0 +1,56 @@
+import pytest
+
+from game.transport.framing import FRAME_HEADER, MAX_FRAME_SIZE, FrameDecoder, encode_frame
+
+
+def test_round_trip():
+    decoder = FrameDecoder()
+    assert decoder.feed(encode_frame(b"hello")) == [b"hello"]
+    assert decoder.pending() == 0
+
+
+def test_frame_split_across_reads():
+    data = encode_frame(b"hello world")
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(len(data)):
+        frames += decoder.feed(data[i:i + 1])
+    assert frames == [b"hello world"]
+    assert decoder.pending() == 0
+
+
+def test_frames_coalesced_into_one_read():
+    decoder = FrameDecoder()
+    data = encode_frame(b"a") + encode_frame(b"") + encode_frame(b"bc") + encode_frame(b"def")[:3]
+    assert decoder.feed(data) == [b"a", b"", b"bc"]
+    assert decoder.pending() == 3
+    assert decoder.feed(encode_frame(b"def")[3:]) == [b"def"]
+
+
+def test_too_large_frames_are_refused():
+    with pytest.raises(ValueError):
+        encode_frame(bytes(MAX_FRAME_SIZE + 1))
+    with pytest.raises(ValueError):
+        FrameDecoder().feed(FRAME_HEADER.pack(MAX_FRAME_SIZE + 1))
+
+
+class FakeSocket:
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, buffer):
+        chunk = self.chunks.pop(0) if self.chunks else b""
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def test_recv_reads_into_the_buffer_until_closed():
+    data = encode_frame(b"x" * 10) + encode_frame(b"y" * 10)
+    decoder = FrameDecoder(recv_size=8)
+    sock = FakeSocket([data[i:i + 8] for i in range(0, len(data), 8)])
+    frames = []
+    with pytest.raises(ConnectionResetError):
+        while True:
+            frames += decoder.recv(sock)
+    assert frames == [b"x" * 10, b"y" * 10]
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from game.models.player import Player
+from game.transport.inbox import Inbox
+from game.transport.packet import Vote
+
+
+def test_get_many_drains_everything_in_arrival_order():
+    inbox = Inbox()
+    for i in range(5):
+        inbox.put(i)
+    assert inbox.get_many() == [0, 1, 2, 3, 4]
+    assert len(inbox) == 0
+
+
+def test_max_n_leaves_the_rest_for_the_next_call():
+    inbox = Inbox()
+    for i in range(5):
+        inbox.put(i)
+    assert inbox.get_many(2) == [0, 1]
+    assert len(inbox) == 3
+    assert inbox.get_many(10) == [2, 3, 4]
+
+
+def test_without_a_timeout_an_empty_inbox_never_blocks():
+    assert Inbox().get_many() == []
+
+
+def test_timeout_returns_as_soon_as_a_packet_arrives():
+    inbox = Inbox()
+    threading.Timer(0.05, inbox.put, ("late",)).start()
+    start = time.monotonic()
+    assert inbox.get_many(timeout=5) == ["late"]
+    assert time.monotonic() - start < 1
+
+
+def test_timeout_runs_out_with_nothing_to_hand_over():
+    start = time.monotonic()
+    assert Inbox().get_many(timeout=0.05) == []
+    assert time.monotonic() - start >= 0.05
+
+
+def test_wakeup_ends_a_wait_with_nothing_to_hand_over():
+    inbox = Inbox()
+    threading.Timer(0.05, inbox.wakeup).start()
+    start = time.monotonic()
+    assert inbox.get_many(timeout=5) == []
+    assert time.monotonic() - start < 1
+
+
+def test_wakeup_before_the_wait_is_not_lost():
+    inbox = Inbox()
+    inbox.wakeup()
+    start = time.monotonic()
+    assert inbox.get_many(timeout=5) == []
+    assert time.monotonic() - start < 1
+
+
+def test_receive_many_hands_over_a_batch_with_receive_times(loopback):
+    network, (p0, p1) = loopback(["p0", "p1"])
+    sent_at = network.clock.time()
+    for i in range(3):
+        p0.send(Vote(f"p{i}", Player("p0")), "p1")
+    network.clock.run()
+    assert len(p1.queue) == 3
+    packets = p1.receive_many(2)
+    assert [packet.get_data() for packet in packets] == ["p0", "p1"]
+    assert all(packet.get_received_at() > sent_at for packet in packets)
+    assert p1.receive().get_data() == "p2"
+    assert p1.receive() is None
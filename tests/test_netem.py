@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from game.clock.netem import STREAM_RTO, Link, LinkProfile, NetworkEmulator
+from game.clock.timebase import SimulatedClock
+from game.lobby.tracker import Tracker
+
+LOSSY = {"latency": 0.03, "jitter": 0.02, "distribution": "normal", "loss": 0.2, "reorder": 0.1}
+
+
+def emulator(scenario, myself="alice", stream=False):
+    tracker = Tracker({name: ("127.0.0.1", i) for i, name in enumerate(["alice", "bob", "carol"])})
+    return NetworkEmulator(myself, tracker, scenario, SimulatedClock(), stream)
+
+
+def plans(netem, player_id, n=200):
+    return [netem.plan(player_id, 100) for _ in range(n)]
+
+
+def test_same_seed_same_network():
+    scenario = {"seed": 7, "default": LOSSY}
+    assert plans(emulator(scenario), "bob") == plans(emulator(scenario), "bob")
+
+
+def test_other_seed_other_network():
+    assert plans(emulator({"seed": 7, "default": LOSSY}), "bob") != \
+        plans(emulator({"seed": 8, "default": LOSSY}), "bob")
+
+
+def test_links_draw_from_their_own_generators():
+    # how much goes to carol does not change what happens to bob's packets
+    scenario = {"seed": 7, "default": LOSSY}
+    quiet, busy = emulator(scenario), emulator(scenario)
+    plans(busy, "carol")
+    assert plans(quiet, "bob") == plans(busy, "bob")
+
+
+def test_most_specific_link_wins():
+    scenario = {"seed": 1, "default": {"latency": 0.01},
+                "links": {"*->bob": {"latency": 0.04}, "alice->*": {"latency": 0.03},
+                          "alice->carol": {"latency": 0.02}}}
+    netem = emulator(scenario)
+    assert netem.get_delay("carol") == 0.02
+    assert netem.get_delay("bob") == 0.03
+    assert emulator(scenario, myself="carol").get_delay("bob") == 0.04
+    assert emulator(scenario, myself="carol").get_delay("alice") == 0.01
+
+
+def test_datagrams_are_lost_and_overtake_each_other():
+    link = Link(LinkProfile(**LOSSY), random.Random(1))
+    delays = [link.plan(100, 0.0) for _ in range(1000)]
+    assert link.lost == delays.count(None) > 0
+    # reordered packets skip the latency, as can a large negative jitter
+    assert 0 < link.reordered <= delays.count(0.0)
+
+
+def test_a_stream_delivers_everything_in_order():
+    link = Link(LinkProfile(**LOSSY), random.Random(1), stream=True)
+    arrivals = [now + link.plan(100, now) for now in (0.001 * i for i in range(1000))]
+    assert all(later >= earlier - 1e-9 for earlier, later in zip(arrivals, arrivals[1:]))
+    assert link.lost > 0 and link.reordered == 0
+
+
+def test_a_stream_retransmits_what_it_loses():
+    link = Link(LinkProfile(latency=0.01, loss=1.0), random.Random(1), stream=True)
+    delay = link.plan(100, 0.0)
+    assert delay > STREAM_RTO
+
+
+def test_rate_limit_queues_packets_behind_each_other():
+    link = Link(LinkProfile(rate=1000), random.Random(1))
+    assert [link.plan(100, 0.0) for _ in range(3)] == pytest.approx([0.1, 0.2, 0.3])
+
+
+def test_unknown_distribution_is_refused():
+    with pytest.raises(ValueError):
+        LinkProfile(distribution="cauchy")
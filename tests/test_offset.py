@@ -0,0 +1,67 @@
+import pytest
+
+from game.clock.offset import MAX_DRIFT, OffsetEstimator
+from game.models.player import Player
+from game.transport.packet import FrameSync
+
+
+def exchange(estimator, t1, offset, there, back, hold=0.001):
+    """An exchange started at t1 with a peer whose clock is offset ahead of ours."""
+    t2 = t1 + there + offset
+    t3 = t2 + hold
+    estimator.add(t1, t2, t3, t3 - offset + back)
+
+
+def test_symmetric_exchange_gives_the_exact_offset():
+    estimator = OffsetEstimator()
+    exchange(estimator, 10.0, offset=0.25, there=0.02, back=0.02)
+    assert estimator.offset() == pytest.approx(0.25)
+    assert estimator.rtt() == pytest.approx(0.04)
+    assert estimator.accuracy() == pytest.approx(0.02)
+
+
+def test_offset_comes_from_the_smallest_round_trip():
+    estimator = OffsetEstimator()
+    exchange(estimator, 10.0, offset=0.25, there=0.02, back=0.02)
+    # queued on the way back, which looks like an offset 40ms smaller
+    exchange(estimator, 10.1, offset=0.25, there=0.02, back=0.1)
+    assert estimator.offset() == pytest.approx(0.25)
+    assert estimator.rtt() == pytest.approx(0.04)
+
+
+def test_small_offsets_are_corrected():
+    estimator = OffsetEstimator()
+    assert estimator.correction() == 0.0
+    # well within the accuracy of 10ms
+    exchange(estimator, 10.0, offset=0.004, there=0.01, back=0.01)
+    assert estimator.correction(10.0) == pytest.approx(0.004)
+
+
+def test_drift_is_kept_within_max_drift():
+    estimator = OffsetEstimator()
+    # the peer's clock gains 1ms a second, twice what MAX_DRIFT allows
+    for i in range(5):
+        exchange(estimator, 10.0 + i, offset=0.001 * i, there=0.01, back=0.01)
+    assert estimator.drift == MAX_DRIFT
+
+
+def test_drift_needs_exchanges_a_while_apart():
+    estimator = OffsetEstimator()
+    for i in range(5):
+        exchange(estimator, 10.0 + 0.1 * i, offset=0.001 * i, there=0.01, back=0.01)
+    assert estimator.drift == 0.0
+
+
+def test_one_way_delay_is_moved_to_our_clock(loopback):
+    # p1's clock is 4ms ahead, less than half the 20ms round trip
+    scenario = {"default": {"latency": 0.01}, "clocks": {"p1": {"offset": 0.004}}}
+    network, (p0, p1) = loopback(["p0", "p1"], scenario)
+    delays = []
+    for frame in range(10):
+        p0.send(FrameSync(frame, Player("p0")), "p1")
+        network.clock.run()
+        p1.receive_many()
+        p1.send(FrameSync(frame, Player("p1")), "p0")
+        network.clock.run()
+        delays += [p0.sync.one_way_delay(packet) for packet in p0.receive_many()]
+    assert delays[-1] == pytest.approx(0.01)
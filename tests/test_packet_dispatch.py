@@ -0,0 +1,66 @@
+import logging
+
+from game.client import Client, packet_handler
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.transport.packet import Packet, Vote
+
+NAMES = ["p0", "p1", "p2"]
+
+
+def make_client(loopback, cls=Client):
+    _, transports = loopback(NAMES)
+    tracker = Tracker({name: ("127.0.0.1", i) for i, name in enumerate(NAMES)})
+    return cls("p0", tracker, logging.getLogger("tests"), transport=transports[0])
+
+
+def test_handlers_are_collected_by_packet_type():
+    assert Client._packet_handler_names["vote"] == "_on_vote"
+    assert Client._packet_handler_names["frame_sync"] == "_on_frame_sync"
+
+
+def test_packets_go_to_their_handler(loopback):
+    client = make_client(loopback)
+    client._handle_packet(Vote("p2", Player("p1")))
+    client._handle_packet(Vote("p2", Player("p0")))
+    assert client._votekick == {"p2": 2}
+
+
+def test_unknown_packet_types_are_ignored(loopback):
+    client = make_client(loopback)
+    client._handle_packet(Packet(None, Player("p1"), "no_such_type"))
+
+
+class RecordingClient(Client):
+
+    def __init__(self, *args, **kwargs):
+        self.handled = []
+        super().__init__(*args, **kwargs)
+
+    @packet_handler("vote")
+    def _on_vote(self, pkt: Packet):
+        self.handled.append(("vote", pkt.get_data()))
+
+    @packet_handler("chat")
+    def _on_chat(self, pkt: Packet):
+        self.handled.append(("chat", pkt.get_data()))
+
+
+def test_subclasses_override_and_add_handlers(loopback):
+    client = make_client(loopback, RecordingClient)
+    client._handle_packet(Vote("p2", Player("p1")))
+    client._handle_packet(Packet("hi", Player("p1"), "chat"))
+    assert client.handled == [("vote", "p2"), ("chat", "hi")]
+    assert client._votekick == {}
+    # the base class keeps its own table
+    assert "chat" not in Client._packet_handler_names
+
+
+def test_register_packet_handler_replaces_a_handler(loopback):
+    client = make_client(loopback)
+    handled = []
+    client.register_packet_handler("vote", handled.append)
+    packet = Vote("p2", Player("p1"))
+    client._handle_packet(packet)
+    assert handled == [packet]
+    assert client._votekick == {}
@@ -0,0 +1,74 @@
+import os
+
+from game.clock.netem import load_scenario
+from game.models.player import Player
+from game.simulation import run_game
+from game.transport.packet import EndGame, FrameSync, SatDown
+
+NAMES = ["p0", "p1", "p2", "p3", "p4", "p5"]
+SCENARIOS = os.path.join(os.path.dirname(__file__), os.pardir, "scenarios")
+
+
+def received(network, transports):
+    network.clock.run()
+    return {transport.myself: [packet.get_data() for packet in transport.receive_many()]
+            for transport in transports}
+
+
+def test_broadcasts_reach_everyone(loopback):
+    network, transports = loopback(NAMES, relay_fanout=2)
+    received(network, transports)
+    transports[0].sendall(FrameSync(7, Player("p0")))
+    assert received(network, transports[1:]) == {name: [7] for name in NAMES[1:]}
+
+
+def test_players_who_left_are_not_relays(loopback):
+    network, transports = loopback(NAMES, relay_fanout=2)
+    for transport in transports[1:4]:
+        transport.shutdown()
+    plan = transports[0].relay_plan("p0", NAMES[1:])
+    assert sorted(relay for relay, _ in plan) == ["p4", "p5"]
+    assert all(relay_to == [] for _, relay_to in plan)
+
+
+def test_relay_that_left_since_the_plan_is_skipped(loopback):
+    network, transports = loopback(NAMES, relay_fanout=2)
+    received(network, transports)
+    p0 = transports[0]
+    plan = p0.relay_plan("p0", NAMES[1:])
+    relay, relay_to = next((relay, relay_to) for relay, relay_to in plan if relay_to)
+    transports[NAMES.index(relay)].shutdown()
+    # the plan is still the one worked out before the relay left
+    assert p0.relay_plan("p0", NAMES[1:]) is plan
+    p0.sendall(FrameSync(7, Player("p0")))
+    still_here = [transport for transport in transports[1:] if transport.myself != relay]
+    assert received(network, still_here) == {transport.myself: [7] for transport in still_here}
+
+
+def test_relay_plans_are_worked_out_again_when_delays_change(loopback):
+    _, transports = loopback(NAMES, relay_fanout=2)
+    p0 = transports[0]
+    for i, player_id in enumerate(NAMES[1:]):
+        p0.sync.set_delay(player_id, 0.01 * (i + 1))
+    plan = p0.relay_plan("p0", NAMES[1:])
+    assert [relay for relay, _ in plan] == ["p1", "p2"]
+    assert p0.relay_plan("p0", NAMES[1:]) is plan
+    p0.sync.set_delay("p5", 0.001)
+    assert [relay for relay, _ in p0.relay_plan("p0", NAMES[1:])] == ["p5", "p1"]
+
+
+def test_results_are_not_relayed(loopback):
+    network, (p0, *_) = loopback(NAMES, relay_fanout=2)
+    assert p0.should_relay(FrameSync(7, Player("p0")))
+    assert not p0.should_relay(SatDown("Q", Player("p0"), 1))
+    assert not p0.should_relay(EndGame(Player("p0")))
+
+
+def test_relayed_game_ends_for_everyone():
+    # players leave as soon as they know the game is over, and used to take
+    # the end of the game with them for the players below them in the tree
+    scenario = load_scenario(os.path.join(SCENARIOS, "lossy.json"))
+    # not seed 0, where two players take the same seat, which the game's
+    # rules leave unresolved for any seat but the last
+    result = run_game(16, scenario=scenario, seed=1, timeout=600, relay_fanout=3)
+    assert result["finished"]
@@ -0,0 +1,143 @@
+import logging
+import socket
+
+import pytest
+
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.thread_manager import ThreadManager
+from game.transport.packet import Vote
+from game.transport.reliability import (ACK_HEADER, DATA_HEADER, RELIABLE_ORDERED,
+                                        RELIABLE_UNORDERED, ReliableLink, RttEstimator)
+from game.transport.udp_transport import UdpTransport
+
+
+def sent(link, delivery, n):
+    return [link.prepare(delivery, f"payload{i}".encode(), 0.0)[1] for i in range(n)]
+
+
+def test_ack_carries_everything_received_as_a_bitmap():
+    receiver = ReliableLink(1)
+    for rseq in (1, 3, 5):
+        assert receiver.received(rseq)
+    assert not receiver.received(3)
+    _, sender_id, cum, bitmap = ACK_HEADER.unpack(receiver.ack())
+    assert (sender_id, cum) == (1, 1)
+    # 3 and 5 are 2 and 4 after the cumulative ack
+    assert bitmap == 1 << 1 | 1 << 3
+
+
+def test_selective_ack_leaves_only_the_gaps_unacked():
+    sender, receiver = ReliableLink(0), ReliableLink(1)
+    rseqs = sent(sender, RELIABLE_UNORDERED, 5)
+    for rseq in (1, 3, 5):
+        receiver.received(rseq)
+    _, _, cum, bitmap = ACK_HEADER.unpack(receiver.ack())
+    assert sender.acked(cum, bitmap, 0.1) == 3
+    assert sender.pending() == 2
+    assert [sender.timed_out(rseq) is not None for rseq in rseqs] == [False, True, False, True, False]
+
+
+def test_rto_follows_rfc_6298():
+    rtt = RttEstimator(initial_rto=1.0, min_rto=0.01, max_rto=2.0)
+    rtt.sample(0.1)
+    assert (rtt.srtt, rtt.rttvar) == pytest.approx((0.1, 0.05))
+    assert rtt.rto == pytest.approx(0.1 + 4 * 0.05)
+    rtt.sample(0.2)
+    assert rtt.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert rtt.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+    assert rtt.rto == pytest.approx(rtt.srtt + 4 * rtt.rttvar)
+
+
+def test_rto_is_kept_within_bounds_and_backs_off():
+    rtt = RttEstimator(min_rto=0.02, max_rto=2.0)
+    rtt.sample(0.001)
+    assert rtt.rto == 0.02
+    assert rtt.backoff(3) == pytest.approx(0.16)
+    assert rtt.backoff(10) == 2.0
+
+
+def test_retransmitted_packets_are_no_rtt_sample():
+    link = ReliableLink(0)
+    rseq, = sent(link, RELIABLE_UNORDERED, 1)
+    link.timed_out(rseq)
+    link.acked(rseq, 0, 5.0)
+    assert link.rtt.srtt is None
+
+
+def test_ordered_payloads_are_held_until_the_gap_is_filled():
+    link = ReliableLink(0)
+    assert link.deliver_ordered(2, b"b") == []
+    assert link.deliver_ordered(3, b"c") == []
+    assert link.deliver_ordered(1, b"a") == [b"a", b"b", b"c"]
+    assert link.deliver_ordered(4, b"d") == [b"d"]
+
+
+def test_only_unordered_packets_are_given_up_on():
+    link = ReliableLink(0, max_retransmits=2)
+    unordered, = sent(link, RELIABLE_UNORDERED, 1)
+    ordered, = sent(link, RELIABLE_ORDERED, 1)
+    for _ in range(2):
+        assert link.timed_out(unordered) is not None
+    assert link.timed_out(unordered) is None
+    for _ in range(10):
+        datagram, _ = link.timed_out(ordered)
+        assert DATA_HEADER.unpack_from(datagram)[2] == RELIABLE_ORDERED
+    assert link.stats()["given_up"] == 1
+    assert link.pending() == 1
+
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+@pytest.fixture
+def udp_pair():
+    """
+    Two connected UdpTransports on localhost: udp_pair(scenario) returns
+    them.
+    """
+    transports = []
+
+    def make(scenario):
+        tracker_list = {"p0": ("127.0.0.1", free_port()), "p1": ("127.0.0.1", free_port())}
+        transports.extend(UdpTransport(name, tracker_list[name][1], ThreadManager(), logging.getLogger("tests"),
+                                       Tracker(dict(tracker_list)), scenario=scenario)
+                          for name in tracker_list)
+        for _ in range(100):
+            if all(transport.all_connected() for transport in transports):
+                break
+            for transport in transports:
+                transport.receive_many(timeout=0.01)
+        assert all(transport.all_connected() for transport in transports)
+        return transports
+
+    yield make
+    for transport in transports:
+        transport.SHUTDOWN_TIMEOUT = 0.5
+        transport.shutdown()
+
+
+def receive_until(transport, packet_type, count, timeout=5):
+    packets = []
+    for _ in range(int(timeout / 0.05)):
+        packets += [packet for packet in transport.receive_many(timeout=0.05)
+                    if packet.get_packet_type() == packet_type]
+        if len(packets) >= count:
+            break
+    return packets
+
+
+@pytest.mark.parametrize("loss", [0, 0.3])
+def test_udp_transport_delivers_ordered_packets_in_order(udp_pair, loss):
+    p0, p1 = udp_pair({"seed": 1, "default": {"latency": 0.005, "loss": loss}})
+    for i in range(20):
+        p0.send(Vote(f"p{i}", Player("p0")), "p1")
+    votes = receive_until(p1, "vote", 20)
+    assert [vote.get_data() for vote in votes] == [f"p{i}" for i in range(20)]
+    if loss:
+        assert p0.get_link_stats()["p1"]["retransmitted"] > 0
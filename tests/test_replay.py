@@ -0,0 +1,36 @@
+from game.transport.replay import ReplayWindow
+
+
+def test_new_sequence_numbers_are_accepted_once():
+    window = ReplayWindow()
+    assert all(window.check_and_update(seq) for seq in range(1, 10))
+    assert not any(window.check_and_update(seq) for seq in range(1, 10))
+    assert window.duplicates == 9
+
+
+def test_out_of_order_within_the_window():
+    window = ReplayWindow(size=8)
+    assert window.check_and_update(5)
+    assert window.check_and_update(3)
+    assert window.check_and_update(4)
+    assert not window.check_and_update(3)
+    assert window.highest == 5
+    assert window.bitmap == 0b111
+
+
+def test_too_old_is_dropped():
+    window = ReplayWindow(size=8)
+    assert window.check_and_update(20)
+    assert not window.check_and_update(12)
+    assert window.check_and_update(13)
+    assert window.too_old == 1
+    assert window.dropped() == 1
+
+
+def test_jump_past_the_window_clears_it():
+    window = ReplayWindow(size=8)
+    for seq in range(1, 5):
+        window.check_and_update(seq)
+    assert window.check_and_update(100)
+    assert window.bitmap == 1
+    assert window.check_and_update(99)
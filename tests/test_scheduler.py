@@ -0,0 +1,33 @@
+import logging
+import threading
+
+from game.clock.timebase import RealTimeClock, SkewedClock
+from game.transport.scheduler import SendScheduler
+
+
+def test_deadlines_are_read_off_the_clock():
+    # a clock well ahead of the wall clock, as a skewed player's is
+    clock = SkewedClock(RealTimeClock(), offset=1000.0)
+    scheduler = SendScheduler(logging.getLogger("tests"), clock)
+    at, later = threading.Event(), threading.Event()
+    scheduler.call_at(clock.time() + 0.01, at.set)
+    scheduler.call_later(0.01, later.set)
+    try:
+        assert at.wait(2)
+        assert later.wait(2)
+        assert scheduler.max_lateness < 1
+    finally:
+        scheduler.shutdown()
+
+
+def test_calls_run_in_deadline_order():
+    scheduler = SendScheduler(logging.getLogger("tests"))
+    calls = []
+    done = threading.Event()
+    scheduler.call_later(0.03, lambda: (calls.append(2), done.set()))
+    scheduler.call_later(0.01, lambda: calls.append(1))
+    try:
+        assert done.wait(2)
+        assert calls == [1, 2]
+    finally:
+        scheduler.shutdown()
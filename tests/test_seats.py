@@ -0,0 +1,33 @@
+import logging
+import random
+
+import pytest
+
+from game.client import Client
+from game.lobby.tracker import Tracker
+from game.simulation import BotClient
+
+
+def make_client(loopback, num_players, client_cls=Client, **kwargs):
+    names = [f"p{i}" for i in range(num_players)]
+    _, transports = loopback(names[:2])
+    tracker = Tracker({name: ("127.0.0.1", i) for i, name in enumerate(names)})
+    return client_cls("p0", tracker, logging.getLogger("tests"), transport=transports[0], **kwargs)
+
+
+def test_one_seat_fewer_than_players(loopback):
+    client = make_client(loopback, 4)
+    assert list(client._round_inputs) == ["Q", "W", "E"]
+    assert all(client.letter_to_key[seat] is not None for seat in client._round_inputs)
+
+
+def test_there_are_only_six_keys_to_sit_on(loopback):
+    with pytest.raises(IndexError):
+        make_client(loopback, 8)
+
+
+def test_bots_are_not_limited_to_the_keyboard(loopback):
+    client = make_client(loopback, 16, BotClient, rng=random.Random(0))
+    seats = list(client._round_inputs)
+    assert len(seats) == len(set(seats)) == 15
+    assert seats[:6] == ["Q", "W", "E", "R", "T", "Y"]
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from game.transport.send_queue import PeerSendQueue
+
+
+def fill(queue, n):
+    for i in range(n):
+        assert queue.put(i, "vote")
+
+
+@pytest.mark.parametrize("policy", ["block", "coalesce"])
+def test_put_never_waits_and_drops_what_has_no_room(policy):
+    queue = PeerSendQueue(2, policy)
+    fill(queue, 2)
+    assert not queue.put(2, "vote")
+    assert queue.stats()["dropped"] == 1
+    assert [queue.get(0)[1] for _ in range(2)] == [0, 1]
+
+
+def test_drop_oldest_makes_room():
+    queue = PeerSendQueue(2, "drop_oldest")
+    fill(queue, 3)
+    assert [queue.get(0)[1] for _ in range(2)] == [1, 2]
+    assert queue.stats()["dropped"] == 1
+
+
+def test_coalesce_replaces_the_queued_frame_sync_even_when_full():
+    queue = PeerSendQueue(2, "coalesce")
+    assert queue.put("old", "frame_sync")
+    assert queue.put(0, "vote")
+    assert queue.put("new", "frame_sync")
+    assert [queue.get(0) for _ in range(2)] == [("frame_sync", "new"), ("vote", 0)]
+    assert queue.stats()["coalesced"] == 1
+
+
+def test_reserve_waits_for_room_and_keeps_it():
+    queue = PeerSendQueue(1, "block")
+    fill(queue, 1)
+    reserved = threading.Event()
+    t = threading.Thread(target=lambda: queue.reserve("vote") and reserved.set())
+    t.start()
+    assert not reserved.wait(0.05)
+    queue.get(0)
+    assert reserved.wait(1)
+    t.join()
+    # the room is kept for the reserved frame, not for anyone else
+    assert not queue.put("timer", "vote")
+    assert queue.put("reserved", "vote", reserved=True)
+    assert queue.get(0) == ("vote", "reserved")
+
+
+def test_reserve_times_out_and_gives_up_on_close():
+    queue = PeerSendQueue(1, "block")
+    fill(queue, 1)
+    assert not queue.reserve("vote", timeout=0.01)
+    t = threading.Timer(0.01, queue.close)
+    t.start()
+    assert not queue.reserve("vote")
+    t.join()
+
+
+def test_reserve_never_waits_for_what_is_dropped_or_coalesced():
+    queue = PeerSendQueue(1, "coalesce")
+    fill(queue, 1)
+    assert not queue.reserve("frame_sync")
+    assert not PeerSendQueue(1, "drop_oldest").reserve("vote")
+
+
+class SteppingClock:
+    """A clock ten seconds further on every time it is read."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        self.now += 10.0
+        return self.now
+
+
+def test_timeouts_are_read_off_the_queue_clock():
+    queue = PeerSendQueue(1, "block", SteppingClock())
+    fill(queue, 1)
+    started = time.time()
+    # five seconds on the queue's clock are up by the time it is next read
+    assert not queue.reserve("vote", timeout=5)
+    assert queue.get(0) is not None and queue.get(5) is None
+    assert time.time() - started < 1
@@ -0,0 +1,42 @@
+from game.transport.session import PeerSession, RetransmitBuffer
+
+
+def buffer_of(seqs, size=256):
+    buffer = RetransmitBuffer(size)
+    for seq in seqs:
+        buffer.add(seq, f"frame{seq}".encode())
+    return buffer
+
+
+def test_everything_is_missing_if_nothing_arrived():
+    assert buffer_of([1, 2, 3]).missing(0, 0) == [b"frame1", b"frame2", b"frame3"]
+
+
+def test_frames_in_the_replay_window_are_not_sent_again():
+    # the peer got 1, 2 and 4, but not 3
+    bitmap = 1 << 0 | 1 << 2 | 1 << 3
+    assert buffer_of([1, 2, 3, 4, 5]).missing(4, bitmap) == [b"frame3", b"frame5"]
+
+
+def test_frames_older_than_the_window_are_not_sent_again():
+    assert buffer_of([1, 2, 70]).missing(69, 0) == [b"frame70"]
+
+
+def test_missing_keeps_the_order_frames_were_written_in():
+    assert buffer_of([2, 1, 3]).missing(0, 0) == [b"frame2", b"frame1", b"frame3"]
+
+
+def test_only_the_last_frames_are_kept():
+    buffer = buffer_of(range(1, 11), size=4)
+    assert len(buffer) == 4
+    assert buffer.missing(0, 0) == [b"frame7", b"frame8", b"frame9", b"frame10"]
+
+
+def test_session_measures_the_outage():
+    session = PeerSession()
+    assert session.lost(10.0)
+    assert not session.lost(11.0)
+    assert not session.is_up()
+    assert session.resumed(3, 12.5) == 2.5
+    assert session.is_up()
+    assert session.stats()["resumes"] == 1 and session.stats()["replayed"] == 3
@@ -0,0 +1,162 @@
+import logging
+
+import pytest
+
+from game.client import Client
+from game.clock.sync import DELAY_WINDOW, PROBE_SAMPLES, PROBE_WINDOW, Sync
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.transport.packet import FrameSync
+
+NAMES = ["p0", "p1", "p2"]
+
+
+def make_sync(names=NAMES):
+    tracker = Tracker({name: ("127.0.0.1", i) for i, name in enumerate(names)})
+    return Sync(names[0], tracker, logging.getLogger("tests"))
+
+
+def test_rtt_is_the_fastest_or_the_median_probe():
+    sync = make_sync()
+    for rtt in (0.05, 0.02, 0.09, 0.03, 0.04):
+        sync.add_rtt_sample("p1", rtt)
+    assert sync.get_rtt("p1") == 0.02
+    assert sync.get_rtt("p1", "median") == 0.04
+    assert sync.get_rtt("p2") is None
+
+
+def test_only_the_last_probes_count():
+    sync = make_sync()
+    sync.add_rtt_sample("p1", 0.001)
+    for _ in range(PROBE_WINDOW):
+        sync.add_rtt_sample("p1", 0.02)
+    assert sync.get_rtt("p1") == 0.02
+
+
+def test_probing_is_done_once_every_peer_replied_enough_this_round():
+    sync = make_sync()
+    for _ in range(PROBE_SAMPLES):
+        sync.add_rtt_sample("p1", 0.02, round_number=1)
+        sync.add_rtt_sample("p2", 0.02, round_number=0)
+    assert not sync.probing_done(1)
+    for _ in range(PROBE_SAMPLES):
+        sync.add_rtt_sample("p2", 0.02, round_number=1)
+    assert sync.probing_done(1)
+
+
+def test_pair_rtt_falls_back_on_the_other_players_row():
+    sync = make_sync()
+    sync.add_rtt_sample("p1", 0.02)
+    sync.update_rtt_row("p1", {"p0": 0.02, "p2": 0.06}, 1)
+    assert sync.get_pair_rtt("p2", "p1") == 0.06
+    assert sync.get_pair_rtt("p0", "p1") == 0.02
+    assert sync.get_pair_rtt("p0", "p2") is None
+    assert not sync.matrix_done(1)
+    sync.update_rtt_row("p2", {"p0": 0.1, "p1": 0.06}, 1)
+    assert sync.matrix_done(1)
+
+
+def probe_clients(loopback, scenario):
+    network, transports = loopback(NAMES, scenario)
+    tracker_list = {name: ("127.0.0.1", i) for i, name in enumerate(NAMES)}
+    clients = [Client(name, Tracker(dict(tracker_list)), logging.getLogger("tests"),
+                      transport=transport, sync_mode="probe")
+               for name, transport in zip(NAMES, transports)]
+    for client in clients:
+        client._state = "SYNCHRONIZE_CLOCK"
+    return network, clients
+
+
+def test_everyone_probes_everyone_and_shares_the_matrix(loopback):
+    # p0 and p2 are 50ms apart, everyone else 10ms
+    scenario = {"default": {"latency": 0.01},
+                "links": {"p0->p2": {"latency": 0.05}, "p2->p0": {"latency": 0.05}}}
+    network, clients = probe_clients(loopback, scenario)
+    for _ in range(200):
+        if all(client._state != "SYNCHRONIZE_CLOCK" for client in clients):
+            break
+        for client in clients:
+            if client._state == "SYNCHRONIZE_CLOCK":
+                client.sync_clock()
+        network.clock.call_later(0.01, lambda: None)
+        network.clock.run(until=network.clock.time() + 0.01)
+    assert all(client._state == "INIT" for client in clients)
+
+    for client in clients:
+        sync = client._transportLayer.sync
+        assert sync.get_pair_rtt("p0", "p2") == pytest.approx(0.1)
+        assert sync.get_pair_rtt("p1", "p2") == pytest.approx(0.02)
+        assert sync.get_pair_rtt("p1", "p0") == pytest.approx(0.02)
+    # half the round trip is the delay, the nearer player waits for the further
+    assert clients[0]._transportLayer.sync.get_wait_times() == pytest.approx({"p1": 0.04, "p2": 0.0})
+
+
+def test_echoes_only_set_delays_once_refreshing():
+    sync = make_sync()
+    # 30ms each way, on clocks that agree
+    sync.add_echo("p1", 1.0, 1.03, 1.04, 1.07)
+    assert sync.get_delay("p1") is None
+    sync.refreshing = True
+    sync.add_echo("p1", 2.0, 2.03, 2.04, 2.07)
+    assert sync.get_delay("p1") == pytest.approx(0.03)
+
+
+def test_delay_is_the_least_of_the_last_echoes():
+    sync = make_sync()
+    sync.refreshing = True
+    sync.add_echo("p1", 1.0, 1.02, 1.03, 1.05)
+    # queued on the way
+    sync.add_echo("p1", 2.0, 2.09, 2.1, 2.12)
+    assert sync.get_delay("p1") == pytest.approx(0.02)
+    for i in range(DELAY_WINDOW):
+        sync.add_echo("p1", 3.0 + i, 3.05 + i, 3.06 + i, 3.08 + i)
+    assert sync.get_delay("p1") == pytest.approx(0.05)
+
+
+def ping_pong(network, p0, p1, rounds):
+    for frame in range(rounds):
+        p0.send(FrameSync(frame, Player("p0")), "p1")
+        network.clock.run()
+        p1.receive_many()
+        p1.send(FrameSync(frame, Player("p1")), "p0")
+        network.clock.run()
+        p0.receive_many()
+
+
+def test_delays_follow_the_game_traffic(loopback):
+    network, (p0, p1) = loopback(["p0", "p1"])
+    p0.sync.refreshing = True
+    ping_pong(network, p0, p1, 3)
+    assert p0.sync.get_delay("p1") == pytest.approx(0.01)
+    # the route to p1 got slower, it shows once the fast echoes are out of the window
+    p0.netem._links["p1"].profile.latency = 0.04
+    ping_pong(network, p0, p1, DELAY_WINDOW - 1)
+    assert p0.sync.get_delay("p1") == pytest.approx(0.01)
+    ping_pong(network, p0, p1, 3)
+    assert p0.sync.get_delay("p1") == pytest.approx(0.04)
+
+
+def test_wait_times_are_kept_until_a_delay_changes():
+    sync = make_sync()
+    sync.set_delay("p1", 0.01)
+    assert sync.get_wait_times() is None
+    sync.set_delay("p2", 0.03)
+    wait_times, version = sync.get_wait_times(), sync.version
+    assert wait_times == pytest.approx({"p1": 0.02, "p2": 0.0})
+    # the same delay again changes nothing
+    sync.set_delay("p2", 0.03)
+    assert sync.get_wait_times() is wait_times and sync.version == version
+    sync.set_delay("p1", 0.02)
+    assert sync.version > version
+    assert sync.get_wait_times() == pytest.approx({"p1": 0.01, "p2": 0.0})
+
+
+def test_reset_drops_the_wait_times():
+    sync = make_sync()
+    sync.set_delay("p1", 0.01)
+    sync.set_delay("p2", 0.03)
+    version = sync.version
+    sync.reset_sync()
+    assert sync.get_wait_times() is None and sync.version > version
+    # delays measured before are still known
+    assert sync.get_delay("p2") == 0.03
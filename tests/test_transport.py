@@ -0,0 +1,226 @@
+import logging
+import socket
+import threading
+
+import pytest
+
+from game.lobby.tracker import Tracker
+from game.models.player import Player
+from game.thread_manager import ThreadManager
+from game.transport.framing import FrameDecoder
+from game.transport.packet import Vote
+from game.transport.send_queue import PeerSendQueue
+from game.transport.transport import Transport
+
+
+def free_socket():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    return s
+
+
+@pytest.fixture
+def lonely_transport():
+    """A Transport for p0 whose only peer, p1, never answers."""
+    mine, theirs = free_socket(), free_socket()
+    mine.listen(1)
+    tracker = Tracker({"p0": mine.getsockname(), "p1": theirs.getsockname()})
+    transport = Transport("p0", None, ThreadManager(), logging.getLogger("tests"), tracker,
+                          host_socket=mine, send_queue_size=4)
+    yield transport
+    transport.SHUTDOWN_TIMEOUT = 0
+    transport.shutdown()
+    theirs.close()
+
+
+def test_send_to_a_dead_player_never_stalls_the_game(lonely_transport):
+    transport = lonely_transport
+    # the connection to p1 dropped and is never coming back
+    transport._send_queue("p1")
+    transport._sessions["p1"].lost(transport.clock.time())
+    done = threading.Event()
+
+    def send_many():
+        for i in range(3 * transport.send_queue_size):
+            transport.send(Vote("p2", Player("p0")), "p1")
+        done.set()
+
+    threading.Thread(target=send_many, daemon=True).start()
+    assert done.wait(3 * transport.send_queue_size * transport.RESERVE_TIMEOUT + 5)
+    assert transport.get_send_queue_stats()["p1"]["dropped"] > 0
+
+
+def lose_connection(transport, player_id):
+    """Connect the transport to the player over a socket pair and drop it."""
+    conn, other_end = socket.socketpair()
+    transport._send_queue(player_id)
+    transport._connection_pool[player_id] = conn
+    other_end.close()
+    transport._connection_lost(player_id, conn)
+
+
+def wait_for_loss(transport, timeout):
+    packets = transport.receive_many(timeout=timeout)
+    return [packet.get_player().get_name() for packet in packets
+            if packet.get_packet_type() == "player_lost"]
+
+
+def test_dialler_gives_up_after_its_attempts(lonely_transport):
+    transport = lonely_transport
+    transport.RECONNECT_ATTEMPTS = 2
+    lose_connection(transport, "p1")
+    queue = transport._send_queues["p1"]
+    assert wait_for_loss(transport, 5) == ["p1"]
+    assert "p1" not in transport._sessions and "p1" not in transport._connection_pool
+    assert not queue.put((1, b"frame"), "vote")
+    assert not transport.is_reachable("p1")
+
+
+def test_player_who_is_dialled_gives_up_as_late_as_the_dialler(lonely_transport):
+    transport = lonely_transport
+    transport.CONNECT_TIMEOUT = 0.05
+    transport.RECONNECT_ATTEMPTS = 2
+    # p1 would be the one to dial us back
+    transport.should_dial = lambda player_id: False
+    lose_connection(transport, "p1")
+    lost_at = transport._sessions["p1"].lost_at
+    assert wait_for_loss(transport, 5) == ["p1"]
+    assert transport.clock.time() - lost_at >= transport.reconnect_timeout()
+    assert "p1" not in transport._sessions
+
+
+def test_packets_to_a_player_are_never_reordered(lonely_transport):
+    transport = lonely_transport
+    conn, other_end = socket.socketpair()
+    transport._send_queue("p1")
+    transport._connection_pool["p1"] = conn
+    # a broadcast held back for p1's sync wait, then packets with none
+    transport.sync.get_wait_times = lambda: {"p1": 0.3}
+    transport.sendall(Vote("first", Player("p0")))
+    transport.sendall(Vote("second", Player("p0")), use_sync=False)
+    transport.send(Vote("third", Player("p0")), "p1")
+
+    decoder, votes = FrameDecoder(), []
+    other_end.settimeout(5)
+    while len(votes) < 3:
+        votes += [transport.codecs.decode(frame) for frame in decoder.recv(other_end)]
+    assert [vote.get_data() for vote in votes] == ["first", "second", "third"]
+    assert [vote.get_seq() for vote in votes] == sorted(vote.get_seq() for vote in votes)
+    other_end.close()
+
+
+@pytest.fixture
+def mesh():
+    """
+    mesh(names, late=()) starts a Transport for every player, those in late
+    only once the others have started dialling them.
+    """
+    transports, sockets = [], []
+
+    def make(names, late=()):
+        sockets.extend(free_socket() for _ in names)
+        tracker_list = {name: s.getsockname() for name, s in zip(names, sockets)}
+
+        def start(name, s):
+            s.listen(len(names))
+            transports.append(Transport(name, None, ThreadManager(), logging.getLogger("tests"),
+                                        Tracker(dict(tracker_list)), host_socket=s))
+
+        for name, s in zip(names, sockets):
+            if name not in late:
+                start(name, s)
+        # let the early players fail to reach the late ones and back off
+        threading.Event().wait(0.2)
+        for name, s in zip(names, sockets):
+            if name in late:
+                start(name, s)
+        return transports
+
+    yield make
+    for transport in transports:
+        transport.SHUTDOWN_TIMEOUT = 0
+        transport.shutdown()
+    for s in sockets:
+        s.close()
+
+
+def test_one_of_each_pair_dials(loopback):
+    _, transports = loopback(["p0", "p1", "p2"])
+    for a in transports:
+        for b in transports:
+            if a is not b:
+                assert a.should_dial(b.myself) != b.should_dial(a.myself)
+
+
+def test_ready_waits_for_every_player(lonely_transport):
+    assert not lonely_transport.wait_until_connected(0.1)
+    assert not lonely_transport.ready.is_set()
+
+
+def test_players_connect_to_each_other_once(mesh):
+    transports = mesh(["p0", "p1", "p2", "p3"], late=["p1", "p3"])
+    assert all(transport.wait_until_connected(10) for transport in transports)
+    by_name = {transport.myself: transport for transport in transports}
+    for transport in transports:
+        assert sorted(transport._connection_pool) == sorted(set(by_name) - {transport.myself})
+        for player_id, conn in transport._connection_pool.items():
+            # both ends of the one socket between them
+            theirs = by_name[player_id]._connection_pool[transport.myself]
+            assert conn.getpeername() == theirs.getsockname()
+
+
+def queued(*packet_types):
+    queue = PeerSendQueue()
+    for seq, packet_type in enumerate(packet_types):
+        queue.put((seq, bytes(100)), packet_type)
+    return queue
+
+
+def test_without_a_window_every_frame_is_written_alone(lonely_transport):
+    queue = queued("vote", "vote")
+    assert len(lonely_transport._take_batch(queue)) == 1
+
+
+def test_window_takes_frames_queued_up_within_it(lonely_transport):
+    transport = lonely_transport
+    transport.batch_window = 0.2
+    queue = queued("vote", "vote")
+    threading.Timer(0.02, queue.put, ((2, bytes(100)), "vote")).start()
+    assert [seq for seq, _ in transport._take_batch(queue)] == [0, 1, 2]
+
+
+def test_batch_is_written_once_it_is_batch_size(lonely_transport):
+    transport = lonely_transport
+    transport.batch_window, transport.batch_size = 5, 250
+    assert len(transport._take_batch(queued("vote", "vote", "vote", "vote"))) == 3
+
+
+def test_actions_are_never_held_back(lonely_transport):
+    transport = lonely_transport
+    transport.batch_window = 5
+    queue = queued("action", "vote", "action", "vote")
+    assert [seq for seq, _ in transport._take_batch(queue)] == [0]
+    assert [seq for seq, _ in transport._take_batch(queue)] == [1, 2]
+
+
+def test_a_burst_goes_out_in_fewer_writes(lonely_transport):
+    transport = lonely_transport
+    transport.batch_window = 0.05
+    conn, other_end = socket.socketpair()
+    transport._send_queue("p1")
+    transport._connection_pool["p1"] = conn
+    for i in range(5):
+        transport.send(Vote(f"p{i}", Player("p0")), "p1")
+
+    decoder, frames = FrameDecoder(), []
+    other_end.settimeout(5)
+    while len(frames) < 5:
+        frames += decoder.recv(other_end)
+    # the write is counted once it is done, which may be after we read it
+    session = transport._sessions["p1"]
+    for _ in range(100):
+        if session.stats()["frames"] == 5:
+            break
+        threading.Event().wait(0.01)
+    assert session.stats()["frames"] == 5 and session.stats()["writes"] < 5
+    other_end.close()